@@ -0,0 +1,175 @@
+import csv
+import json
+import os
+import threading
+import time
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+from utils import setup_logging
+from config import Config
+
+logger = setup_logging()
+
+# 内置地址标签：地址 -> (类别, 名称)
+BUILTIN_LABELS: Dict[str, Tuple[str, str]] = {
+    # Raydium 相关地址
+    '675kPX9MHTjS2zt1qfr1NYHuzeLXfQM9H24wFSUt1Mp8': ('dex', 'RaydiumProtocolv2'),
+    '58oQChx4yWmvKdwLLZzBi4ChoCc2fqCUWBkwMihLYQo2': ('dex', 'RaydiumLiquidityPool'),
+    '5Q544fKrFoe6tsEbD7S8EmxGTJYAKtTVhAW5Q5pge4j1': ('dex', 'RaydiumAuthorityV4'),
+
+    # Pump 相关地址
+    'PumpbondingCurveAuthority11111111111111111': ('pump', 'PumpBondingCurve'),
+    'PumpFeeAccount111111111111111111111111111': ('pump', 'PumpFeeAccount'),
+    '6EF8rrecthR5Dkzon8Nwu78hRvfCKubJ14M5uBEwF6P': ('pump', 'PumpProgram'),
+    'CebN5WGQ4jvEPvsVU4EoHEpgzq1VV7AbicfhtW4xC9iM': ('pump', 'PumpFeeRecipient'),
+
+    # JitoTip 相关地址
+    'JitoTipAccount11111111111111111111111111111': ('jito', 'JitoTipAccount'),
+    '96gYZGLnJYVFmbjzopPSU6QiEV5fGqZNyN9nmNhvrZU5': ('jito', 'JitoTip1'),
+    'HFqU5x63VTqvQss8hp11i4wVV8bD44PvwucfZ2bU7gRe': ('jito', 'JitoTip2'),
+    'Cw8CFyM9FkoMi7K7Crf6HNQqf4uEMzpKw6QNghXLvLkY': ('jito', 'JitoTip3'),
+    'ADaUMid9yfUytqMBgopwjb2DTLSokTSzL1zt6iGPaS49': ('jito', 'JitoTip4'),
+    'DfXygSm4jCyNCybVYYK6DwvWqjKee8pbDmJGcLWNDXjh': ('jito', 'JitoTip5'),
+    'ADuUkR4vqLUMWXxW9gh6D6L8pMSawimctcNZ5pGwDcEt': ('jito', 'JitoTip6'),
+    'DttWaMuVvTiduZRnguLF7jNxTgiMBZ1hyAumKUiL2KRL': ('jito', 'JitoTip7'),
+    '3AVi9Tg9Uo68tJfuvoKvqKNWKkC5wPdSSdeBnizKZ6jT': ('jito', 'JitoTip8'),
+}
+
+# FILTER_ADDRESSES 中地址的类别
+FILTER_CATEGORY = 'filter'
+
+def _split(value: str) -> List[str]:
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class AddressRegistry:
+    """地址标签索引，启动时构建一次，按地址 O(1) 查询类别和名称
+
+    合并内置协议地址、FILTER_ADDRESSES 以及 ADDRESS_LABEL_FILES 中的标签文件
+    （交易所热钱包、DEX 池子、Jito 小费账户等）。标签文件支持：
+    - JSON：{"地址": "类别"}、{"地址": {"category": ..., "name": ...}}
+      或 [{"address": ..., "category": ..., "name": ...}]
+    - CSV：address,category,name 三列（可带表头），缺少类别时以文件名作为类别
+
+    标签文件修改后，最多 ADDRESS_LABELS_RELOAD_INTERVAL 秒内自动重新加载。
+    """
+
+    def __init__(self, label_files: Optional[List[str]] = None, filter_addresses: Optional[List[str]] = None,
+                 filter_categories: Optional[Set[str]] = None, reload_interval: Optional[float] = None):
+        self.label_files = _split(Config.ADDRESS_LABEL_FILES) if label_files is None else label_files
+        self.filter_addresses = Config.FILTER_ADDRESSES if filter_addresses is None else filter_addresses
+        # 只作用于标签文件中的地址，为空表示标签文件中的地址全部过滤；内置地址和 FILTER_ADDRESSES 始终过滤
+        self.filter_categories = set(_split(Config.FILTER_CATEGORIES)) if filter_categories is None else filter_categories
+        self.reload_interval = Config.ADDRESS_LABELS_RELOAD_INTERVAL if reload_interval is None else reload_interval
+        self._labels: Dict[str, Tuple[str, str]] = {}
+        self._filtered: FrozenSet[str] = frozenset()
+        self._mtimes: Dict[str, float] = {}
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def __len__(self) -> int:
+        return len(self._labels)
+
+    def reload(self):
+        """重新构建索引，构建完成后一次性替换，查询方不需要加锁"""
+        labels = dict(BUILTIN_LABELS)
+        for address in self.filter_addresses:
+            labels.setdefault(address, (FILTER_CATEGORY, address))
+        always_filtered = set(labels)
+
+        mtimes = {}
+        loaded_labels: Dict[str, Tuple[str, str]] = {}
+        for path in self.label_files:
+            try:
+                mtimes[path] = os.path.getmtime(path)
+                loaded = self._load_file(path)
+            except (OSError, ValueError) as e:
+                logger.error(f"加载地址标签文件 {path} 失败: {str(e)}")
+                continue
+            loaded_labels.update(loaded)
+            logger.info(f"已从 {path} 加载 {len(loaded)} 个地址标签")
+
+        labels.update(loaded_labels)
+        filtered = frozenset(always_filtered.union(
+            address for address, (category, _) in loaded_labels.items()
+            if not self.filter_categories or category in self.filter_categories
+        ))
+        self._labels, self._filtered, self._mtimes = labels, filtered, mtimes
+        self._next_check = time.monotonic() + self.reload_interval
+        logger.debug(f"地址标签索引: {len(labels)} 个地址，其中 {len(filtered)} 个需要过滤")
+
+    def _load_file(self, path: str) -> Dict[str, Tuple[str, str]]:
+        default_category = os.path.splitext(os.path.basename(path))[0]
+        labels: Dict[str, Tuple[str, str]] = {}
+        if path.lower().endswith('.json'):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            items = data.items() if isinstance(data, dict) else ((item.get('address'), item) for item in data)
+            for address, value in items:
+                if not address:
+                    continue
+                if isinstance(value, dict):
+                    labels[address] = (value.get('category') or default_category, value.get('name') or address)
+                else:
+                    labels[address] = (value or default_category, address)
+            return labels
+
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            for row in csv.reader(f):
+                if not row or not row[0].strip() or row[0].startswith('#') or row[0].strip() == 'address':
+                    continue
+                address = row[0].strip()
+                category = row[1].strip() if len(row) > 1 and row[1].strip() else default_category
+                name = row[2].strip() if len(row) > 2 and row[2].strip() else address
+                labels[address] = (category, name)
+        return labels
+
+    def _maybe_reload(self):
+        """到达检查间隔时比较标签文件的修改时间，有变化则重新加载"""
+        if not self.label_files or not self.reload_interval or time.monotonic() < self._next_check:
+            return
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = time.monotonic() + self.reload_interval
+            for path in self.label_files:
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    mtime = None
+                if mtime != self._mtimes.get(path):
+                    logger.info(f"地址标签文件 {path} 已修改，重新加载")
+                    self.reload()
+                    return
+        finally:
+            self._lock.release()
+
+    def is_filtered(self, address: Optional[str]) -> bool:
+        """地址是否属于需要过滤的类别"""
+        self._maybe_reload()
+        return address in self._filtered
+
+    def label(self, address: str) -> Optional[Tuple[str, str]]:
+        """返回地址的 (类别, 名称)，没有标签时返回 None"""
+        self._maybe_reload()
+        return self._labels.get(address)
+
+    def category(self, address: str) -> Optional[str]:
+        label = self.label(address)
+        return label[0] if label else None
+
+    def addresses(self, category: str) -> FrozenSet[str]:
+        """某个类别下的全部地址"""
+        return frozenset(address for address, (tag, _) in self._labels.items() if tag == category)
+
+
+_default_registry: Optional[AddressRegistry] = None
+_default_lock = threading.Lock()
+
+def get_default_registry() -> AddressRegistry:
+    """进程内共享的地址标签索引"""
+    global _default_registry
+    with _default_lock:
+        if _default_registry is None:
+            _default_registry = AddressRegistry()
+        return _default_registry
@@ -7,5 +7,5 @@ WALLET_ADDRESSES = [
 # 要追踪的代币合约地址列表
 TOKEN_ADDRESSES = [
     "2Tr3i2qjSPUb7e7BSFWTq7gsRzJEnYBKc7wRAYu3pump",
-    # 可以添加更多代币地址
+    # 可以添加更多代币地址，"SOL" 表示追踪原生 SOL 转账
 ] 
\ No newline at end of file
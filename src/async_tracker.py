@@ -0,0 +1,445 @@
+import asyncio
+import json
+import logging
+import time
+import aiohttp
+from typing import Any, Callable, List, Dict, Optional, Set, Tuple
+from urllib.parse import urlparse
+from utils import json_loads, setup_logging
+from config import Config
+from tracker import SIGNATURE_PAGE_LIMIT, SignaturePager, SignatureWindow, WalletTracker
+from rpc_client import (Endpoint, RetryPlan, RetryableRpcError, RpcClient, build_batch_payload, build_headers,
+                        build_payload, build_proxies, check_response)
+from tx_store import SignatureRecord, TransactionStore
+from transfer_db import TransferDB
+from address_registry import AddressRegistry
+from output import to_dataframe
+
+logger = setup_logging()
+
+class AiohttpTransport:
+    """基于 aiohttp 连接池的 HTTP 传输
+
+    异步追踪器只通过 post 发送请求，测试和回放时可以换成接口相同的其他实现（见 replay.AsyncReplayTransport）。
+    """
+
+    def __init__(self, max_connections: Optional[int] = None, headers: Optional[Dict[str, str]] = None,
+                 timeout: Optional[float] = None, proxies: Optional[Dict[str, str]] = None):
+        self.max_connections = max_connections or Config.MAX_CONCURRENT_REQUESTS
+        self.headers = headers if headers is not None else build_headers()
+        self.timeout = timeout or Config.RPC_TIMEOUT
+        self.proxies = proxies if proxies is not None else build_proxies()
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def open(self):
+        """创建共享的 HTTP 连接池"""
+        if self._session is not None:
+            return
+        self._session = aiohttp.ClientSession(
+            headers=self.headers,
+            connector=aiohttp.TCPConnector(limit=self.max_connections),
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+
+    async def close(self):
+        """关闭连接池"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def proxy(self, url: str) -> Optional[str]:
+        """aiohttp 每个请求只接受一个代理，按地址的协议选择（ws/wss 对应 http/https）"""
+        if not self.proxies:
+            return None
+        scheme = urlparse(url).scheme
+        return self.proxies.get({'ws': 'http', 'wss': 'https'}.get(scheme, scheme))
+
+    async def post(self, url: str, payload) -> Tuple[int, Dict, Optional[Any], Optional[int]]:
+        """发送一次 HTTP 请求，返回状态码、响应头、响应体和响应字节数；错误状态码不读取响应体"""
+        await self.open()
+        async with self._session.post(url, json=payload, proxy=self.proxy(url)) as response:
+            if response.status >= 400:
+                return response.status, dict(response.headers), None, None
+            body = await response.read()
+            return response.status, dict(response.headers), json_loads(body), len(body)
+
+    def ws_connect(self, url: str, **kwargs):
+        """在同一个连接池上建立 WebSocket 连接"""
+        return self._session.ws_connect(url, proxy=self.proxy(url), **kwargs)
+
+
+class AsyncRpcClient:
+    """RpcClient 的异步版本
+
+    节点选择、限速、重试和对冲策略以及健康统计和指标都沿用同步客户端（client），
+    这里只把请求换成通过 transport 异步发送，并用信号量限制同时在途的请求数。
+    """
+
+    def __init__(self, client: RpcClient, transport=None, max_concurrency: Optional[int] = None):
+        self.client = client
+        self.max_concurrency = max_concurrency or Config.MAX_CONCURRENT_REQUESTS
+        self.transport = transport or AiohttpTransport(self.max_concurrency, timeout=client.timeout)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def open(self):
+        """打开传输层的连接池"""
+        await self.transport.open()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def close(self):
+        """关闭传输层的连接池"""
+        await self.transport.close()
+        self._semaphore = None
+
+    async def call(self, method: str, params: List) -> Dict:
+        """发送单个 RPC 请求，返回完整的 JSON-RPC 响应"""
+        logger.debug(f"发送 RPC 请求: {method}")
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug(f"请求参数: {json.dumps(params, indent=2)}")
+        result = await self._post(build_payload(method, params))
+        if debug:
+            logger.debug(f"RPC 响应: {json.dumps(result, indent=2)}")
+        return result
+
+    async def batch(self, method: str, params_list: List[List]) -> List[Dict]:
+        """把多个同方法调用合并为一个 JSON-RPC 批量请求，id 为调用在列表中的位置"""
+        logger.debug(f"发送批量 RPC 请求: {method} x {len(params_list)}")
+        return await self._post(build_batch_payload(method, params_list))
+
+    async def _send(self, endpoint: Endpoint, payload, started: Optional[asyncio.Event] = None):
+        """在并发限制内向指定节点发送一次请求并记录结果，请求真正发出时设置 started"""
+        wait = self.client.reserve(endpoint, payload)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        start = None
+        size = None
+        try:
+            async with self._semaphore:
+                if started is not None:
+                    started.set()
+                start = time.monotonic()
+                status, headers, data, size = await self.transport.post(endpoint.url, payload)
+            check_response(status, headers, data)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            self.client.record_result(endpoint, payload, None, False)
+            raise RetryableRpcError(str(e) or type(e).__name__) from e
+        except Exception:
+            self.client.record_result(endpoint, payload, None if start is None else time.monotonic() - start,
+                                      False, size)
+            raise
+        self.client.record_result(endpoint, payload, time.monotonic() - start, True, size)
+        return data
+
+    async def _send_hedged(self, endpoint: Endpoint, payload):
+        """超过 hedge_delay 仍未返回时，在另一个节点上发送副本，取先成功的结果"""
+        if not self.client.hedging:
+            return await self._send(endpoint, payload)
+
+        hedge_delay = self.client.hedge_delay
+        started = asyncio.Event()
+        primary = asyncio.ensure_future(self._send(endpoint, payload, started))
+        # 在限速器和并发限制上排队的时间不计入，对冲计时从请求真正发出时开始
+        waiter = asyncio.ensure_future(started.wait())
+        await asyncio.wait({primary, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+        if done:
+            return primary.result()
+
+        backup_endpoint = self.client.select_endpoint(exclude={endpoint.url})
+        # 备用节点没有额度或没有空闲的并发名额时副本只会继续排队，不发送
+        if backup_endpoint is None or not backup_endpoint.limiter.ready() or self._semaphore.locked():
+            return await primary
+        logger.debug(f"节点 {endpoint.url} 超过 {hedge_delay} 秒未响应，向 {backup_endpoint.url} 发送副本")
+        pending = {primary, asyncio.ensure_future(self._send(backup_endpoint, payload))}
+        last_error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise last_error
+
+    async def _post(self, payload):
+        """发送请求，失败时按与同步客户端相同的 RetryPlan 换节点或退避后重试"""
+        await self.open()
+        plan = RetryPlan(self.client)
+        while True:
+            endpoint = plan.endpoint()
+            try:
+                return await self._send_hedged(endpoint, payload)
+            except RetryableRpcError as e:
+                delay = plan.failed(endpoint, e)
+            if delay:
+                await asyncio.sleep(delay)
+
+
+class AsyncWalletTracker:
+    """基于 asyncio 的钱包追踪器，所有请求共用一个连接池，并限制同时在途的请求数
+
+    状态以及不发送请求的逻辑（签名游标、本地存储、转账解析）由组合的同步追踪器 core 提供，
+    这里只负责异步发送请求；HTTP 请求通过 transport 发送，默认为 AiohttpTransport。
+    读写 SQLite（本地存储、签名游标、转账数据库）会阻塞，都放到线程中执行，不影响其他钱包的请求。
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None, store: Optional[TransactionStore] = None,
+                 transfer_db: Optional[TransferDB] = None, client: Optional[RpcClient] = None,
+                 registry: Optional[AddressRegistry] = None, transport=None):
+        self.core = WalletTracker(store=store, client=client, registry=registry, transfer_db=transfer_db)
+        self.rpc = AsyncRpcClient(self.core.client, transport, max_concurrency)
+        self.transport = self.rpc.transport
+        self.metrics = self.core.metrics
+
+    @property
+    def commitment(self) -> Optional[str]:
+        """查询使用的确认级别，与 core 共用"""
+        return self.core.commitment
+
+    @commitment.setter
+    def commitment(self, value: Optional[str]):
+        self.core.commitment = value
+
+    @property
+    def failed_signatures(self) -> Set[str]:
+        """重试后仍未能获取的签名"""
+        return self.core.failed_signatures
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        """打开连接池"""
+        await self.rpc.open()
+
+    async def close(self):
+        """关闭连接池"""
+        await self.rpc.close()
+
+    async def _make_rpc_request(self, method: str, params: List) -> Dict:
+        """发送 RPC 请求到 Solana 节点"""
+        try:
+            return await self.rpc.call(method, params)
+        except Exception as e:
+            logger.error(f"RPC 请求失败: {str(e)}")
+            raise
+
+    async def _batch_rpc_requests(self, method: str, params_list: List[List]) -> List[Dict]:
+        """批量发送 RPC 请求"""
+        try:
+            return await self.rpc.batch(method, params_list)
+        except Exception as e:
+            logger.error(f"批量 RPC 请求失败: {str(e)}")
+            raise
+
+    async def fetch_signature_page(self, address: str, before: Optional[str] = None,
+                                    until: Optional[str] = None,
+                                    limit: int = SIGNATURE_PAGE_LIMIT) -> List[SignatureRecord]:
+        """获取一页签名记录（从新到旧）"""
+        with self.metrics.stage('signatures'):
+            result = await self._make_rpc_request("getSignaturesForAddress",
+                                                  self.core.signature_page_params(address, before, until, limit))
+        return self.core.signature_page_result(result)
+
+    async def paginate_signatures(self, address: str, before: Optional[str] = None, until: Optional[str] = None,
+                                   max_count: Optional[int] = None,
+                                   on_page: Optional[Callable[[List[str]], None]] = None,
+                                   window: Optional[SignatureWindow] = None) -> Tuple[List[SignatureRecord], str]:
+        """沿 before 游标分页，每取到一页就把窗口内的签名通过 on_page 交给调用方，使交易获取与分页并行"""
+        pager = SignaturePager(before, until, max_count, window)
+        while pager.status is None:
+            page = await self.fetch_signature_page(address, **pager.next_page())
+            pager.add(page)
+            if on_page and page:
+                on_page(self.core.filter_signatures(page, window))
+        return pager.items, pager.status
+
+    async def _get_transaction_signatures(self, wallet_address: str,
+                                          on_page: Optional[Callable[[List[str]], None]] = None,
+                                          window: Optional[SignatureWindow] = None) -> List[str]:
+        """获取地址的交易签名列表（从新到旧，最多 MAX_TRANSACTIONS 条），只返回窗口内的签名"""
+        max_count = Config.MAX_TRANSACTIONS
+        if self.core.store is None:
+            try:
+                items, _ = await self.paginate_signatures(wallet_address, max_count=max_count, on_page=on_page,
+                                                           window=window)
+                return self.core.filter_signatures(items, window)
+            except Exception as e:
+                logger.error(f"获取交易签名失败: {str(e)}")
+                return []
+
+        try:
+            await self._update_newer_signatures(wallet_address, max_count, on_page, window)
+            await self._backfill_older_signatures(wallet_address, max_count, on_page, window)
+        except Exception as e:
+            logger.error(f"获取交易签名失败: {str(e)}")
+
+        return await asyncio.to_thread(self.core.stored_signatures, wallet_address, max_count, window)
+
+    async def _update_newer_signatures(self, wallet_address: str, max_count: int,
+                                       on_page: Optional[Callable[[List[str]], None]] = None,
+                                       window: Optional[SignatureWindow] = None):
+        """获取高水位之后的新签名"""
+        until = await asyncio.to_thread(self.core.newest_stored_signature, wallet_address)
+        if not until:
+            return
+        newer, status = await self.paginate_signatures(
+            wallet_address, until=until, max_count=max_count, on_page=on_page, window=window
+        )
+        await asyncio.to_thread(self.core.save_newer_signatures, wallet_address, newer, status)
+
+    async def _backfill_older_signatures(self, wallet_address: str, max_count: int,
+                                         on_page: Optional[Callable[[List[str]], None]] = None,
+                                         window: Optional[SignatureWindow] = None):
+        """首次扫描或历史未扫完时，沿最旧签名继续向前分页"""
+        plan = await asyncio.to_thread(self.core.backfill_plan, wallet_address, max_count)
+        if plan is None:
+            return
+        before, remaining, has_newest = plan
+        older, status = await self.paginate_signatures(
+            wallet_address, before=before, max_count=remaining, on_page=on_page, window=window
+        )
+        await asyncio.to_thread(self.core.save_older_signatures, wallet_address, older, status, has_newest)
+
+    async def _get_single_transaction(self, signature: str, params: List) -> Optional[Dict]:
+        """单独获取一笔交易，用于批量请求失败后的重试"""
+        try:
+            return self.core.single_transaction_result(
+                signature, await self._make_rpc_request("getTransaction", params))
+        except Exception as e:
+            logger.error(f"获取交易 {signature} 详情失败: {str(e)}")
+        return None
+
+    async def _fetch_transactions(self, signatures: List[str]) -> Dict[str, Dict]:
+        """从节点获取交易，整批签名合并为一个 JSON-RPC 批量请求"""
+        if not signatures:
+            return {}
+
+        params_list = [self.core.build_transaction_params(signature) for signature in signatures]
+
+        results: List[Optional[Dict]] = [None] * len(signatures)
+        try:
+            responses = await self._batch_rpc_requests("getTransaction", params_list)
+            results = self.core.match_batch_responses(signatures, responses)
+        except Exception as e:
+            logger.error(f"批量获取交易详情失败: {str(e)}")
+
+        # 只对失败或返回空数据的签名单独重试，重试请求同样并发执行
+        missing = [index for index, txn in enumerate(results) if txn is None]
+        retried = await asyncio.gather(*(self._get_single_transaction(signatures[index], params_list[index])
+                                         for index in missing))
+        for index, txn in zip(missing, retried):
+            results[index] = txn
+
+        return self.core.collect_fetched(signatures, results)
+
+    async def get_parsed_transactions(self, signatures: List[str]) -> List[Dict]:
+        """获取交易的详细信息，优先读取本地存储，只向节点请求缺失的部分"""
+        if not signatures:
+            return []
+
+        with self.metrics.stage('fetch'):
+            transactions = await asyncio.to_thread(self.core.load_stored_transactions, signatures)
+            missing = [signature for signature in signatures if signature not in transactions]
+            if missing:
+                fetched = await self._fetch_transactions(missing)
+                await asyncio.to_thread(self.core.add_fetched, transactions, fetched)
+
+        return [transactions[signature] for signature in signatures if signature in transactions]
+
+    async def resolve_token_accounts(self, txns: List[Dict], token_addresses: Set[str]):
+        """收集一批交易中无法从余额记录得到 owner 的代币账户，批量查询后缓存"""
+        candidates = self.core.unresolved_token_accounts(txns, token_addresses)
+        resolver = self.core.owner_resolver
+        pending = await asyncio.to_thread(resolver.unknown, candidates) if candidates else []
+        if not pending:
+            return
+        try:
+            logger.debug(f"通过 getMultipleAccounts 查询 {len(pending)} 个代币账户的 owner")
+            with self.metrics.stage('owners'):
+                responses = await self._batch_rpc_requests("getMultipleAccounts", resolver.request_params(pending))
+                await asyncio.to_thread(resolver.record, pending, responses)
+        except Exception as e:
+            logger.error(f"查询代币账户 owner 失败: {str(e)}")
+
+    async def save_transfers(self, transfers: List[Dict]):
+        """在线程中把转账记录写入本地转账数据库"""
+        if transfers and self.core.transfer_db is not None:
+            await asyncio.to_thread(self.core.save_transfers, transfers)
+
+    async def _collect_batch_transfers(self, sig_batch: List[str], wallet_address: str, token_addresses: Set[str],
+                                       on_transfer: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+        """获取一批交易并解析其中所有目标代币的转账记录"""
+        transfers = []
+        try:
+            txns = await self.get_parsed_transactions(sig_batch)
+            await self.resolve_token_accounts(txns, token_addresses)
+            transfers = self.core.extract_transfers(txns, wallet_address, token_addresses)
+        except Exception as e:
+            logger.error(f"处理交易批次失败: {str(e)}")
+        await self.save_transfers(transfers)
+        if on_transfer:
+            for transfer in transfers:
+                on_transfer(transfer)
+        return transfers
+
+    async def get_token_transfers(self, wallet_address: str, token_address: str,
+                                  on_transfer: Optional[Callable[[Dict], None]] = None,
+                                  start_time: Optional[int] = None, end_time: Optional[int] = None,
+                                  skip_failed: bool = False) -> List[Dict]:
+        """获取指定钱包和代币的转账记录"""
+        return (await self.get_token_transfers_multi(
+            wallet_address, [token_address], on_transfer, start_time, end_time, skip_failed
+        ))[token_address]
+
+    async def get_token_transfers_df(self, wallet_address: str, token_address: str):
+        """获取指定钱包和代币的转账记录，以 pandas DataFrame 返回"""
+        return to_dataframe(await self.get_token_transfers(wallet_address, token_address))
+
+    async def get_token_transfers_multi(self, wallet_address: str, token_addresses: List[str],
+                                        on_transfer: Optional[Callable[[Dict], None]] = None,
+                                        start_time: Optional[int] = None, end_time: Optional[int] = None,
+                                        skip_failed: bool = False) -> Dict[str, List[Dict]]:
+        """一次遍历钱包的交易历史获取多个代币的转账记录，签名分页与各批次交易获取并发进行
+
+        start_time / end_time（Unix 秒）和 skip_failed 在获取交易之前按签名记录过滤。
+        """
+        tokens = set(token_addresses)
+        window = SignatureWindow(start_time, end_time, skip_failed)
+        transfers: Dict[str, List[Dict]] = {token: [] for token in token_addresses}
+        try:
+            tasks = []
+            scheduled = set()
+
+            def schedule(signatures: List[str]):
+                pending = [signature for signature in signatures if signature not in scheduled]
+                scheduled.update(pending)
+                for sig_batch in self.core.batch_signatures(pending, Config.BATCH_SIZE):
+                    tasks.append(asyncio.create_task(
+                        self._collect_batch_transfers(sig_batch, wallet_address, tokens, on_transfer)
+                    ))
+
+            # 新取到的签名页立即开始获取交易，其余已保存的签名在分页结束后补上
+            signatures = await self._get_transaction_signatures(wallet_address, on_page=schedule, window=window)
+            schedule(signatures)
+            if not signatures:
+                logger.info(f"未找到钱包 {wallet_address} 的交易记录")
+
+            for batch in await asyncio.gather(*tasks):
+                for transfer in batch:
+                    transfers[transfer['token']].append(transfer)
+
+        except Exception as e:
+            logger.error(f"获取转账记录失败: {str(e)}")
+
+        return transfers
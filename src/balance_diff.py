@@ -0,0 +1,108 @@
+from typing import Dict, List, Optional, Set, Tuple
+
+# 在代币列表中表示原生 SOL 的标记
+NATIVE_SOL = "SOL"
+SOL_DECIMALS = 9
+
+def account_keys(txn: Dict) -> List[str]:
+    """交易涉及的全部账户地址，顺序与 accountIndex 一致（静态账户在前，地址查找表加载的账户在后）
+
+    jsonParsed 编码的 accountKeys 已经包含查找表加载的账户（source 为 lookupTable），直接使用；
+    json 编码的 accountKeys 只有静态账户，需要接上 meta.loadedAddresses 中的 writable 和 readonly。
+    """
+    message = txn.get('transaction', {}).get('message', {})
+    keys = message.get('accountKeys', [])
+    if keys and isinstance(keys[0], dict):
+        return [key['pubkey'] for key in keys]
+    loaded = (txn.get('meta') or {}).get('loadedAddresses') or {}
+    return keys + loaded.get('writable', []) + loaded.get('readonly', [])
+
+
+def token_balance_deltas(txn: Dict, mints: Set[str],
+                         resolved: Optional[Dict[str, Tuple[str, str, int]]] = None) -> Dict[str, List[Dict]]:
+    """按 accountIndex 计算目标代币每个代币账户的余额变化
+
+    使用原始整数 amount 计算，不经过浮点数；同一 owner 的多个代币账户分别列出。
+    余额记录缺少 owner 时从 resolved（OwnerResolver 解析结果）中查找。
+    返回 mint -> [{'account_index', 'account', 'owner', 'delta', 'decimals'}]，
+    delta 为原始单位的变化量，只包含余额发生变化的账户。不涉及目标代币的交易直接返回空字典。
+    """
+    meta = txn.get('meta') or {}
+    pre = meta.get('preTokenBalances') or []
+    post = meta.get('postTokenBalances') or []
+
+    # accountIndex -> [mint, owner, decimals, pre_amount, post_amount]
+    balances: Dict[int, List] = {}
+    for b in pre:
+        mint = b.get('mint')
+        if mint in mints:
+            amount = b['uiTokenAmount']
+            balances[b['accountIndex']] = [mint, b.get('owner'), amount['decimals'], int(amount['amount']), 0]
+    for b in post:
+        mint = b.get('mint')
+        if mint in mints:
+            amount = b['uiTokenAmount']
+            entry = balances.get(b['accountIndex'])
+            if entry is None:
+                balances[b['accountIndex']] = [mint, b.get('owner'), amount['decimals'], 0, int(amount['amount'])]
+            else:
+                entry[4] = int(amount['amount'])
+    if not balances:
+        return {}
+
+    keys: Optional[List[str]] = None
+    deltas: Dict[str, List[Dict]] = {}
+    for index, (mint, owner, decimals, pre_amount, post_amount) in balances.items():
+        if pre_amount == post_amount:
+            continue
+        if keys is None:
+            keys = account_keys(txn)
+        account = keys[index] if index < len(keys) else None
+        if owner is None and resolved and account in resolved:
+            owner = resolved[account][1]
+        deltas.setdefault(mint, []).append({
+            'account_index': index,
+            'account': account,
+            # 早期交易的余额记录没有 owner 字段且无法解析时，退回到代币账户地址
+            'owner': owner or account,
+            'delta': post_amount - pre_amount,
+            'decimals': decimals,
+        })
+    return deltas
+
+
+def owner_deltas(deltas: List[Dict]) -> Dict[str, int]:
+    """把同一 owner 名下多个代币账户的变化合并为净变化"""
+    totals: Dict[str, int] = {}
+    for item in deltas:
+        totals[item['owner']] = totals.get(item['owner'], 0) + item['delta']
+    return totals
+
+
+def sol_balance_deltas(txn: Dict) -> Dict[str, int]:
+    """根据 preBalances / postBalances 计算每个账户的 lamports 变化
+
+    交易手续费加回给付费账户（第一个账户），代币账户的变化（租金）不计入。
+    """
+    meta = txn.get('meta') or {}
+    pre = meta.get('preBalances') or []
+    post = meta.get('postBalances') or []
+    token_accounts = {
+        b['accountIndex']
+        for key in ('preTokenBalances', 'postTokenBalances')
+        for b in meta.get(key) or []
+    }
+
+    keys: Optional[List[str]] = None
+    deltas: Dict[str, int] = {}
+    for index, (pre_amount, post_amount) in enumerate(zip(pre, post)):
+        delta = post_amount - pre_amount
+        if index == 0:
+            delta += meta.get('fee') or 0
+        if not delta or index in token_accounts:
+            continue
+        if keys is None:
+            keys = account_keys(txn)
+        if index < len(keys):
+            deltas[keys[index]] = deltas.get(keys[index], 0) + delta
+    return deltas
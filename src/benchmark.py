@@ -0,0 +1,228 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+from config import Config
+from tracker import WalletTracker
+from tx_store import TransactionStore
+from transfer_db import TransferDB
+from rpc_client import Endpoint, RateLimiter, RpcClient
+from replay import AsyncReplayTransport, ReplayBackend, ReplaySession
+from balance_diff import token_balance_deltas
+from instructions import spl_transfers, system_transfers
+from addresses import WALLET_ADDRESSES, TOKEN_ADDRESSES
+
+DEFAULT_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "debug_transactions_6EDJ7Juy.json")
+
+def percentile(values: List[float], pct: float) -> float:
+    """最近秩法计算百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+def summarize(durations: List[float], items: int) -> Dict:
+    """汇总多次运行的耗时，items 为每次运行处理的条目数"""
+    total = sum(durations)
+    return {
+        'runs': len(durations),
+        'items_per_run': items,
+        'throughput': items * len(durations) / total if total else 0.0,
+        'p50_ms': percentile(durations, 50) * 1000,
+        'p99_ms': percentile(durations, 99) * 1000,
+    }
+
+def measure_peak_memory(func: Callable[[], None]) -> float:
+    """单独运行一次并返回 Python 分配的内存峰值（MB），不影响计时结果"""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024 / 1024
+
+
+class Benchmark:
+    """基于回放后端的基准测试，不消耗 RPC 额度
+
+    每次运行使用新的内存交易存储（--warm 时复用），并关闭限速，只测量程序本身的开销和注入的延迟。
+    """
+
+    def __init__(self, backend: ReplayBackend, wallet: str, token: str, warm: bool = False):
+        self.backend = backend
+        self.wallet = wallet
+        self.token = token
+        self.warm = warm
+        self._store: Optional[TransactionStore] = None
+
+    def _make_client(self) -> RpcClient:
+        endpoint = Endpoint("replay://", limiter=RateLimiter(requests_per_second=0, credits_per_second=0))
+        return RpcClient(endpoints=[endpoint], session=ReplaySession(self.backend), hedge_delay=0)
+
+    def _make_store(self) -> TransactionStore:
+        if self.warm:
+            if self._store is None:
+                self._store = TransactionStore(":memory:")
+            return self._store
+        return TransactionStore(":memory:")
+
+    def _run_sync(self):
+        tracker = WalletTracker(store=self._make_store(), client=self._make_client(), transfer_db=TransferDB(":memory:"))
+        return tracker.get_token_transfers(self.wallet, self.token)
+
+    def _run_async(self):
+        from async_tracker import AsyncWalletTracker
+
+        async def run():
+            tracker = AsyncWalletTracker(store=self._make_store(), transfer_db=TransferDB(":memory:"),
+                                         client=self._make_client(), transport=AsyncReplayTransport(self.backend))
+            async with tracker:
+                return await tracker.get_token_transfers(self.wallet, self.token)
+        return asyncio.run(run())
+
+    def end_to_end(self, runs: int, use_async: bool = False) -> Dict:
+        """测量 get_token_transfers 的端到端耗时、RPC 调用次数和内存峰值"""
+        run = self._run_async if use_async else self._run_sync
+        transactions = len(self.backend.address_signatures.get(self.wallet, []))
+        # 预热一次，排除导入和连接初始化的开销
+        run()
+
+        durations = []
+        self.backend.reset_stats()
+        transfers = 0
+        for _ in range(runs):
+            start = time.perf_counter()
+            transfers = len(run())
+            durations.append(time.perf_counter() - start)
+        rpc = self.backend.stats()
+
+        result = summarize(durations, transactions)
+        result.update({
+            'mode': 'async' if use_async else 'sync',
+            'transfers': transfers,
+            'http_requests_per_run': rpc['http_requests'] / runs,
+            'rpc_calls_per_run': {method: count / runs for method, count in rpc['calls'].items()},
+            'injected_errors': rpc['injected_errors'],
+            'peak_memory_mb': measure_peak_memory(run),
+        })
+        return result
+
+    def _time_per_transaction(self, func: Callable[[Dict], object], rounds: int, mode: str) -> Dict:
+        """对每笔录制交易调用 func，统计每轮耗时和单笔耗时"""
+        transactions = list(self.backend.transactions.values())
+        per_transaction = []
+        durations = []
+        for _ in range(rounds):
+            round_start = time.perf_counter()
+            for txn in transactions:
+                start = time.perf_counter()
+                func(txn)
+                per_transaction.append(time.perf_counter() - start)
+            durations.append(time.perf_counter() - round_start)
+
+        result = summarize(durations, len(transactions))
+        result.update({
+            'mode': mode,
+            'per_transaction_p50_us': percentile(per_transaction, 50) * 1e6,
+            'per_transaction_p99_us': percentile(per_transaction, 99) * 1e6,
+            'peak_memory_mb': measure_peak_memory(lambda: [func(txn) for txn in transactions]),
+        })
+        return result
+
+    def parse(self, rounds: int) -> Dict:
+        """测量单笔交易解析成转账记录的耗时，不经过 RPC 层"""
+        tracker = WalletTracker(store=TransactionStore(":memory:"), client=self._make_client(),
+                                transfer_db=TransferDB(":memory:"))
+        tokens = {self.token}
+        return self._time_per_transaction(
+            lambda txn: tracker._parse_multi_token_transfers(txn, self.wallet, tokens), rounds, 'parse')
+
+    def balance_diff(self, rounds: int) -> Dict[str, Dict]:
+        """余额差分的微基准：目标代币出现在交易中，以及交易不涉及目标代币（提前过滤）两种情况"""
+        tokens = {self.token}
+        # 不存在的 mint，所有交易都走提前返回的路径
+        absent = {"11111111111111111111111111111111"}
+        return {
+            'balance_diff': self._time_per_transaction(
+                lambda txn: token_balance_deltas(txn, tokens), rounds, 'balance_diff'),
+            'balance_diff_miss': self._time_per_transaction(
+                lambda txn: token_balance_deltas(txn, absent), rounds, 'balance_diff_miss'),
+        }
+
+    def instructions(self, rounds: int) -> Dict:
+        """指令遍历的微基准：展开外层和内层指令，解析全部 SPL Token 和 System 转账"""
+        return self._time_per_transaction(
+            lambda txn: (spl_transfers(txn), system_transfers(txn)), rounds, 'instructions')
+
+
+def format_result(name: str, result: Dict) -> str:
+    lines = [
+        f"[{name}]",
+        f"  运行次数        {result['runs']}（每次 {result['items_per_run']} 笔交易）",
+        f"  吞吐量          {result['throughput']:.1f} 笔交易/秒",
+        f"  p50 / p99       {result['p50_ms']:.2f} / {result['p99_ms']:.2f} ms",
+        f"  内存峰值        {result['peak_memory_mb']:.2f} MB",
+    ]
+    if 'per_transaction_p50_us' in result:
+        lines.append(f"  单笔 p50 / p99  {result['per_transaction_p50_us']:.1f} / {result['per_transaction_p99_us']:.1f} µs")
+    if 'http_requests_per_run' in result:
+        calls = ", ".join(f"{method}={count:g}" for method, count in sorted(result['rpc_calls_per_run'].items()))
+        lines.append(f"  HTTP 请求/次    {result['http_requests_per_run']:g}（{calls}）")
+        lines.append(f"  注入错误        {result['injected_errors']}")
+        lines.append(f"  转账记录        {result['transfers']}")
+    return "\n".join(lines)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="基于录制数据的性能基准测试")
+    parser.add_argument("fixtures", nargs="*", help="录制文件，默认读取 RPC_REPLAY_FILE 或 src/debug_transactions_6EDJ7Juy.json")
+    parser.add_argument("--wallet", default=WALLET_ADDRESSES[0])
+    parser.add_argument("--token", default=TOKEN_ADDRESSES[0])
+    parser.add_argument("--runs", type=int, default=10, help="端到端测试的运行次数")
+    parser.add_argument("--parse-rounds", type=int, default=20, help="解析测试遍历录制交易的轮数")
+    parser.add_argument("--latency-ms", type=float, default=0, help="每个 RPC 请求的模拟延迟")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="模拟延迟的随机抖动范围")
+    parser.add_argument("--error-rate", type=float, default=0, help="返回 429/503 的比例")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子，保证多次测试注入的错误一致")
+    parser.add_argument("--warm", action="store_true", help="复用交易存储，测量缓存命中后的性能")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="同时测试异步追踪器")
+    parser.add_argument("--parse-only", action="store_true", help="只运行解析相关的微基准")
+    parser.add_argument("--json", dest="json_path", help="把结果写入 JSON 文件，便于比较不同版本")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    # 逐条请求的日志会显著影响计时
+    logging.getLogger().setLevel(logging.WARNING)
+
+    fixtures = args.fixtures or [path for path in Config.RPC_REPLAY_FILE.split(',') if path] or [DEFAULT_FIXTURE]
+    backend = ReplayBackend(
+        paths=fixtures,
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    benchmark = Benchmark(backend, args.wallet, args.token, warm=args.warm)
+
+    results = benchmark.balance_diff(args.parse_rounds)
+    results['instructions'] = benchmark.instructions(args.parse_rounds)
+    results['parse'] = benchmark.parse(args.parse_rounds)
+    if not args.parse_only:
+        results['sync'] = benchmark.end_to_end(args.runs)
+        if args.use_async:
+            results['async'] = benchmark.end_to_end(args.runs, use_async=True)
+
+    for name, result in results.items():
+        print(format_result(name, result))
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -9,9 +9,50 @@ class Config:
     QUICKNODE_API_KEY = os.getenv("QUICKNODE_API_KEY", "")
     MAX_TRANSACTIONS = int(os.getenv("MAX_TRANSACTIONS", 1000))
     BATCH_SIZE = int(os.getenv("BATCH_SIZE", 50))
+    # 异步模式下同时在途的最大请求数
+    MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", 10))
+    # 流式解析时预取交易批次的队列容量
+    PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 4))
+    # 多进程扫描钱包时的进程数，1 表示在当前进程中逐个处理
+    SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", 1))
+    
+    # getTransaction 的获取方式：full 为完整的 jsonParsed 响应；lean 使用 json 编码并在本地解码转账指令，
+    # 丢弃 logMessages 等解析用不到的字段（可选，本地解码只覆盖转账和代币账户相关的指令）
+    TX_FETCH_PROFILE = os.getenv("TX_FETCH_PROFILE", "full")
+    
+    # 本地交易存储，默认不启用，设置路径（如 data/transactions.db）后启用
+    TX_STORE_PATH = os.getenv("TX_STORE_PATH", "")
+    TX_STORE_MAX_MB = int(os.getenv("TX_STORE_MAX_MB", 1024))
+    
+    # 本地转账数据库，默认不启用，设置路径（如 data/transfers.db）后启用
+    TRANSFER_DB_PATH = os.getenv("TRANSFER_DB_PATH", "")
+    
+    # 资金流向追踪：最大层数、最多展开的地址数、并行数
+    CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", 3))
+    CRAWL_MAX_NODES = int(os.getenv("CRAWL_MAX_NODES", 200))
+    CRAWL_WORKERS = int(os.getenv("CRAWL_WORKERS", 8))
+    
+    # 代币早期买家扫描：最多翻取的签名数、最多解析的交易数、第一个 slot 的买家达到多少个后停止（0 表示不提前停止）
+    TOKEN_SCAN_MAX_SIGNATURES = int(os.getenv("TOKEN_SCAN_MAX_SIGNATURES", 100000))
+    TOKEN_SCAN_MAX_TRANSACTIONS = int(os.getenv("TOKEN_SCAN_MAX_TRANSACTIONS", 2000))
+    TOKEN_SCAN_FIRST_BUYERS = int(os.getenv("TOKEN_SCAN_FIRST_BUYERS", 20))
     
     # 过滤地址列表
     FILTER_ADDRESSES = json.loads(os.getenv("FILTER_ADDRESSES", "[]"))
+    # 地址标签文件（JSON 或 CSV，逗号分隔），如交易所热钱包、DEX 池子、Jito 小费账户
+    ADDRESS_LABEL_FILES = os.getenv("ADDRESS_LABEL_FILES", "")
+    # 需要过滤的标签类别（逗号分隔），留空表示过滤所有带标签的地址
+    FILTER_CATEGORIES = os.getenv("FILTER_CATEGORIES", "")
+    # 检查标签文件是否修改的间隔（秒），0 表示不自动重新加载
+    ADDRESS_LABELS_RELOAD_INTERVAL = float(os.getenv("ADDRESS_LABELS_RELOAD_INTERVAL", 5))
+    
+    # 实时监控：WebSocket 地址（留空则由 QUICKNODE_RPC_URL 换成 ws/wss 协议得到）、确认级别、断线重连的最大间隔（秒）
+    SOLANA_WS_URL = os.getenv("SOLANA_WS_URL", "")
+    WATCH_COMMITMENT = os.getenv("WATCH_COMMITMENT", "confirmed")
+    WATCH_RECONNECT_MAX = float(os.getenv("WATCH_RECONNECT_MAX", 30))
+    
+    # 运行结束时以 Prometheus 文本格式导出运行指标的文件路径，留空则只在日志中输出汇总报告
+    METRICS_FILE = os.getenv("METRICS_FILE", "")
     
     # 日志配置
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
@@ -21,6 +62,31 @@ class Config:
     HTTP_PROXY = os.getenv("HTTP_PROXY")
     HTTPS_PROXY = os.getenv("HTTPS_PROXY")
     
+    # RPC 限速与重试：每秒请求数和每秒积分（0 表示不限制），按方法配置的积分消耗
+    RPC_REQUESTS_PER_SECOND = float(os.getenv("RPC_REQUESTS_PER_SECOND", 25))
+    RPC_CREDITS_PER_SECOND = float(os.getenv("RPC_CREDITS_PER_SECOND", 0))
+    RPC_METHOD_CREDITS = json.loads(os.getenv("RPC_METHOD_CREDITS", "{}"))
+    RPC_MAX_RETRIES = int(os.getenv("RPC_MAX_RETRIES", 5))
+    RPC_BACKOFF_BASE = float(os.getenv("RPC_BACKOFF_BASE", 0.5))
+    RPC_BACKOFF_MAX = float(os.getenv("RPC_BACKOFF_MAX", 30))
+    RPC_TIMEOUT = float(os.getenv("RPC_TIMEOUT", 30))
+
+    # 多节点：JSON 列表，每项为 {"url", "weight", "requests_per_second", "credits_per_second"}，
+    # 未配置时只使用 QUICKNODE_RPC_URL
+    RPC_ENDPOINTS = json.loads(os.getenv("RPC_ENDPOINTS", "[]"))
+    # 节点健康检查：最近 N 次请求的错误率达到阈值后暂停使用该节点若干秒
+    RPC_HEALTH_WINDOW = int(os.getenv("RPC_HEALTH_WINDOW", 20))
+    RPC_UNHEALTHY_ERROR_RATE = float(os.getenv("RPC_UNHEALTHY_ERROR_RATE", 0.5))
+    RPC_UNHEALTHY_COOLDOWN = float(os.getenv("RPC_UNHEALTHY_COOLDOWN", 30))
+    # 请求超过该秒数未返回时向另一个节点发送副本，0 表示不启用
+    RPC_HEDGE_DELAY = float(os.getenv("RPC_HEDGE_DELAY", 0))
+
+    # 离线回放：设置录制文件（逗号分隔）后同步和异步模式的 RPC 调用都由录制数据响应，不消耗节点额度
+    RPC_REPLAY_FILE = os.getenv("RPC_REPLAY_FILE", "")
+    REPLAY_LATENCY_MS = float(os.getenv("REPLAY_LATENCY_MS", 0))
+    REPLAY_JITTER_MS = float(os.getenv("REPLAY_JITTER_MS", 0))
+    REPLAY_ERROR_RATE = float(os.getenv("REPLAY_ERROR_RATE", 0))
+    
     @classmethod
     def validate(cls):
         """验证必要的配置是否存在"""
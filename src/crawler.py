@@ -0,0 +1,107 @@
+import csv
+import json
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from utils import setup_logging
+from config import Config
+from tracker import WalletTracker
+from output import TRANSFER_FIELDS
+
+logger = setup_logging()
+
+class FundFlowGraph:
+    """资金流向图，以邻接表保存每个地址的转出边"""
+
+    def __init__(self, root: str):
+        self.root = root
+        # 地址 -> 首次发现时所在的层数
+        self.nodes: Dict[str, int] = {root: 0}
+        self.edges: Dict[str, List[Dict]] = defaultdict(list)
+
+    def add_node(self, address: str, depth: int):
+        self.nodes.setdefault(address, depth)
+
+    def add_edge(self, transfer: Dict):
+        self.edges[transfer['from_address']].append(transfer)
+
+    def edge_count(self) -> int:
+        return sum(len(edges) for edges in self.edges.values())
+
+    def to_dict(self) -> Dict:
+        return {
+            'root': self.root,
+            'nodes': [{'address': address, 'depth': depth} for address, depth in self.nodes.items()],
+            'adjacency': {address: edges for address, edges in self.edges.items()}
+        }
+
+    def export_json(self, path: str):
+        """导出为邻接表 JSON"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+    def export_edges_csv(self, path: str):
+        """导出为边列表 CSV"""
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=TRANSFER_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            for edges in self.edges.values():
+                writer.writerows(edges)
+
+
+class FundFlowCrawler:
+    """从一个钱包出发，沿代币转出方向按广度优先逐层追踪接收方
+
+    所有节点共用同一个 WalletTracker，因此共享本地交易存储；每一层的待扩展地址并行获取。
+    """
+
+    def __init__(self, tracker: Optional[WalletTracker] = None, max_depth: Optional[int] = None,
+                 max_nodes: Optional[int] = None, max_workers: Optional[int] = None):
+        self.tracker = tracker or WalletTracker()
+        self.max_depth = max_depth if max_depth is not None else Config.CRAWL_MAX_DEPTH
+        self.max_nodes = max_nodes if max_nodes is not None else Config.CRAWL_MAX_NODES
+        self.max_workers = max_workers or Config.CRAWL_WORKERS
+
+    def _expand(self, address: str, token_addresses: List[str]) -> List[Dict]:
+        """获取单个地址的全部目标代币转出记录"""
+        try:
+            transfers = self.tracker.get_token_transfers_multi(address, token_addresses)
+            return [record for records in transfers.values() for record in records]
+        except Exception as e:
+            logger.error(f"展开地址 {address} 失败: {str(e)}")
+            return []
+
+    def crawl(self, root_wallet: str, token_addresses: List[str]) -> FundFlowGraph:
+        """从 root_wallet 开始广度优先追踪，最多 max_depth 层、展开 max_nodes 个地址"""
+        graph = FundFlowGraph(root_wallet)
+        visited = {root_wallet}
+        frontier = [root_wallet]
+        expanded = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for depth in range(self.max_depth):
+                if not frontier:
+                    break
+
+                # 超出节点预算的地址只记录，不再展开
+                frontier = frontier[:max(self.max_nodes - expanded, 0)]
+                if not frontier:
+                    logger.info(f"已达到节点预算 {self.max_nodes}，停止扩展")
+                    break
+                expanded += len(frontier)
+                logger.info(f"第 {depth + 1} 层: 展开 {len(frontier)} 个地址")
+
+                next_frontier = []
+                results = executor.map(lambda address: self._expand(address, token_addresses), frontier)
+                for transfers in results:
+                    for transfer in transfers:
+                        graph.add_edge(transfer)
+                        recipient = transfer['to_address']
+                        graph.add_node(recipient, depth + 1)
+                        if recipient not in visited:
+                            visited.add(recipient)
+                            next_frontier.append(recipient)
+                frontier = next_frontier
+
+        logger.info(f"追踪完成: {len(graph.nodes)} 个地址, {graph.edge_count()} 条转账, 展开 {expanded} 个地址")
+        return graph
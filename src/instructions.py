@@ -0,0 +1,274 @@
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from balance_diff import account_keys
+
+# 带 source / destination / lamports 的 System Program 转账指令
+SYSTEM_TRANSFER_TYPES = {'transfer', 'transferWithSeed'}
+TOKEN_PROGRAMS = {'spl-token', 'spl-token-2022'}
+SPL_TRANSFER_TYPES = {'transfer', 'transferChecked'}
+# 初始化、同步或关闭代币账户的指令，info['account'] 为代币账户（json 编码下按指令序号解码）
+TOKEN_ACCOUNT_TAGS = {
+    1: 'initializeAccount',
+    9: 'closeAccount',
+    16: 'initializeAccount2',
+    17: 'syncNative',
+    18: 'initializeAccount3',
+    22: 'initializeImmutableOwner',
+}
+TOKEN_ACCOUNT_TYPES = set(TOKEN_ACCOUNT_TAGS.values())
+ATA_PROGRAM = 'spl-associated-token-account'
+ATA_CREATE_TYPES = {'create', 'createIdempotent'}
+
+SYSTEM_PROGRAM_ID = '11111111111111111111111111111111'
+# 程序地址 -> jsonParsed 中的程序名
+TOKEN_PROGRAM_IDS = {
+    'TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA': 'spl-token',
+    'TokenzQdBNbLqP5VEhdkAS6EPFLC1PHnBqCXEpPxuEb': 'spl-token-2022',
+}
+ATA_PROGRAM_ID = 'ATokenGPvbdGVxr1b2hvZbsiqW5xWH25efTNsLJA8knL'
+
+B58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+_B58_INDEX = {char: index for index, char in enumerate(B58_ALPHABET)}
+
+def b58decode(value: str) -> bytes:
+    """解码 base58 字符串（json 编码下指令的 data 字段）"""
+    number = 0
+    for char in value:
+        number = number * 58 + _B58_INDEX[char]
+    body = number.to_bytes((number.bit_length() + 7) // 8, 'big')
+    return b'\0' * (len(value) - len(value.lstrip('1'))) + body
+
+
+def b58encode(data: bytes) -> str:
+    """编码为 base58 字符串"""
+    number = int.from_bytes(data, 'big')
+    chars = []
+    while number:
+        number, remainder = divmod(number, 58)
+        chars.append(B58_ALPHABET[remainder])
+    return '1' * (len(data) - len(data.lstrip(b'\0'))) + ''.join(reversed(chars))
+
+
+def _decode_system(accounts: List[str], data: bytes) -> Optional[Dict]:
+    """解码 System Program 的 transfer(2) / transferWithSeed(11) 指令"""
+    if len(data) < 12:
+        return None
+    tag = int.from_bytes(data[:4], 'little')
+    lamports = int.from_bytes(data[4:12], 'little')
+    if tag == 2 and len(accounts) >= 2:
+        return {'type': 'transfer', 'info': {
+            'source': accounts[0], 'destination': accounts[1], 'lamports': lamports,
+        }}
+    if tag == 11 and len(accounts) >= 3:
+        return {'type': 'transferWithSeed', 'info': {
+            'source': accounts[0], 'sourceBase': accounts[1], 'destination': accounts[2], 'lamports': lamports,
+        }}
+    return None
+
+
+def _decode_token(accounts: List[str], data: bytes) -> Optional[Dict]:
+    """解码 SPL Token 的 transfer(3) / transferChecked(12) 指令，以及初始化、同步、关闭代币账户的指令"""
+    if data and data[0] in TOKEN_ACCOUNT_TAGS and accounts:
+        return {'type': TOKEN_ACCOUNT_TAGS[data[0]], 'info': {'account': accounts[0]}}
+    if len(data) < 9:
+        return None
+    amount = str(int.from_bytes(data[1:9], 'little'))
+    if data[0] == 3 and len(accounts) >= 3:
+        return {'type': 'transfer', 'info': {
+            'source': accounts[0], 'destination': accounts[1], 'authority': accounts[2], 'amount': amount,
+        }}
+    if data[0] == 12 and len(data) >= 10 and len(accounts) >= 4:
+        return {'type': 'transferChecked', 'info': {
+            'source': accounts[0], 'mint': accounts[1], 'destination': accounts[2], 'authority': accounts[3],
+            'tokenAmount': {'amount': amount, 'decimals': data[9]},
+        }}
+    return None
+
+
+def _decode_associated_token(accounts: List[str], data: bytes) -> Optional[Dict]:
+    """解码 Associated Token Account 程序的 create(0 或无数据) / createIdempotent(1) 指令"""
+    types = {0: 'create', 1: 'createIdempotent'}
+    tag = data[0] if data else 0
+    if tag not in types or len(accounts) < 4:
+        return None
+    return {'type': types[tag], 'info': {
+        'source': accounts[0], 'account': accounts[1], 'wallet': accounts[2], 'mint': accounts[3],
+    }}
+
+
+def decode_instruction(program_id: str, accounts: List[str], data: Optional[str]) -> Dict:
+    """把 json 编码的指令中转账和代币账户相关的部分解码成与 jsonParsed 相同的结构，其余指令保持原样"""
+    instruction = {'programId': program_id, 'accounts': accounts, 'data': data}
+    if program_id == SYSTEM_PROGRAM_ID:
+        program, decoder = 'system', _decode_system
+    elif program_id in TOKEN_PROGRAM_IDS:
+        program, decoder = TOKEN_PROGRAM_IDS[program_id], _decode_token
+    elif program_id == ATA_PROGRAM_ID:
+        program, decoder = ATA_PROGRAM, _decode_associated_token
+    else:
+        return instruction
+    try:
+        parsed = decoder(accounts, b58decode(data or ''))
+    except KeyError:
+        return instruction
+    if parsed is None:
+        return instruction
+    return {'programId': program_id, 'program': program, 'parsed': parsed}
+
+
+def iter_instructions(txn: Dict) -> Iterator[Dict]:
+    """按执行顺序展开外层指令及其内层指令（CPI）
+
+    jsonParsed 编码下指令中的账户已经是地址；json 编码下的指令用账户序号表示，
+    这里按包含地址查找表账户（loadedAddresses）的完整账户列表换算成地址，
+    并在本地解码 System / SPL Token 的转账指令。
+    """
+    message = txn.get('transaction', {}).get('message', {})
+    inner = {
+        group['index']: group['instructions']
+        for group in (txn.get('meta') or {}).get('innerInstructions') or []
+    }
+    keys: Optional[List[str]] = None
+    for index, ix in enumerate(message.get('instructions', [])):
+        for instruction in (ix, *inner.get(index, ())):
+            if 'programIdIndex' in instruction:
+                if keys is None:
+                    keys = account_keys(txn)
+                instruction = decode_instruction(
+                    keys[instruction['programIdIndex']],
+                    [keys[i] for i in instruction.get('accounts', [])],
+                    instruction.get('data'),
+                )
+            yield instruction
+
+
+def _parsed(ix: Dict, programs: Set[str], types: Set[str]) -> Optional[Dict]:
+    """返回指定程序和类型的指令的 parsed 字段，否则返回 None"""
+    if ix.get('program') not in programs:
+        return None
+    parsed = ix.get('parsed')
+    if not isinstance(parsed, dict) or parsed.get('type') not in types:
+        return None
+    return parsed
+
+
+def system_transfers(txn: Dict) -> List[Dict]:
+    """解析外层和内层的 System Program SOL 转账，返回 [{'source', 'destination', 'lamports'}]"""
+    transfers = []
+    for ix in iter_instructions(txn):
+        parsed = _parsed(ix, {'system'}, SYSTEM_TRANSFER_TYPES)
+        if parsed is None:
+            continue
+        info = parsed['info']
+        transfers.append({
+            'source': info['source'],
+            'destination': info['destination'],
+            'lamports': int(info['lamports']),
+        })
+    return transfers
+
+
+def token_accounts(txn: Dict) -> Dict[str, Tuple[str, Optional[str], int]]:
+    """根据代币余额记录建立代币账户地址 -> (mint, owner, decimals) 的映射"""
+    meta = txn.get('meta') or {}
+    keys: Optional[List[str]] = None
+    accounts: Dict[str, Tuple[str, Optional[str], int]] = {}
+    for key in ('preTokenBalances', 'postTokenBalances'):
+        for b in meta.get(key) or []:
+            if keys is None:
+                keys = account_keys(txn)
+            index = b['accountIndex']
+            if index < len(keys):
+                accounts[keys[index]] = (b['mint'], b.get('owner'), b['uiTokenAmount']['decimals'])
+    return accounts
+
+
+def token_account_addresses(txn: Dict) -> Set[str]:
+    """交易涉及的代币账户地址
+
+    包括余额记录中的账户，以及同一交易中创建、初始化、同步或关闭的账户。
+    包装 SOL 的临时账户在交易内创建又关闭，不出现在余额记录中，只能从指令中识别。
+    """
+    addresses = set(token_accounts(txn))
+    for ix in iter_instructions(txn):
+        parsed = _parsed(ix, TOKEN_PROGRAMS, TOKEN_ACCOUNT_TYPES) or _parsed(ix, {ATA_PROGRAM}, ATA_CREATE_TYPES)
+        if parsed is not None and parsed['info'].get('account'):
+            addresses.add(parsed['info']['account'])
+    return addresses
+
+
+def _lookup(accounts: Dict[str, Tuple[str, Optional[str], int]], resolved: Optional[Dict[str, Tuple[str, str, int]]],
+            address: str) -> Optional[Tuple[str, Optional[str], int]]:
+    """先查余额记录，缺少 owner 或不在余额记录中时再查已解析的代币账户"""
+    info = accounts.get(address)
+    if (info is None or info[1] is None) and resolved:
+        return resolved.get(address, info)
+    return info
+
+
+def spl_transfers(txn: Dict, mints: Optional[Set[str]] = None,
+                  resolved: Optional[Dict[str, Tuple[str, str, int]]] = None) -> List[Dict]:
+    """解析外层和内层的 SPL Token transfer / transferChecked 指令
+
+    transfer 指令不带 mint，通过代币余额记录换算出 mint、精度以及两端代币账户的 owner；
+    余额记录中没有的账户再从 resolved（OwnerResolver 解析结果）中查找。
+    返回 [{'source', 'destination', 'source_owner', 'destination_owner', 'authority',
+    'mint', 'amount', 'decimals'}]，amount 为原始整数金额。指定 mints 时只返回这些代币的转账。
+    """
+    accounts = token_accounts(txn)
+    if mints is not None and not any(mint in mints for mint, _, _ in accounts.values()):
+        return []
+
+    transfers = []
+    for ix in iter_instructions(txn):
+        parsed = _parsed(ix, TOKEN_PROGRAMS, SPL_TRANSFER_TYPES)
+        if parsed is None:
+            continue
+        info = parsed['info']
+        source = _lookup(accounts, resolved, info['source'])
+        destination = _lookup(accounts, resolved, info['destination'])
+        known = source or destination
+        if parsed['type'] == 'transferChecked':
+            mint = info['mint']
+            amount = int(info['tokenAmount']['amount'])
+            decimals = info['tokenAmount']['decimals']
+        elif known is not None:
+            mint, _, decimals = known
+            amount = int(info['amount'])
+        else:
+            continue
+        if mints is not None and mint not in mints:
+            continue
+        transfers.append({
+            'source': info['source'],
+            'destination': info['destination'],
+            # 同一交易中创建又关闭的临时账户没有余额记录，此时以签名授权的 authority 作为 owner
+            'source_owner': (source[1] if source else None) or info.get('authority'),
+            'destination_owner': destination[1] if destination else None,
+            'authority': info.get('authority') or info.get('multisigAuthority'),
+            'mint': mint,
+            'amount': amount,
+            'decimals': decimals,
+        })
+    return transfers
+
+
+def unknown_token_accounts(txn: Dict, mints: Optional[Set[str]] = None) -> Set[str]:
+    """交易中无法从余额记录得到 owner 的代币账户，交给 OwnerResolver 批量查询
+
+    包括缺少 owner 字段的余额记录，以及转账指令引用但不在余额记录中的账户。
+    指定 mints 时，不涉及这些代币的交易直接返回空集合。
+    """
+    accounts = token_accounts(txn)
+    if mints is not None and not any(mint in mints for mint, _, _ in accounts.values()):
+        return set()
+
+    unknown = {address for address, (_, owner, _) in accounts.items() if owner is None}
+    for ix in iter_instructions(txn):
+        parsed = _parsed(ix, TOKEN_PROGRAMS, SPL_TRANSFER_TYPES)
+        if parsed is None:
+            continue
+        for key in ('source', 'destination'):
+            address = parsed['info'].get(key)
+            if address and address not in accounts:
+                unknown.add(address)
+    return unknown
@@ -1,47 +1,281 @@
+import argparse
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
 from tracker import WalletTracker
+from rpc_client import create_shared_limits, install_shared_limits
+from tx_store import TransactionStore
+from metrics import get_default_metrics
+from output import OUTPUT_FORMATS, TransferSink
+from balance_diff import NATIVE_SOL
 from utils import is_valid_solana_address, setup_logging
 from config import Config
 from addresses import WALLET_ADDRESSES, TOKEN_ADDRESSES
 
 logger = setup_logging()
 
+def parse_time(value: str) -> int:
+    """把 Unix 秒或 ISO 日期（不带时区时按 UTC）转换为 Unix 秒"""
+    if value.isdigit():
+        return int(value)
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无法解析的时间: {value}")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="Solana 链上开发者钱包追踪工具")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="在一个事件循环中并发处理所有钱包和代币组合")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="异步模式下同时在途的最大请求数，默认读取 MAX_CONCURRENT_REQUESTS")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="把钱包分配到多个进程并行处理，所有进程共用 RPC 限速额度，默认读取 SCAN_WORKERS")
+    parser.add_argument("--start-time", type=parse_time, default=None,
+                        help="只处理该时间之后的交易，Unix 秒或 ISO 日期（如 2024-11-01、2024-11-01T08:00:00，按 UTC）")
+    parser.add_argument("--end-time", type=parse_time, default=None,
+                        help="只处理该时间之前的交易，格式同 --start-time")
+    parser.add_argument("--skip-failed", action="store_true",
+                        help="跳过执行失败的交易，不获取其详情")
+    parser.add_argument("--combined", action="store_true",
+                        help="将所有转账记录合并输出到 transfers_combined 文件，而不是每个组合一个文件")
+    parser.add_argument("--format", choices=sorted(OUTPUT_FORMATS), default="csv",
+                        help="输出格式，parquet 需要安装 pyarrow")
+    parser.add_argument("--watch", action="store_true",
+                        help="通过 WebSocket 订阅钱包，实时解析并输出新的转账记录，直到按 Ctrl+C 停止")
+    parser.add_argument("--crawl", action="store_true",
+                        help="从每个钱包出发按广度优先追踪多跳资金流向，导出资金流向图")
+    parser.add_argument("--depth", type=int, default=None,
+                        help="资金流向追踪的最大层数，默认读取 CRAWL_MAX_DEPTH")
+    parser.add_argument("--max-nodes", type=int, default=None,
+                        help="资金流向追踪最多展开的地址数，默认读取 CRAWL_MAX_NODES")
+    parser.add_argument("--scan-token", action="store_true",
+                        help="从每个代币的第一笔交易开始扫描，按首次接收时间和数量列出候选开发者钱包")
+    parser.add_argument("--compact-store", action="store_true",
+                        help="淘汰超出容量的缓存交易并压缩本地交易存储后退出")
+    return parser.parse_args()
+
+def get_valid_addresses():
+    """返回有效的钱包地址和代币地址"""
+    wallets = []
+    for wallet in WALLET_ADDRESSES:
+        if not is_valid_solana_address(wallet):
+            logger.error(f"错误: 无效的钱包地址 {wallet}")
+            continue
+        wallets.append(wallet)
+
+    tokens = []
+    for token in TOKEN_ADDRESSES:
+        if token != NATIVE_SOL and not is_valid_solana_address(token):
+            logger.error(f"错误: 无效的代币地址 {token}")
+            continue
+        tokens.append(token)
+    return wallets, tokens
+
+def compact_store():
+    """压缩本地交易存储"""
+    if not Config.TX_STORE_PATH:
+        logger.info("未启用本地交易存储")
+        return
+    store = TransactionStore()
+    try:
+        store.compact()
+    finally:
+        store.close()
+
+def run_sync(wallets, tokens, sink, filters=None):
+    """逐个钱包处理，每个钱包的交易历史只遍历一次，记录解析出来后立即写出"""
+    # 初始化追踪器
+    tracker = WalletTracker()
+
+    for wallet in wallets:
+        logger.info(f"正在追踪钱包 {wallet} 的 {len(tokens)} 个代币转账记录...")
+
+        try:
+            for transfer in tracker.iter_token_transfers_multi(wallet, tokens, **(filters or {})):
+                sink.write(transfer)
+
+        except Exception as e:
+            logger.error(f"处理钱包 {wallet} 时发生错误: {str(e)}")
+            continue
+
+def make_async_transport():
+    """异步追踪器的传输层，回放模式下与同步客户端一样由录制数据响应，否则使用默认的 aiohttp 连接池"""
+    if not Config.RPC_REPLAY_FILE:
+        return None
+    from replay import AsyncReplayTransport
+    return AsyncReplayTransport()
+
+async def run_async(wallets, tokens, sink, concurrency=None, filters=None):
+    """在一个事件循环中并发处理所有钱包"""
+    from async_tracker import AsyncWalletTracker
+
+    async with AsyncWalletTracker(max_concurrency=concurrency, transport=make_async_transport()) as tracker:
+        for wallet in wallets:
+            logger.info(f"正在追踪钱包 {wallet} 的 {len(tokens)} 个代币转账记录...")
+        outcomes = await asyncio.gather(
+            *(tracker.get_token_transfers_multi(wallet, tokens, on_transfer=sink.write, **(filters or {}))
+              for wallet in wallets),
+            return_exceptions=True
+        )
+
+    for wallet, outcome in zip(wallets, outcomes):
+        if isinstance(outcome, Exception):
+            logger.error(f"处理钱包 {wallet} 时发生错误: {str(outcome)}")
+
+async def run_watch(wallets, tokens, sink):
+    """实时监控钱包，每条转账记录解析出来后立即写出"""
+    from async_tracker import AsyncWalletTracker
+    from watcher import WalletWatcher
+
+    def emit(transfer):
+        sink.write(transfer)
+        sink.flush()
+        logger.info(f"新转账: {transfer['from_address']} -> {transfer['to_address']} "
+                    f"{transfer['amount']} {transfer['token']}")
+
+    async with AsyncWalletTracker(transport=make_async_transport()) as tracker:
+        await WalletWatcher(tracker).watch(wallets, tokens, emit)
+
+_worker_tracker = None
+
+def _scan_wallet(wallet, tokens, filters):
+    """子进程中处理一个钱包，返回该钱包的全部转账记录以及这段时间的运行指标"""
+    logger.info(f"正在追踪钱包 {wallet} 的 {len(tokens)} 个代币转账记录...")
+    transfers = list(_worker_tracker.iter_token_transfers_multi(wallet, tokens, **filters))
+    metrics = get_default_metrics()
+    snapshot = metrics.snapshot()
+    metrics.reset()
+    return transfers, snapshot
+
+def _init_worker(limits):
+    """子进程初始化：使用父进程共享的限速额度，每个进程有自己的追踪器和连接池"""
+    global _worker_tracker
+    install_shared_limits(limits)
+    _worker_tracker = WalletTracker()
+
+def run_workers(wallets, tokens, sink, workers, filters=None):
+    """把钱包分配到多个进程并行处理，各进程的结果在主进程中写入输出文件"""
+    limits = create_shared_limits()
+    logger.info(f"使用 {workers} 个进程处理 {len(wallets)} 个钱包")
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(limits,)) as executor:
+        futures = {executor.submit(_scan_wallet, wallet, tokens, filters or {}): wallet for wallet in wallets}
+        for future in as_completed(futures):
+            wallet = futures[future]
+            try:
+                transfers, snapshot = future.result()
+            except Exception as e:
+                logger.error(f"处理钱包 {wallet} 时发生错误: {str(e)}")
+                continue
+            get_default_metrics().merge(snapshot)
+            for transfer in transfers:
+                sink.write(transfer)
+
+def run_crawl(wallets, tokens, max_depth=None, max_nodes=None):
+    """从每个钱包出发追踪多跳资金流向"""
+    from crawler import FundFlowCrawler
+
+    crawler = FundFlowCrawler(max_depth=max_depth, max_nodes=max_nodes)
+    for wallet in wallets:
+        logger.info(f"正在追踪钱包 {wallet} 的多跳资金流向...")
+        try:
+            graph = crawler.crawl(wallet, tokens)
+            graph.export_json(f"graph_{wallet[:8]}.json")
+            graph.export_edges_csv(f"graph_{wallet[:8]}_edges.csv")
+            logger.info(f"资金流向图已保存到 graph_{wallet[:8]}.json 和 graph_{wallet[:8]}_edges.csv")
+        except Exception as e:
+            logger.error(f"追踪钱包 {wallet} 资金流向时发生错误: {str(e)}")
+
+def run_token_scan(tokens):
+    """从代币出发寻找早期买家"""
+    from token_scanner import TokenScanner
+
+    scanner = TokenScanner()
+    for token in tokens:
+        if token == NATIVE_SOL:
+            continue
+        logger.info(f"正在扫描代币 {token} 的早期买家...")
+        try:
+            result = scanner.scan(token)
+            path = f"token_scan_{token[:8]}.csv"
+            result.export_csv(path)
+            if result.truncated:
+                logger.warning(f"代币 {token} 共 {result.signatures} 条签名已达上限，未扫描到创建交易：以下结果从已获取的"
+                               f"最早交易开始，首笔付费账户和 slot 偏移不代表部署者和创建 slot")
+                logger.info(f"最早扫描到的交易的付费账户: {result.creator}，其 slot 的接收方 {result.first_block_buyers()} 个")
+            else:
+                logger.info(f"部署者（第一笔交易的付费账户）: {result.creator}，第一个 slot 的买家 {result.first_block_buyers()} 个")
+            for row in result.ranking()[:10]:
+                logger.info(f"  #{row['early_rank']} {row['address']} slot +{row['slot_offset']} "
+                            f"接收 {row['received']}（数量排名 {row['size_rank']}）")
+            logger.info(f"早期买家已保存到 {path}")
+        except Exception as e:
+            logger.error(f"扫描代币 {token} 时发生错误: {str(e)}")
+
+def report_metrics():
+    """输出运行统计，配置 METRICS_FILE 时同时导出 Prometheus 文本格式"""
+    metrics = get_default_metrics()
+    logger.info(metrics.report())
+    if Config.METRICS_FILE:
+        try:
+            metrics.write_prometheus(Config.METRICS_FILE)
+            logger.info(f"运行指标已导出到 {Config.METRICS_FILE}")
+        except OSError as e:
+            logger.error(f"导出运行指标失败: {str(e)}")
+
 def main():
+    args = parse_args()
     try:
         # 验证配置
         Config.validate()
-        
-        # 初始化追踪器
-        tracker = WalletTracker()
-        
+
+        if args.compact_store:
+            compact_store()
+            return
+
         # 遍历所有钱包和代币组合
-        for wallet in WALLET_ADDRESSES:
-            if not is_valid_solana_address(wallet):
-                logger.error(f"错误: 无效的钱包地址 {wallet}")
-                continue
-                
-            for token in TOKEN_ADDRESSES:
-                if not is_valid_solana_address(token):
-                    logger.error(f"错误: 无效的代币地址 {token}")
-                    continue
-                    
-                output_file = f"transfers_{wallet[:8]}_{token[:8]}.csv"
-                logger.info(f"正在追踪钱包 {wallet} 的 {token} 代币转账记录...")
-                
+        wallets, tokens = get_valid_addresses()
+        if args.scan_token:
+            # 从代币出发，不需要钱包地址
+            if not tokens:
+                logger.error("没有有效的代币地址")
+                return
+            run_token_scan(tokens)
+            report_metrics()
+            return
+
+        if not wallets or not tokens:
+            logger.error("没有有效的钱包或代币地址")
+            return
+
+        if args.crawl:
+            run_crawl(wallets, tokens, args.depth, args.max_nodes)
+            report_metrics()
+            return
+
+        workers = Config.SCAN_WORKERS if args.workers is None else args.workers
+        # 时间窗口和失败交易过滤在获取交易之前按签名记录完成
+        filters = {'start_time': args.start_time, 'end_time': args.end_time, 'skip_failed': args.skip_failed}
+        with TransferSink(args.format, combined=args.combined) as sink:
+            if args.watch:
                 try:
-                    transfers = tracker.get_token_transfers(wallet, token)
-                    
-                    if not transfers.empty:
-                        transfers.to_csv(output_file, index=False)
-                        logger.info(f"已找到 {len(transfers)} 条转账记录，已保存到 {output_file}")
-                    else:
-                        logger.info("未找到相关转账记录")
-                        
-                except Exception as e:
-                    logger.error(f"处理钱包 {wallet} 和代币 {token} 时发生错误: {str(e)}")
-                    continue
-                    
+                    asyncio.run(run_watch(wallets, tokens, sink))
+                except KeyboardInterrupt:
+                    logger.info("已停止实时监控")
+            elif workers > 1 and len(wallets) > 1:
+                run_workers(wallets, tokens, sink, workers, filters)
+            elif args.use_async:
+                asyncio.run(run_async(wallets, tokens, sink, args.concurrency, filters))
+            else:
+                run_sync(wallets, tokens, sink, filters)
+        report_metrics()
+
     except Exception as e:
         logger.error(f"发生错误: {str(e)}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
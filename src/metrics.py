@@ -0,0 +1,283 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+# Prometheus 文本格式中的指标名前缀
+METRIC_PREFIX = "findrealdev_"
+# 直方图的桶上限（秒），覆盖单笔交易解析（百微秒级）到慢 RPC 请求
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# 运行报告中各阶段的显示顺序
+STAGES = ('signatures', 'fetch', 'owners', 'rate_limit', 'parse', 'write', 'transfer_db')
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def endpoint_label(url: str) -> str:
+    """节点标签只保留主机名，避免 URL 路径中的 API 密钥出现在指标里"""
+    return urlparse(url).netloc or url
+
+
+def payload_method(payload: Union[Dict, List[Dict]]) -> str:
+    """请求的方法名，批量请求取第一个调用的方法"""
+    call = payload[0] if isinstance(payload, list) and payload else payload
+    return call.get('method', 'unknown') if isinstance(call, dict) else 'unknown'
+
+
+class Histogram:
+    """固定桶的直方图，counts[i] 为落在 (buckets[i-1], buckets[i]] 内的次数，最后一个为 +Inf"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按桶估算分位数，返回所在桶的上限；落在 +Inf 桶时返回最大的有限上限"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.buckets[min(index, len(self.buckets) - 1)]
+        return self.buckets[-1]
+
+    def merge(self, counts: List[int], total: float, count: int):
+        for index, value in enumerate(counts):
+            self.counts[index] += value
+        self.sum += total
+        self.count += count
+
+
+class Metrics:
+    """进程内的运行指标：计数器和延迟直方图，按名称和标签区分
+
+    记录的指标：
+    - rpc_requests_total{method, endpoint, status}：HTTP 请求数，批量请求算一次
+    - rpc_calls_total{method}：JSON-RPC 调用数，批量请求中的每个调用单独计数
+    - rpc_credits_total{method}：按 RPC_METHOD_CREDITS 计算的积分
+    - rpc_response_bytes_total{method, endpoint}：响应体字节数
+    - rpc_request_seconds{method, endpoint}：请求延迟直方图
+    - cache_requests_total{cache, result}：本地交易存储和代币账户缓存的命中 / 未命中数
+    - stage_seconds{stage}：各阶段耗时直方图，parse 阶段每笔交易记录一次，rate_limit 为等待限速的时间
+
+    所有方法线程安全；snapshot / merge 用于汇总多进程扫描时各子进程的指标。
+    """
+
+    def __init__(self):
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+            self.started = time.monotonic()
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def stage(self, stage: str) -> Iterator[None]:
+        """记录一段代码的耗时到 stage_seconds{stage}"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - start, stage=stage)
+
+    def record_rpc(self, url: str, payload: Union[Dict, List[Dict]], seconds: Optional[float], ok: bool,
+                   size: Optional[int] = None, credits: Optional[float] = None):
+        """记录一次 HTTP 请求；seconds 为 None 表示请求没有完成（连接失败、超时）"""
+        method = payload_method(payload)
+        endpoint = endpoint_label(url)
+        calls = len(payload) if isinstance(payload, list) else 1
+        with self._lock:
+            for key, value in (
+                (('rpc_requests_total', (('endpoint', endpoint), ('method', method),
+                                         ('status', 'ok' if ok else 'error'))), 1),
+                (('rpc_calls_total', (('method', method),)), calls),
+                (('rpc_credits_total', (('method', method),)), credits or 0),
+                (('rpc_response_bytes_total', (('endpoint', endpoint), ('method', method))), size or 0),
+            ):
+                self._counters[key] = self._counters.get(key, 0) + value
+            if seconds is not None:
+                key = ('rpc_request_seconds', (('endpoint', endpoint), ('method', method)))
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram()
+                histogram.observe(seconds)
+
+    def record_cache(self, cache: str, hits: int, misses: int):
+        if hits:
+            self.inc('cache_requests_total', hits, cache=cache, result='hit')
+        if misses:
+            self.inc('cache_requests_total', misses, cache=cache, result='miss')
+
+    def counter(self, name: str, **labels: str) -> float:
+        """标签完全匹配的计数器值；不传标签时返回该名称下所有计数器之和"""
+        with self._lock:
+            if labels:
+                return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+            return sum(value for (key, _), value in self._counters.items() if key == name)
+
+    def counters(self, name: str) -> Dict[Labels, float]:
+        with self._lock:
+            return {labels: value for (key, labels), value in self._counters.items() if key == name}
+
+    def histograms(self, name: str) -> Dict[Labels, Histogram]:
+        with self._lock:
+            return {labels: histogram for (key, labels), histogram in self._histograms.items() if key == name}
+
+    def hit_rate(self, cache: str) -> Optional[float]:
+        """缓存命中率，没有查询过时返回 None"""
+        hits = self.counter('cache_requests_total', cache=cache, result='hit')
+        misses = self.counter('cache_requests_total', cache=cache, result='miss')
+        return hits / (hits + misses) if hits + misses else None
+
+    def snapshot(self) -> Dict:
+        """可以跨进程传递的指标副本"""
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'histograms': {
+                    key: (histogram.buckets, list(histogram.counts), histogram.sum, histogram.count)
+                    for key, histogram in self._histograms.items()
+                },
+            }
+
+    def merge(self, snapshot: Dict):
+        """累加另一个进程的 snapshot"""
+        with self._lock:
+            for key, value in snapshot['counters'].items():
+                self._counters[key] = self._counters.get(key, 0) + value
+            for key, (buckets, counts, total, count) in snapshot['histograms'].items():
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram(buckets)
+                histogram.merge(counts, total, count)
+
+    def to_prometheus(self) -> str:
+        """导出为 Prometheus 文本格式"""
+        def format_labels(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            items = labels + extra
+            if not items:
+                return ''
+            return '{' + ','.join(f'{key}="{value}"' for key, value in items) + '}'
+
+        snapshot = self.snapshot()
+        lines = []
+        for name in sorted({name for name, _ in snapshot['counters']}):
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} counter")
+            for (key, labels), value in sorted(snapshot['counters'].items()):
+                if key == name:
+                    lines.append(f"{METRIC_PREFIX}{name}{format_labels(labels)} {value:g}")
+        for name in sorted({name for name, _ in snapshot['histograms']}):
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} histogram")
+            for (key, labels), (buckets, counts, total, count) in sorted(snapshot['histograms'].items()):
+                if key != name:
+                    continue
+                cumulative = 0
+                for bound, value in zip(buckets + (float('inf'),), counts):
+                    cumulative += value
+                    le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                    lines.append(f"{METRIC_PREFIX}{name}_bucket{format_labels(labels, (('le', le),))} {cumulative}")
+                lines.append(f"{METRIC_PREFIX}{name}_sum{format_labels(labels)} {total:.6f}")
+                lines.append(f"{METRIC_PREFIX}{name}_count{format_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+
+    def report(self) -> str:
+        """运行结束时的汇总报告"""
+        lines = [f"运行统计（耗时 {time.monotonic() - self.started:.1f} 秒）"]
+
+        requests = self.counters('rpc_requests_total')
+        latencies = self.histograms('rpc_request_seconds')
+        response_bytes = self.counters('rpc_response_bytes_total')
+        if requests:
+            lines.append("RPC 请求（按方法和节点）:")
+            groups: Dict[Labels, Dict[str, float]] = {}
+            for labels, value in requests.items():
+                label_map = dict(labels)
+                status = label_map.pop('status')
+                groups.setdefault(tuple(sorted(label_map.items())), {})[status] = value
+            for labels, statuses in sorted(groups.items()):
+                label_map = dict(labels)
+                line = (f"  {label_map['method']} @ {label_map['endpoint']}: "
+                        f"{statuses.get('ok', 0) + statuses.get('error', 0):g} 次")
+                if statuses.get('error'):
+                    line += f"（失败 {statuses['error']:g}）"
+                histogram = latencies.get(labels)
+                if histogram and histogram.count:
+                    line += (f"，平均 {histogram.sum / histogram.count * 1000:.1f} ms，"
+                             f"p50 ≤ {histogram.quantile(0.5) * 1000:g} ms，p95 ≤ {histogram.quantile(0.95) * 1000:g} ms")
+                size = response_bytes.get(labels, 0)
+                if size >= 1024 * 1024:
+                    line += f"，响应 {size / 1024 / 1024:.2f} MB"
+                elif size:
+                    line += f"，响应 {size / 1024:.1f} KB"
+                lines.append(line)
+            calls = ', '.join(f"{dict(labels)['method']} {value:g}"
+                              for labels, value in sorted(self.counters('rpc_calls_total').items()))
+            lines.append(f"  调用数（批量中的每个调用单独计）: {calls}")
+            lines.append(f"  积分合计: {self.counter('rpc_credits_total'):g}")
+
+        caches = sorted({dict(labels)['cache'] for labels in self.counters('cache_requests_total')})
+        if caches:
+            parts = []
+            for cache in caches:
+                hits = self.counter('cache_requests_total', cache=cache, result='hit')
+                misses = self.counter('cache_requests_total', cache=cache, result='miss')
+                parts.append(f"{cache} {self.hit_rate(cache):.1%}（{hits:g}/{hits + misses:g}）")
+            lines.append(f"缓存命中率: {', '.join(parts)}")
+
+        stages = {dict(labels)['stage']: histogram for labels, histogram in self.histograms('stage_seconds').items()}
+        if stages:
+            lines.append("阶段耗时（各线程 / 任务累计）:")
+            for stage in sorted(stages, key=lambda name: (STAGES.index(name) if name in STAGES else len(STAGES), name)):
+                histogram = stages[stage]
+                line = f"  {stage}: {histogram.sum:.3f} 秒 / {histogram.count} 次"
+                if stage == 'parse' and histogram.count:
+                    line += f"，平均每笔交易 {histogram.sum / histogram.count * 1e6:.0f} µs"
+                lines.append(line)
+        return '\n'.join(lines)
+
+
+_default_metrics: Optional[Metrics] = None
+_default_lock = threading.Lock()
+
+def get_default_metrics() -> Metrics:
+    """进程内共享的指标"""
+    global _default_metrics
+    with _default_lock:
+        if _default_metrics is None:
+            _default_metrics = Metrics()
+        return _default_metrics
@@ -0,0 +1,202 @@
+import csv
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+from utils import setup_logging
+from metrics import get_default_metrics
+
+logger = setup_logging()
+
+TRANSFER_FIELDS = ['timestamp', 'from_address', 'to_address', 'token', 'amount']
+
+OUTPUT_FORMATS = {
+    'csv': '.csv',
+    'jsonl': '.jsonl',
+    'parquet': '.parquet',
+}
+
+def _import_pyarrow():
+    """按需导入 pyarrow"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("写入 Parquet 需要安装 pyarrow: pip install pyarrow")
+    return pyarrow, pyarrow.parquet
+
+
+class TransferWriter:
+    """转账记录的流式写入器，每条记录产生后立即写出"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+
+    def write(self, record: Dict):
+        self._write(record)
+        self.count += 1
+
+    def _write(self, record: Dict):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class CsvTransferWriter(TransferWriter):
+    """CSV 写入器，列顺序以第一条记录为准"""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._writer: Optional[csv.DictWriter] = None
+
+    def _write(self, record: Dict):
+        if self._writer is None:
+            fieldnames = TRANSFER_FIELDS + [key for key in record if key not in TRANSFER_FIELDS]
+            self._writer = csv.DictWriter(self._file, fieldnames=fieldnames, extrasaction='ignore')
+            self._writer.writeheader()
+        self._writer.writerow(record)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class JsonLinesTransferWriter(TransferWriter):
+    """JSON Lines 写入器，每行一条记录"""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._file = open(path, 'w', encoding='utf-8')
+
+    def _write(self, record: Dict):
+        self._file.write(json.dumps(record, ensure_ascii=False, default=str))
+        self._file.write('\n')
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetTransferWriter(TransferWriter):
+    """Parquet 写入器，需要安装 pyarrow；记录按行组缓冲后写出"""
+
+    def __init__(self, path: str, row_group_size: int = 10000):
+        super().__init__(path)
+        self._pa, self._pq = _import_pyarrow()
+        self._row_group_size = row_group_size
+        self._buffer: List[Dict] = []
+        self._writer = None
+
+    def _write(self, record: Dict):
+        self._buffer.append(record)
+        if len(self._buffer) >= self._row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        if self._writer is None:
+            table = self._pa.Table.from_pylist(self._buffer)
+            self._writer = self._pq.ParquetWriter(self.path, table.schema)
+        else:
+            table = self._pa.Table.from_pylist(self._buffer, schema=self._writer.schema)
+        self._writer.write_table(table)
+        self._buffer = []
+
+    def close(self):
+        self._flush()
+        if self._writer is not None:
+            self._writer.close()
+
+
+WRITERS = {
+    'csv': CsvTransferWriter,
+    'jsonl': JsonLinesTransferWriter,
+    'parquet': ParquetTransferWriter,
+}
+
+def open_writer(path: str, output_format: Optional[str] = None) -> TransferWriter:
+    """按格式（默认根据文件扩展名）创建写入器"""
+    if output_format is None:
+        extension = os.path.splitext(path)[1].lower()
+        output_format = next((name for name, ext in OUTPUT_FORMATS.items() if ext == extension), 'csv')
+    if output_format not in WRITERS:
+        raise ValueError(f"不支持的输出格式: {output_format}")
+    return WRITERS[output_format](path)
+
+
+class TransferSink:
+    """按钱包和代币组合分发转账记录，首条记录到达时才创建对应的输出文件
+
+    combined 为 True 时所有记录写入同一个文件。
+    """
+
+    def __init__(self, output_format: str = 'csv', combined: bool = False, combined_name: str = "transfers_combined"):
+        if output_format not in WRITERS:
+            raise ValueError(f"不支持的输出格式: {output_format}")
+        if output_format == 'parquet':
+            # 在开始扫描前确认依赖可用
+            _import_pyarrow()
+        self.output_format = output_format
+        self.combined = combined
+        self.combined_name = combined_name
+        self._writers: Dict[Tuple[str, str], TransferWriter] = {}
+        self._metrics = get_default_metrics()
+
+    def _path_for(self, wallet: str, token: str) -> str:
+        extension = OUTPUT_FORMATS[self.output_format]
+        if self.combined:
+            return f"{self.combined_name}{extension}"
+        return f"transfers_{wallet[:8]}_{token[:8]}{extension}"
+
+    def write(self, record: Dict, wallet: Optional[str] = None):
+        """写入一条记录，wallet 默认取记录的发送方"""
+        wallet = wallet or record['from_address']
+        key = ('', '') if self.combined else (wallet, record['token'])
+        with self._metrics.stage('write'):
+            writer = self._writers.get(key)
+            if writer is None:
+                writer = open_writer(self._path_for(wallet, record['token']), self.output_format)
+                self._writers[key] = writer
+            writer.write(record)
+
+    def flush(self):
+        """把已写入的记录刷到磁盘，实时监控时每条记录写入后调用"""
+        for writer in self._writers.values():
+            writer.flush()
+
+    def close(self):
+        """关闭所有输出文件并记录写入数量"""
+        for writer in self._writers.values():
+            writer.close()
+            logger.info(f"已找到 {writer.count} 条转账记录，已保存到 {writer.path}")
+        if not self._writers:
+            logger.info("未找到相关转账记录")
+        self._writers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def to_dataframe(records: List[Dict]):
+    """将转账记录转换为 pandas DataFrame，只有调用时才导入 pandas"""
+    import pandas as pd
+    return pd.DataFrame(records)
@@ -0,0 +1,104 @@
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from utils import setup_logging
+from tx_store import TransactionStore
+from metrics import get_default_metrics
+
+logger = setup_logging()
+
+# getMultipleAccounts 单次最多查询 100 个账户
+MULTIPLE_ACCOUNTS_LIMIT = 100
+
+TokenAccountInfo = Tuple[str, str, int]
+
+class OwnerResolver:
+    """把代币账户地址解析为 (mint, owner, decimals)
+
+    余额记录缺少 owner（早期交易）或账户不在余额记录中时使用。调用方先收集一整批交易中
+    未知的代币账户，再通过 getMultipleAccounts 每 100 个账户一次查询，结果写入内存和本地存储，
+    之后的运行直接复用。查询不到的账户（已关闭）只在本次运行中记录，不会重复请求。
+    """
+
+    def __init__(self, store: Optional[TransactionStore] = None):
+        self.store = store
+        # 已解析的代币账户，供解析函数直接查询
+        self.accounts: Dict[str, TokenAccountInfo] = {}
+        self._unresolvable: Set[str] = set()
+        self._lock = threading.Lock()
+        self.metrics = get_default_metrics()
+
+    def unknown(self, candidates: Iterable[str]) -> List[str]:
+        """返回需要向节点查询的账户，本地存储中已有的账户直接载入缓存"""
+        candidates = list(dict.fromkeys(candidates))
+        with self._lock:
+            pending = [
+                account for account in candidates
+                if account not in self.accounts and account not in self._unresolvable
+            ]
+        if pending and self.store is not None:
+            try:
+                stored = self.store.get_token_accounts(pending)
+            except Exception as e:
+                logger.error(f"读取代币账户缓存失败: {str(e)}")
+                stored = {}
+            if stored:
+                with self._lock:
+                    self.accounts.update(stored)
+                pending = [account for account in pending if account not in stored]
+        self.metrics.record_cache('token_accounts', len(candidates) - len(pending), len(pending))
+        return pending
+
+    def request_params(self, accounts: List[str]) -> List[List]:
+        """按每次 100 个账户拆分 getMultipleAccounts 的请求参数"""
+        return [
+            [accounts[i:i + MULTIPLE_ACCOUNTS_LIMIT], {"encoding": "jsonParsed"}]
+            for i in range(0, len(accounts), MULTIPLE_ACCOUNTS_LIMIT)
+        ]
+
+    def record(self, accounts: List[str], responses) -> Dict[str, TokenAccountInfo]:
+        """解析批量 getMultipleAccounts 的响应（id 为分段序号），更新缓存并返回新解析的账户"""
+        chunks = [accounts[i:i + MULTIPLE_ACCOUNTS_LIMIT] for i in range(0, len(accounts), MULTIPLE_ACCOUNTS_LIMIT)]
+        resolved: Dict[str, TokenAccountInfo] = {}
+        answered: Set[str] = set()
+        for response in responses if isinstance(responses, list) else []:
+            index = response.get('id') if isinstance(response, dict) else None
+            if not isinstance(index, int) or not 0 <= index < len(chunks) or 'result' not in response:
+                continue
+            values = (response['result'] or {}).get('value') or []
+            for account, value in zip(chunks[index], values):
+                answered.add(account)
+                info = self._parse_account(value)
+                if info:
+                    resolved[account] = info
+
+        with self._lock:
+            self.accounts.update(resolved)
+            self._unresolvable.update(answered - set(resolved))
+        if resolved and self.store is not None:
+            try:
+                self.store.save_token_accounts(resolved)
+            except Exception as e:
+                logger.error(f"保存代币账户缓存失败: {str(e)}")
+        logger.debug(f"解析代币账户 {len(resolved)}/{len(accounts)} 个")
+        return resolved
+
+    def _parse_account(self, value: Optional[Dict]) -> Optional[TokenAccountInfo]:
+        """从 jsonParsed 编码的账户数据中取出 mint、owner 和精度，非代币账户返回 None"""
+        if not value:
+            return None
+        parsed = (value.get('data') or {}).get('parsed') if isinstance(value.get('data'), dict) else None
+        if not parsed or parsed.get('type') != 'account':
+            return None
+        info = parsed.get('info') or {}
+        if not info.get('mint') or not info.get('owner'):
+            return None
+        return info['mint'], info['owner'], (info.get('tokenAmount') or {}).get('decimals', 0)
+
+    def resolve(self, candidates: Iterable[str],
+                batch_request: Callable[[str, List[List]], List[Dict]]) -> Dict[str, TokenAccountInfo]:
+        """同步解析一批账户，batch_request 为发送批量 RPC 请求的函数"""
+        pending = self.unknown(candidates)
+        if not pending:
+            return {}
+        logger.debug(f"通过 getMultipleAccounts 查询 {len(pending)} 个代币账户的 owner")
+        return self.record(pending, batch_request("getMultipleAccounts", self.request_params(pending)))
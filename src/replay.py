@@ -0,0 +1,414 @@
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple, Union
+import requests
+from utils import json_loads, setup_logging
+from config import Config
+from balance_diff import account_keys
+from instructions import ATA_CREATE_TYPES, ATA_PROGRAM, TOKEN_ACCOUNT_TAGS, TOKEN_PROGRAMS, b58decode, b58encode
+
+logger = setup_logging()
+
+# 注入错误时随机返回的状态码
+INJECTED_ERROR_STATUS = (429, 503)
+
+def _encode_parsed(parsed: Dict, program: str) -> Tuple[List[str], bytes]:
+    """把 jsonParsed 的转账和代币账户指令还原为账户列表和指令数据，其他指令无法还原，返回空"""
+    info = parsed.get('info') or {}
+    if program == 'system' and parsed.get('type') == 'transfer':
+        return [info['source'], info['destination']], (2).to_bytes(4, 'little') + int(info['lamports']).to_bytes(8, 'little')
+    if program in TOKEN_PROGRAMS and parsed.get('type') == 'transfer':
+        authority = info.get('authority') or info.get('multisigAuthority')
+        return ([info['source'], info['destination'], authority, *info.get('signers', [])],
+                bytes([3]) + int(info['amount']).to_bytes(8, 'little'))
+    if program in TOKEN_PROGRAMS and parsed.get('type') == 'transferChecked':
+        authority = info.get('authority') or info.get('multisigAuthority')
+        amount = info['tokenAmount']
+        return ([info['source'], info['mint'], info['destination'], authority, *info.get('signers', [])],
+                bytes([12]) + int(amount['amount']).to_bytes(8, 'little') + bytes([amount['decimals']]))
+    if program in TOKEN_PROGRAMS and parsed.get('type') in TOKEN_ACCOUNT_TAGS.values():
+        tag = next(tag for tag, name in TOKEN_ACCOUNT_TAGS.items() if name == parsed['type'])
+        data = bytes([tag])
+        if parsed['type'] in ('initializeAccount2', 'initializeAccount3'):
+            data += b58decode(info['owner']).rjust(32, b'\0')
+        if parsed['type'] == 'closeAccount':
+            return [info['account'], info['destination'], info.get('owner') or info.get('multisigOwner')], data
+        return [info['account'], info.get('mint'), info.get('owner')], data
+    if program == ATA_PROGRAM and parsed.get('type') in ATA_CREATE_TYPES:
+        data = b'' if parsed['type'] == 'create' else bytes([1])
+        return [info['source'], info['account'], info['wallet'], info['mint'],
+                info.get('systemProgram'), info.get('tokenProgram')], data
+    return [], b''
+
+
+def to_json_encoding(txn: Dict) -> Dict:
+    """把录制的 jsonParsed 交易转换为 json 编码的形式（账户用序号表示，指令数据为 base58）
+
+    转账和代币账户相关的指令可以还原；其他已解析的指令只保留程序序号。
+    """
+    keys = account_keys(txn)
+    index = {key: i for i, key in enumerate(keys)}
+
+    def convert(ix: Dict) -> Dict:
+        if 'parsed' in ix:
+            accounts, data = _encode_parsed(ix['parsed'] if isinstance(ix['parsed'], dict) else {}, ix.get('program'))
+        else:
+            accounts, data = ix.get('accounts', []), None
+        converted = {
+            'programIdIndex': index[ix['programId']],
+            'accounts': [index[account] for account in accounts if account in index],
+            'data': ix.get('data', '') if data is None else b58encode(data),
+        }
+        if 'stackHeight' in ix:
+            converted['stackHeight'] = ix['stackHeight']
+        return converted
+
+    message = txn['transaction']['message']
+    meta = dict(txn.get('meta') or {})
+    if meta.get('innerInstructions'):
+        meta['innerInstructions'] = [
+            {'index': group['index'], 'instructions': [convert(ix) for ix in group['instructions']]}
+            for group in meta['innerInstructions']
+        ]
+    converted_message = dict(message)
+    # json 编码的 accountKeys 只有静态账户，查找表加载的账户只出现在 meta.loadedAddresses 中
+    loaded = meta.get('loadedAddresses') or {}
+    converted_message['accountKeys'] = keys[:len(keys) - len(loaded.get('writable', [])) - len(loaded.get('readonly', []))]
+    converted_message['instructions'] = [convert(ix) for ix in message.get('instructions', [])]
+    return {
+        **txn,
+        'transaction': {**txn['transaction'], 'message': converted_message},
+        'meta': meta,
+    }
+
+
+class ReplayBackend:
+    """用录制的 getTransaction 结果模拟 Solana RPC 节点
+
+    支持 getTransaction（jsonParsed 和 json 编码）、getSignaturesForAddress（before / until / limit 分页）、
+    getMultipleAccounts（返回空账户）以及 JSON-RPC 批量请求。
+    可以注入固定延迟、随机抖动和按比例返回的 429/503 错误，并统计每个方法的调用次数。
+    """
+
+    def __init__(self, paths: Optional[List[str]] = None, latency: Optional[float] = None,
+                 jitter: Optional[float] = None, error_rate: Optional[float] = None, seed: Optional[int] = None):
+        paths = paths or [path.strip() for path in Config.RPC_REPLAY_FILE.split(',') if path.strip()]
+        self.latency = Config.REPLAY_LATENCY_MS / 1000 if latency is None else latency
+        self.jitter = Config.REPLAY_JITTER_MS / 1000 if jitter is None else jitter
+        self.error_rate = Config.REPLAY_ERROR_RATE if error_rate is None else error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.transactions: Dict[str, Dict] = {}
+        # 按需生成的 json 编码版本
+        self._json_encoded: Dict[str, Dict] = {}
+        self.address_signatures: Dict[str, List[Dict]] = defaultdict(list)
+        for path in paths:
+            self.load(path)
+        for records in self.address_signatures.values():
+            records.sort(key=lambda record: record['slot'], reverse=True)
+        self.calls: Counter = Counter()
+        self.http_requests = 0
+        self.injected_errors = 0
+
+    def load(self, path: str):
+        """加载一个录制文件（getTransaction 结果的 JSON 数组）"""
+        with open(path, 'r', encoding='utf-8') as f:
+            transactions = json.load(f)
+        added = 0
+        for txn in transactions:
+            if not txn:
+                continue
+            signature = txn['transaction']['signatures'][0]
+            if signature in self.transactions:
+                continue
+            self.transactions[signature] = txn
+            record = {
+                'signature': signature,
+                'slot': txn.get('slot'),
+                'blockTime': txn.get('blockTime'),
+                'err': (txn.get('meta') or {}).get('err'),
+            }
+            for address in set(account_keys(txn)):
+                self.address_signatures[address].append(record)
+            added += 1
+        logger.info(f"已从 {path} 加载 {added} 笔录制交易")
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls.clear()
+            self.http_requests = 0
+            self.injected_errors = 0
+
+    def stats(self) -> Dict:
+        return {
+            'http_requests': self.http_requests,
+            'calls': dict(self.calls),
+            'injected_errors': self.injected_errors,
+        }
+
+    def sample_latency(self) -> float:
+        """本次请求应模拟的延迟（秒）"""
+        if not self.jitter:
+            return self.latency
+        with self._lock:
+            return max(self.latency + self._random.uniform(-self.jitter, self.jitter), 0.0)
+
+    def handle(self, payload: Union[Dict, List[Dict]]) -> Tuple[int, Dict[str, str], Optional[Union[Dict, List]]]:
+        """处理一次 HTTP 请求，返回状态码、响应头和响应体"""
+        with self._lock:
+            self.http_requests += 1
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.injected_errors += 1
+                status = self._random.choice(INJECTED_ERROR_STATUS)
+                return status, {'Retry-After': '0'}, None
+        if isinstance(payload, list):
+            return 200, {}, [self._dispatch(call) for call in payload]
+        return 200, {}, self._dispatch(payload)
+
+    def _dispatch(self, call: Dict) -> Dict:
+        method = call.get('method')
+        params = call.get('params') or []
+        with self._lock:
+            self.calls[method] += 1
+        response = {"jsonrpc": "2.0", "id": call.get('id')}
+        if method == 'getTransaction':
+            response['result'] = self._get_transaction(params[0], params[1] if len(params) > 1 else {})
+        elif method == 'getSignaturesForAddress':
+            response['result'] = self._get_signatures(params[0], params[1] if len(params) > 1 else {})
+        elif method == 'getMultipleAccounts':
+            response['result'] = {"context": {"slot": 0}, "value": [None for _ in params[0]]}
+        else:
+            response['error'] = {"code": -32601, "message": f"回放模式不支持的方法: {method}"}
+        return response
+
+    def _get_transaction(self, signature: str, options: Dict) -> Optional[Dict]:
+        """按请求的编码返回交易，录制文件为 jsonParsed，请求 json 编码时转换后返回"""
+        txn = self.transactions.get(signature)
+        if txn is None or options.get('encoding') != 'json':
+            return txn
+        converted = self._json_encoded.get(signature)
+        if converted is None:
+            converted = self._json_encoded[signature] = to_json_encoding(txn)
+        return converted
+
+    def _get_signatures(self, address: str, options: Dict) -> List[Dict]:
+        records = self.address_signatures.get(address, [])
+        start = 0
+        if options.get('before'):
+            start = next((i + 1 for i, record in enumerate(records) if record['signature'] == options['before']),
+                         len(records))
+        end = len(records)
+        if options.get('until'):
+            end = next((i for i, record in enumerate(records) if record['signature'] == options['until']), end)
+        limit = options.get('limit', 1000)
+        return [dict(record) for record in records[start:min(end, start + limit)]]
+
+
+class ReplayResponse:
+    """与 requests.Response 兼容的最小响应对象"""
+
+    def __init__(self, status_code: int, headers: Dict[str, str], body):
+        self.status_code = status_code
+        self.headers = headers
+        self._body = body
+        self.content = json.dumps(body).encode('utf-8') if body is not None else b''
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} 回放注入错误", response=self)
+
+
+class ReplaySession:
+    """替代 requests.Session 的回放会话，可以直接传给 RpcClient"""
+
+    def __init__(self, backend: Optional[ReplayBackend] = None):
+        self.backend = backend or get_default_backend()
+        self.headers: Dict[str, str] = {}
+        self.proxies: Dict[str, str] = {}
+
+    def post(self, url: str, json=None, timeout=None, **kwargs) -> ReplayResponse:
+        delay = self.backend.sample_latency()
+        if delay:
+            time.sleep(delay)
+        return ReplayResponse(*self.backend.handle(json))
+
+    def close(self):
+        pass
+
+
+class AsyncReplayTransport:
+    """异步追踪器使用的回放传输，接口与 async_tracker.AiohttpTransport 相同
+
+    响应体同样经过 JSON 编码和解码，与真实节点一样返回独立的对象并统计响应字节数。
+    ws_connect 返回回放录制签名的订阅流（见 ReplayWebSocket），实时监控也可以离线运行。
+    """
+
+    def __init__(self, backend: Optional[ReplayBackend] = None):
+        self.backend = backend or get_default_backend()
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def post(self, url: str, payload) -> Tuple[int, Dict, Optional[Any], Optional[int]]:
+        delay = self.backend.sample_latency()
+        if delay:
+            await asyncio.sleep(delay)
+        status, headers, body = self.backend.handle(payload)
+        if status >= 400:
+            return status, headers, None, None
+        content = json.dumps(body).encode('utf-8')
+        return status, headers, json_loads(content), len(content)
+
+    def ws_connect(self, url: str, **kwargs) -> "ReplayWebSocket":
+        return ReplayWebSocket(self.backend)
+
+
+class ReplayWebSocket:
+    """回放模式下的 WebSocket 连接，接口与 aiohttp 的 ClientWebSocketResponse 中监控用到的部分相同
+
+    支持 logsSubscribe：确认订阅后按时间顺序（从旧到新）把录制的该地址的全部签名作为
+    logsNotification 推送，每条之间按回放后端的延迟设置等待，推送完后保持连接直到关闭。
+    """
+
+    def __init__(self, backend: ReplayBackend):
+        self.backend = backend
+        self._queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._subscriptions = 0
+        self.closed = False
+
+    async def __aenter__(self) -> "ReplayWebSocket":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def send_json(self, message: Dict):
+        if message.get('method') != 'logsSubscribe':
+            await self._put({"jsonrpc": "2.0", "id": message.get('id'),
+                             "error": {"code": -32601, "message": "Method not found"}})
+            return
+        address = message['params'][0]['mentions'][0]
+        self._subscriptions += 1
+        await self._put({"jsonrpc": "2.0", "id": message.get('id'), "result": self._subscriptions})
+        self._tasks.append(asyncio.ensure_future(self._stream(address, self._subscriptions)))
+
+    async def _stream(self, address: str, subscription: int):
+        for record in reversed(list(self.backend.address_signatures.get(address, []))):
+            delay = self.backend.sample_latency()
+            if delay:
+                await asyncio.sleep(delay)
+            await self._put({
+                "jsonrpc": "2.0",
+                "method": "logsNotification",
+                "params": {
+                    "subscription": subscription,
+                    "result": {
+                        "context": {"slot": record['slot']},
+                        "value": {"signature": record['signature'], "err": record.get('err'), "logs": []},
+                    },
+                },
+            })
+
+    async def _put(self, message: Dict):
+        await self._queue.put(json.dumps(message))
+
+    def __aiter__(self) -> "ReplayWebSocket":
+        return self
+
+    async def __anext__(self):
+        import aiohttp
+        data = None if self.closed else await self._queue.get()
+        if data is None:
+            raise StopAsyncIteration
+        return aiohttp.WSMessage(aiohttp.WSMsgType.TEXT, data, None)
+
+    def exception(self) -> Optional[BaseException]:
+        return None
+
+    async def close(self):
+        """关闭连接，停止推送"""
+        if self.closed:
+            return
+        self.closed = True
+        for task in self._tasks:
+            task.cancel()
+        self._queue.put_nowait(None)
+
+
+_default_backend: Optional[ReplayBackend] = None
+_default_lock = threading.Lock()
+
+def get_default_backend() -> ReplayBackend:
+    """按 RPC_REPLAY_FILE 加载的回放后端，进程内的同步和异步调用方共用，录制文件只加载一次"""
+    global _default_backend
+    with _default_lock:
+        if _default_backend is None:
+            _default_backend = ReplayBackend()
+        return _default_backend
+
+
+def serve(backend: ReplayBackend, host: str = "127.0.0.1", port: int = 8899):
+    """以 HTTP 服务的方式提供回放后端，异步模式等使用独立连接池的调用方可以指向它"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            delay = backend.sample_latency()
+            if delay:
+                time.sleep(delay)
+            status, headers, body = backend.handle(payload)
+            content = json.dumps(body).encode('utf-8') if body is not None else b''
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    logger.info(f"回放 RPC 服务已启动: http://{host}:{port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以 HTTP 服务的方式回放录制的 RPC 响应")
+    parser.add_argument("fixtures", nargs="*", help="录制文件，默认读取 RPC_REPLAY_FILE")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8899)
+    parser.add_argument("--latency-ms", type=float, default=None, help="每个请求的模拟延迟，默认读取 REPLAY_LATENCY_MS")
+    parser.add_argument("--jitter-ms", type=float, default=None, help="延迟的随机抖动范围，默认读取 REPLAY_JITTER_MS")
+    parser.add_argument("--error-rate", type=float, default=None, help="返回 429/503 的比例，默认读取 REPLAY_ERROR_RATE")
+    args = parser.parse_args()
+
+    backend = ReplayBackend(
+        paths=args.fixtures or None,
+        latency=None if args.latency_ms is None else args.latency_ms / 1000,
+        jitter=None if args.jitter_ms is None else args.jitter_ms / 1000,
+        error_rate=args.error_rate,
+    )
+    serve(backend, args.host, args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,512 @@
+import json
+import logging
+import multiprocessing
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, as_completed
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional, Set, Tuple, Union
+import requests
+from utils import json_loads, setup_logging
+from config import Config
+from metrics import Metrics, get_default_metrics
+
+logger = setup_logging()
+
+# 需要重试的 HTTP 状态码
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# 节点在响应体中返回的限流/暂时不可用错误码
+RETRYABLE_RPC_CODES = {429, -32005, -32429}
+
+class TokenBucket:
+    """线程安全的令牌桶
+
+    reserve 会立即扣除令牌（允许欠账）并返回需要等待的秒数，
+    同步调用方用 time.sleep 等待，异步调用方用 asyncio.sleep 等待，两者共用同一个预算。
+    rate 为 0 表示不限速。传入 share() 返回的共享状态时，多个进程共用同一个预算。
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, state=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        # [剩余令牌数, 上次更新时间]
+        if state is None:
+            self._state = [self.capacity, time.monotonic()]
+            self._lock = threading.Lock()
+        else:
+            self._state = state
+            self._lock = state.get_lock()
+
+    def share(self):
+        """把状态移到共享内存中并返回，传给其他进程的 TokenBucket 后共用同一个预算"""
+        with self._lock:
+            state = multiprocessing.Array('d', list(self._state))
+        self._state = state
+        self._lock = state.get_lock()
+        return state
+
+    def reserve(self, tokens: float = 1) -> float:
+        """预留令牌，返回需要等待的秒数"""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            state = self._state
+            now = time.monotonic()
+            remaining = min(self.capacity, state[0] + (now - state[1]) * self.rate) - tokens
+            state[0], state[1] = remaining, now
+            if remaining >= 0:
+                return 0.0
+            return -remaining / self.rate
+
+    def available(self) -> float:
+        """当前可用的令牌数（不扣除）"""
+        if not self.rate:
+            return float('inf')
+        with self._lock:
+            elapsed = time.monotonic() - self._state[1]
+            return min(self.capacity, self._state[0] + elapsed * self.rate)
+
+    def acquire(self, tokens: float = 1):
+        """阻塞直到令牌可用"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """同时按请求数和积分（credits）限速，对应节点套餐的两种额度"""
+
+    def __init__(self, requests_per_second: Optional[float] = None, credits_per_second: Optional[float] = None,
+                 method_credits: Optional[Dict[str, float]] = None, shared_state: Optional[Tuple] = None):
+        rps = Config.RPC_REQUESTS_PER_SECOND if requests_per_second is None else requests_per_second
+        cps = Config.RPC_CREDITS_PER_SECOND if credits_per_second is None else credits_per_second
+        requests_state, credits_state = shared_state or (None, None)
+        self.requests = TokenBucket(rps, state=requests_state)
+        self.credits = TokenBucket(cps, state=credits_state)
+        self.method_credits = Config.RPC_METHOD_CREDITS if method_credits is None else method_credits
+
+    def cost(self, payload: Union[Dict, List[Dict]]):
+        """返回请求包含的调用数和积分；批量请求中的每个调用都单独计费"""
+        calls = payload if isinstance(payload, list) else [payload]
+        credits = sum(self.method_credits.get(call.get('method'), 1) for call in calls)
+        return len(calls), credits
+
+    def share(self) -> Tuple:
+        """返回可以传给其他进程的共享状态，见 TokenBucket.share"""
+        return self.requests.share(), self.credits.share()
+
+    def reserve(self, payload: Union[Dict, List[Dict]]) -> float:
+        """为一次 HTTP 请求预留额度，返回需要等待的秒数"""
+        calls, credits = self.cost(payload)
+        return max(self.requests.reserve(calls), self.credits.reserve(credits))
+
+    def ready(self) -> bool:
+        """当前是否还有额度，不需要等待"""
+        return self.requests.available() >= 1 and self.credits.available() >= 1
+
+    def acquire(self, payload: Union[Dict, List[Dict]]):
+        wait = self.reserve(payload)
+        if wait > 0:
+            logger.debug(f"触发限速，等待 {wait:.3f} 秒")
+            time.sleep(wait)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 头，支持秒数和 HTTP 日期两种格式"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """带抖动的指数退避；服务端给出 Retry-After 时以它为下限"""
+    delay = random.uniform(0, min(Config.RPC_BACKOFF_MAX, Config.RPC_BACKOFF_BASE * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def is_retryable_response(data) -> bool:
+    """响应体中的限流错误同样需要重试"""
+    if not isinstance(data, dict):
+        return False
+    error = data.get('error')
+    return isinstance(error, dict) and error.get('code') in RETRYABLE_RPC_CODES
+
+
+def check_response(status: int, headers, data):
+    """按状态码和响应体判断请求结果：可重试的错误抛出 RetryableRpcError，其他错误状态抛出 RuntimeError"""
+    if status in RETRYABLE_STATUS:
+        raise RetryableRpcError(f"HTTP {status}", parse_retry_after(headers.get('Retry-After')))
+    if status >= 400:
+        raise RuntimeError(f"HTTP {status}")
+    if is_retryable_response(data):
+        raise RetryableRpcError(f"RPC 限流: {data['error']}")
+
+
+def build_payload(method: str, params: List, request_id: int = 1) -> Dict:
+    """构造单个 JSON-RPC 调用"""
+    return {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "method": method,
+        "params": params
+    }
+
+
+def build_batch_payload(method: str, params_list: List[List]) -> List[Dict]:
+    """把多个同方法调用合并为一个 JSON-RPC 批量请求，id 为调用在列表中的位置"""
+    return [build_payload(method, params, i) for i, params in enumerate(params_list)]
+
+
+def build_headers() -> Dict[str, str]:
+    """构造 RPC 请求头"""
+    headers = {
+        "Content-Type": "application/json"
+    }
+    if Config.QUICKNODE_API_KEY:
+        headers["Authorization"] = f"Bearer {Config.QUICKNODE_API_KEY}"
+    return headers
+
+
+def build_proxies() -> Optional[Dict[str, str]]:
+    """返回代理配置，未启用代理时返回 None"""
+    if not Config.USE_PROXY:
+        return None
+    return {
+        "http": Config.HTTP_PROXY,
+        "https": Config.HTTPS_PROXY
+    }
+
+
+class RetryableRpcError(Exception):
+    """可以换节点或退避后重试的错误"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Endpoint:
+    """一个 RPC 节点及其独立的限速器和健康统计
+
+    最近 RPC_HEALTH_WINDOW 次请求的错误率超过 RPC_UNHEALTHY_ERROR_RATE 时，
+    在 RPC_UNHEALTHY_COOLDOWN 秒内不再向该节点发送请求。
+    """
+
+    def __init__(self, url: str, weight: float = 1.0, limiter: Optional[RateLimiter] = None):
+        self.url = url
+        self.weight = weight
+        self.limiter = limiter or RateLimiter()
+        self.latency: Optional[float] = None
+        self.requests = 0
+        self.errors = 0
+        self.cooldown_until = 0.0
+        self._outcomes: deque = deque(maxlen=Config.RPC_HEALTH_WINDOW)
+        self._lock = threading.Lock()
+
+    @property
+    def error_rate(self) -> float:
+        """最近窗口内的错误率"""
+        with self._lock:
+            if not self._outcomes:
+                return 0.0
+            return 1 - sum(self._outcomes) / len(self._outcomes)
+
+    def is_healthy(self, now: Optional[float] = None) -> bool:
+        return (now or time.monotonic()) >= self.cooldown_until
+
+    def record(self, ok: bool, latency: Optional[float] = None):
+        """记录一次请求结果，更新延迟的指数移动平均和错误率"""
+        with self._lock:
+            self.requests += 1
+            self._outcomes.append(ok)
+            if ok and latency is not None:
+                self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+                return
+            self.errors += 1
+            window = len(self._outcomes)
+            if window >= min(5, self._outcomes.maxlen):
+                error_rate = 1 - sum(self._outcomes) / window
+                if error_rate >= Config.RPC_UNHEALTHY_ERROR_RATE:
+                    self.cooldown_until = time.monotonic() + Config.RPC_UNHEALTHY_COOLDOWN
+                    self._outcomes.clear()
+                    logger.warning(f"节点 {self.url} 错误率 {error_rate:.0%}，暂停使用 {Config.RPC_UNHEALTHY_COOLDOWN} 秒")
+
+    def stats(self) -> Dict:
+        return {
+            'url': self.url,
+            'weight': self.weight,
+            'requests': self.requests,
+            'errors': self.errors,
+            'error_rate': self.error_rate,
+            'latency': self.latency,
+            'healthy': self.is_healthy(),
+        }
+
+
+class RetryPlan:
+    """一次请求的节点选择和重试策略，同步和异步客户端共用
+
+    失败后优先换到还没试过的节点立即重试；所有节点都试过后清空记录，按带抖动的指数退避等待并遵守 Retry-After。
+    每次换节点和每次退避都计入 max_retries。
+    """
+
+    def __init__(self, client: "RpcClient"):
+        self.client = client
+        self.attempt = 0
+        self.tried: Set[str] = set()
+
+    def endpoint(self) -> Endpoint:
+        """本次尝试使用的节点"""
+        return self.client.select_endpoint(exclude=self.tried) or self.client.select_endpoint()
+
+    def failed(self, endpoint: Endpoint, error: RetryableRpcError) -> float:
+        """记录一次失败，返回重试前需要等待的秒数；重试次数用完时抛出这次的错误"""
+        attempt = self.attempt
+        self.attempt += 1
+        self.tried.add(endpoint.url)
+        if attempt >= self.client.max_retries:
+            logger.error(f"RPC 请求在 {self.client.max_retries} 次重试后仍然失败: {error}")
+            raise error
+        if self.client.select_endpoint(exclude=self.tried) is not None:
+            logger.warning(f"节点 {endpoint.url} 请求失败（{error}），换节点重试")
+            return 0.0
+        self.tried.clear()
+        delay = backoff_delay(attempt, error.retry_after)
+        logger.warning(f"RPC 请求失败（{error}），{delay:.2f} 秒后第 {attempt + 1} 次重试")
+        return delay
+
+
+def endpoints_from_config() -> List[Endpoint]:
+    """根据 RPC_ENDPOINTS 构造节点列表，未配置时只使用 QUICKNODE_RPC_URL 和共享限速器"""
+    if not Config.RPC_ENDPOINTS:
+        return [Endpoint(Config.QUICKNODE_RPC_URL, limiter=get_default_limiter())]
+    endpoints = []
+    for item in Config.RPC_ENDPOINTS:
+        if isinstance(item, str):
+            item = {'url': item}
+        limiter = RateLimiter(
+            requests_per_second=item.get('requests_per_second'),
+            credits_per_second=item.get('credits_per_second'),
+            shared_state=_shared_limits.get(item['url']),
+        )
+        endpoints.append(Endpoint(item['url'], weight=float(item.get('weight', 1)), limiter=limiter))
+    return endpoints
+
+
+class RpcClient:
+    """Solana JSON-RPC 客户端
+
+    使用持久的 requests.Session 复用连接，请求按权重、延迟和剩余额度分配到各个节点，
+    每个节点有独立的限速器；失败时优先换到其他健康节点，所有节点都试过后按带抖动的
+    指数退避重试并遵守 Retry-After。配置 RPC_HEDGE_DELAY 后，慢请求会在另一个节点上
+    发送一份副本，取先返回的结果。
+    """
+
+    def __init__(self, rpc_url: Optional[str] = None, limiter: Optional[RateLimiter] = None,
+                 session: Optional[requests.Session] = None, max_retries: Optional[int] = None,
+                 timeout: Optional[float] = None, endpoints: Optional[List[Endpoint]] = None,
+                 hedge_delay: Optional[float] = None, metrics: Optional[Metrics] = None):
+        if endpoints is None:
+            if rpc_url:
+                endpoints = [Endpoint(rpc_url, limiter=limiter or get_default_limiter())]
+            else:
+                endpoints = endpoints_from_config()
+        self.endpoints = endpoints
+        self.session = session or requests.Session()
+        self.session.headers.update(build_headers())
+        proxies = build_proxies()
+        if proxies:
+            self.session.proxies.update(proxies)
+        self.max_retries = Config.RPC_MAX_RETRIES if max_retries is None else max_retries
+        self.timeout = timeout or Config.RPC_TIMEOUT
+        self.hedge_delay = Config.RPC_HEDGE_DELAY if hedge_delay is None else hedge_delay
+        self.metrics = metrics or get_default_metrics()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def rpc_url(self) -> str:
+        """主节点地址"""
+        return self.endpoints[0].url
+
+    def select_endpoint(self, exclude: Optional[Set[str]] = None) -> Optional[Endpoint]:
+        """选择一个节点：优先健康且当前还有额度的节点，按权重和延迟加权随机
+
+        全部节点都在冷却时返回最先恢复的节点；exclude 排除后没有可选节点时返回 None。
+        """
+        exclude = exclude or set()
+        candidates = [e for e in self.endpoints if e.url not in exclude]
+        if not candidates:
+            return None
+        now = time.monotonic()
+        healthy = [e for e in candidates if e.is_healthy(now)]
+        if not healthy:
+            return min(candidates, key=lambda e: e.cooldown_until)
+        ready = [e for e in healthy if e.limiter.ready()] or healthy
+        if len(ready) == 1:
+            return ready[0]
+        # 延迟越低分到的请求越多，未测得延迟的节点按 0 处理以便尽快探测
+        weights = [e.weight / ((e.latency or 0.0) + 0.05) for e in ready]
+        return random.choices(ready, weights=weights)[0]
+
+    def endpoint_stats(self) -> List[Dict]:
+        """各节点的请求数、错误率和平均延迟"""
+        return [endpoint.stats() for endpoint in self.endpoints]
+
+    @property
+    def hedging(self) -> bool:
+        """是否启用请求对冲：配置了 hedge_delay 且有多个节点"""
+        return bool(self.hedge_delay) and len(self.endpoints) > 1
+
+    def call(self, method: str, params: List) -> Dict:
+        """发送单个 RPC 请求，返回完整的 JSON-RPC 响应"""
+        payload = build_payload(method, params)
+        logger.debug(f"发送 RPC 请求: {method}")
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug(f"请求参数: {json.dumps(params, indent=2)}")
+        result = self._post(payload)
+        if debug:
+            logger.debug(f"RPC 响应: {json.dumps(result, indent=2)}")
+        return result
+
+    def batch(self, method: str, params_list: List[List]) -> List[Dict]:
+        """把多个同方法调用合并为一个 JSON-RPC 批量请求，id 为调用在列表中的位置"""
+        payload = build_batch_payload(method, params_list)
+        logger.debug(f"发送批量 RPC 请求: {method} x {len(params_list)}")
+        return self._post(payload)
+
+    def record_metrics(self, endpoint: Endpoint, payload: Union[Dict, List[Dict]], seconds: Optional[float],
+                       ok: bool, size: Optional[int] = None):
+        """记录一次请求的方法、节点、延迟、响应大小和积分，异步追踪器同样使用"""
+        self.metrics.record_rpc(endpoint.url, payload, seconds, ok, size, endpoint.limiter.cost(payload)[1])
+
+    def record_result(self, endpoint: Endpoint, payload: Union[Dict, List[Dict]], seconds: Optional[float],
+                      ok: bool, size: Optional[int] = None):
+        """更新节点的健康统计并记录指标；seconds 为 None 表示请求没有完成"""
+        endpoint.record(ok, seconds)
+        self.record_metrics(endpoint, payload, seconds, ok, size)
+
+    def reserve(self, endpoint: Endpoint, payload: Union[Dict, List[Dict]]) -> float:
+        """在节点的限速器上预留额度，返回需要等待的秒数，由调用方用 time.sleep 或 asyncio.sleep 等待"""
+        wait = endpoint.limiter.reserve(payload)
+        if wait > 0:
+            logger.debug(f"触发限速，等待 {wait:.3f} 秒")
+            self.metrics.observe('stage_seconds', wait, stage='rate_limit')
+        return wait
+
+    def _send(self, endpoint: Endpoint, payload: Union[Dict, List[Dict]], reserved: bool = False):
+        """向指定节点发送一次请求并记录结果，reserved 表示调用方已经预留过限速额度"""
+        if not reserved:
+            wait = self.reserve(endpoint, payload)
+            if wait > 0:
+                time.sleep(wait)
+        start = time.monotonic()
+        size = None
+        try:
+            response = self.session.post(endpoint.url, json=payload, timeout=self.timeout)
+            data = None
+            if response.status_code < 400:
+                size = len(response.content)
+                data = json_loads(response.content)
+            check_response(response.status_code, response.headers, data)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            self.record_result(endpoint, payload, None, False)
+            raise RetryableRpcError(str(e)) from e
+        except Exception:
+            self.record_result(endpoint, payload, time.monotonic() - start, False, size)
+            raise
+        self.record_result(endpoint, payload, time.monotonic() - start, True, size)
+        return data
+
+    def _send_hedged(self, endpoint: Endpoint, payload: Union[Dict, List[Dict]]):
+        """超过 hedge_delay 仍未返回时，在另一个节点上发送副本，取先成功的结果"""
+        if not self.hedging:
+            return self._send(endpoint, payload)
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=Config.MAX_CONCURRENT_REQUESTS * 2,
+                                                thread_name_prefix="rpc-hedge")
+        # 先在限速器上排队，对冲计时从请求真正发出时开始
+        wait = self.reserve(endpoint, payload)
+        if wait > 0:
+            time.sleep(wait)
+        primary = self._executor.submit(self._send, endpoint, payload, True)
+        try:
+            return primary.result(timeout=self.hedge_delay)
+        except FutureTimeout:
+            pass
+
+        backup_endpoint = self.select_endpoint(exclude={endpoint.url})
+        # 备用节点也没有额度时副本只会继续排队，限速时反而成倍增加请求
+        if backup_endpoint is None or not backup_endpoint.limiter.ready():
+            return primary.result()
+        logger.debug(f"节点 {endpoint.url} 超过 {self.hedge_delay} 秒未响应，向 {backup_endpoint.url} 发送副本")
+        backup = self._executor.submit(self._send, backup_endpoint, payload)
+
+        last_error: Optional[BaseException] = None
+        for future in as_completed([primary, backup]):
+            try:
+                return future.result()
+            except Exception as e:
+                last_error = e
+        raise last_error
+
+    def _post(self, payload: Union[Dict, List[Dict]]):
+        """发送请求，失败时按 RetryPlan 换节点或退避后重试"""
+        plan = RetryPlan(self)
+        while True:
+            endpoint = plan.endpoint()
+            try:
+                return self._send_hedged(endpoint, payload)
+            except RetryableRpcError as e:
+                delay = plan.failed(endpoint, e)
+            if delay:
+                time.sleep(delay)
+
+
+_default_limiter: Optional[RateLimiter] = None
+_default_client: Optional[RpcClient] = None
+_default_lock = threading.RLock()
+# 节点地址 -> 父进程共享的限速状态，多进程扫描时由 install_shared_limits 设置
+_shared_limits: Dict[str, Tuple] = {}
+
+def get_default_limiter() -> RateLimiter:
+    """进程内所有 RPC 调用方共享的限速器"""
+    global _default_limiter
+    with _default_lock:
+        if _default_limiter is None:
+            _default_limiter = RateLimiter(shared_state=_shared_limits.get(Config.QUICKNODE_RPC_URL))
+        return _default_limiter
+
+def create_shared_limits() -> Dict[str, Tuple]:
+    """为每个配置的节点创建跨进程共享的限速状态，在启动进程池之前调用"""
+    return {endpoint.url: endpoint.limiter.share() for endpoint in endpoints_from_config()}
+
+def install_shared_limits(limits: Dict[str, Tuple]):
+    """在子进程中使用父进程的限速状态，所有进程共用同一份全局额度"""
+    global _shared_limits
+    _shared_limits = limits
+
+def get_default_client() -> RpcClient:
+    """进程内共享的 RPC 客户端"""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            if Config.RPC_REPLAY_FILE:
+                from replay import ReplaySession
+                logger.info(f"回放模式: 使用录制文件 {Config.RPC_REPLAY_FILE} 代替 RPC 节点")
+                _default_client = RpcClient(session=ReplaySession())
+            else:
+                _default_client = RpcClient()
+        return _default_client
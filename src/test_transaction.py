@@ -1,45 +1,27 @@
 import json
-import pandas as pd
 from typing import Dict, Optional
 from utils import setup_logging
-from config import Config
-import requests
+from rpc_client import RpcClient, get_default_client
 
 logger = setup_logging()
 
 class TransactionParser:
-    def __init__(self):
-        self.rpc_url = Config.QUICKNODE_RPC_URL
-        self.headers = {
-            "Content-Type": "application/json"
-        }
-        if Config.QUICKNODE_API_KEY:
-            self.headers["Authorization"] = f"Bearer {Config.QUICKNODE_API_KEY}"
+    def __init__(self, client: Optional[RpcClient] = None):
+        self.client = client or get_default_client()
+        self.rpc_url = self.client.rpc_url
 
     def _make_rpc_request(self, signature: str) -> Dict:
         """获取单个交易的详细信息"""
-        payload = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "getTransaction",
-            "params": [
-                signature,
-                {
-                    "encoding": "jsonParsed",
-                    "maxSupportedTransactionVersion": 0
-                }
-            ]
-        }
+        params = [
+            signature,
+            {
+                "encoding": "jsonParsed",
+                "maxSupportedTransactionVersion": 0
+            }
+        ]
         
         try:
-            response = requests.post(
-                self.rpc_url, 
-                headers=self.headers, 
-                json=payload,
-                timeout=30
-            )
-            response.raise_for_status()
-            result = response.json()
+            result = self.client.call("getTransaction", params)
             return result.get('result', {})
         except Exception as e:
             logger.error(f"获取交易详情失败: {str(e)}")
@@ -1,35 +1,20 @@
-import requests
-import json
-from config import Config
 from utils import setup_logging
+from rpc_client import get_default_client
 
 logger = setup_logging()
 
 def get_transfer_info(signature: str):
     """获取单个交易的转账信息"""
-    rpc_url = Config.QUICKNODE_RPC_URL
-    headers = {"Content-Type": "application/json"}
-    
-    if Config.QUICKNODE_API_KEY:
-        headers["Authorization"] = f"Bearer {Config.QUICKNODE_API_KEY}"
-        
-    payload = {
-        "jsonrpc": "2.0",
-        "id": 1,
-        "method": "getTransaction",
-        "params": [
-            signature,
-            {
-                "encoding": "jsonParsed",
-                "maxSupportedTransactionVersion": 0
-            }
-        ]
-    }
+    params = [
+        signature,
+        {
+            "encoding": "jsonParsed",
+            "maxSupportedTransactionVersion": 0
+        }
+    ]
     
     try:
-        response = requests.post(rpc_url, headers=headers, json=payload, timeout=30)
-        response.raise_for_status()
-        result = response.json().get('result', {})
+        result = get_default_client().call("getTransaction", params).get('result', {})
         
         if not result or 'meta' not in result:
             print("未找到交易记录")
@@ -0,0 +1,185 @@
+import csv
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from utils import setup_logging
+from config import Config
+from tracker import PAGE_REACHED, SignaturePager, WalletTracker
+from balance_diff import owner_deltas, token_balance_deltas
+
+logger = setup_logging()
+
+# 出现在超过这个比例的已扫描交易中的地址视为池子 / 联合曲线，不参与排名
+POOL_PARTICIPATION = 0.5
+# 扫描的交易数不足时不做池子判断
+POOL_MIN_TRANSACTIONS = 10
+
+RECEIVER_FIELDS = [
+    'address', 'first_slot', 'slot_offset', 'first_block_time', 'first_signature',
+    'received', 'received_raw', 'sent_raw', 'transactions', 'early_rank', 'size_rank',
+]
+
+class TokenScanResult:
+    """代币早期接收方的统计结果"""
+
+    def __init__(self, mint: str):
+        self.mint = mint
+        # 最早一笔交易的付费账户，通常就是部署者
+        self.creator: Optional[str] = None
+        self.first_slot: Optional[int] = None
+        self.decimals = 0
+        self.scanned = 0
+        # 签名分页是否到达了代币的第一笔交易
+        self.reached_origin = False
+        # 分页获取到的签名总数
+        self.signatures = 0
+        # 地址 -> 统计信息，按首次接收的先后顺序插入
+        self.receivers: Dict[str, Dict] = {}
+        # 地址 -> 出现过余额变化的交易数
+        self.participation: Dict[str, int] = {}
+
+    def add(self, txn: Dict, deltas: Dict[str, int], decimals: Optional[int] = None):
+        """按时间顺序加入一笔交易，deltas 为 owner -> 原始单位的净变化"""
+        slot = txn.get('slot', 0)
+        signature = txn['transaction']['signatures'][0]
+        self.scanned += 1
+        if self.first_slot is None:
+            self.first_slot = slot
+            message = txn['transaction'].get('message', {})
+            keys = message.get('accountKeys') or []
+            if keys:
+                self.creator = keys[0]['pubkey'] if isinstance(keys[0], dict) else keys[0]
+        if decimals is not None:
+            self.decimals = decimals
+        for owner, delta in deltas.items():
+            self.participation[owner] = self.participation.get(owner, 0) + 1
+            stats = self.receivers.get(owner)
+            if stats is None:
+                if delta <= 0:
+                    continue
+                stats = self.receivers[owner] = {
+                    'address': owner,
+                    'first_slot': slot,
+                    'slot_offset': slot - self.first_slot,
+                    'first_block_time': txn.get('blockTime'),
+                    'first_signature': signature,
+                    'received_raw': 0,
+                    'sent_raw': 0,
+                }
+            if delta > 0:
+                stats['received_raw'] += delta
+            else:
+                stats['sent_raw'] -= delta
+
+    @property
+    def truncated(self) -> bool:
+        """签名超过上限、没有从创建开始扫描：creator、first_slot 和 slot_offset 只相对于已扫描的最早交易"""
+        return not self.reached_origin
+
+    def first_block_buyers(self) -> int:
+        """在第一个 slot 就收到代币的地址数，与排名一样排除池子"""
+        return sum(1 for stats in self.candidates() if stats['slot_offset'] == 0)
+
+    def pools(self) -> List[str]:
+        """几乎参与每一笔交易的地址（池子、联合曲线）"""
+        if self.scanned < POOL_MIN_TRANSACTIONS:
+            return []
+        return [
+            address for address, count in self.participation.items()
+            if count > self.scanned * POOL_PARTICIPATION
+        ]
+
+    def candidates(self) -> List[Dict]:
+        """排除池子后的接收方统计，按首次接收的先后顺序"""
+        pools = set(self.pools())
+        return [stats for address, stats in self.receivers.items() if address not in pools]
+
+    def ranking(self) -> List[Dict]:
+        """排除池子后的接收方，按首次接收时间排序，并附上按接收总量的名次"""
+        rows = [dict(stats) for stats in self.candidates()]
+        for rank, row in enumerate(sorted(rows, key=lambda row: -row['received_raw']), 1):
+            row['size_rank'] = rank
+        for rank, row in enumerate(rows, 1):
+            row['early_rank'] = rank
+            row['transactions'] = self.participation[row['address']]
+            row['received'] = row['received_raw'] / 10 ** self.decimals
+        return rows
+
+    def export_csv(self, path: str):
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=RECEIVER_FIELDS)
+            writer.writeheader()
+            writer.writerows(self.ranking())
+
+
+class TokenScanner:
+    """从代币出发寻找最早的买家和大额接收方，作为开发者钱包的候选
+
+    getSignaturesForAddress 只能从新到旧分页，因此先沿代币地址翻到第一笔交易（最多
+    TOKEN_SCAN_MAX_SIGNATURES 条），分页时只保留最早的 TOKEN_SCAN_MAX_TRANSACTIONS 个成功交易的签名，
+    再从创建时刻开始按时间顺序并行获取交易，用余额变化统计每个地址首次收到代币的 slot 和累计数量。
+    签名超过上限时无法到达创建时刻，结果的 truncated 为 True。
+    第一个 slot 内收到代币的地址数达到 TOKEN_SCAN_FIRST_BUYERS 后提前停止。
+    """
+
+    def __init__(self, tracker: Optional[WalletTracker] = None, max_signatures: Optional[int] = None,
+                 max_transactions: Optional[int] = None, first_buyers: Optional[int] = None,
+                 max_workers: Optional[int] = None):
+        self.tracker = tracker or WalletTracker()
+        self.max_signatures = max_signatures or Config.TOKEN_SCAN_MAX_SIGNATURES
+        self.max_transactions = max_transactions or Config.TOKEN_SCAN_MAX_TRANSACTIONS
+        self.first_buyers = first_buyers if first_buyers is not None else Config.TOKEN_SCAN_FIRST_BUYERS
+        self.max_workers = max_workers or Config.CRAWL_WORKERS
+
+    def _fetch_batch(self, signatures: List[str], mint: str) -> List[Dict]:
+        try:
+            txns = self.tracker.get_parsed_transactions(signatures)
+            self.tracker.resolve_token_accounts(txns, {mint})
+            return txns
+        except Exception as e:
+            logger.error(f"获取代币 {mint} 的交易失败: {str(e)}")
+            return []
+
+    def scan(self, mint: str) -> TokenScanResult:
+        """扫描代币从创建开始的交易，返回接收方统计"""
+        result = TokenScanResult(mint)
+        pager = SignaturePager(max_count=self.max_signatures, keep=False)
+        # 从新到旧分页，队列满后较新的签名从左端丢弃，最后剩下的就是最早的成功交易
+        oldest: deque = deque(maxlen=self.max_transactions)
+        for page in self.tracker.iter_signature_pages(mint, pager):
+            oldest.extend(record.signature for record in page if not record.failed)
+        result.signatures = pager.count
+        result.reached_origin = pager.status == PAGE_REACHED
+        if result.truncated:
+            logger.warning(f"代币 {mint} 的签名超过 {self.max_signatures} 条，未能翻到第一笔交易，"
+                           f"结果从已获取的最早签名开始，不是从创建开始")
+        signatures = list(reversed(oldest))
+        logger.info(f"代币 {mint} 共 {pager.count} 条签名，按时间顺序扫描前 {len(signatures)} 笔成功交易")
+
+        batches = self.tracker.batch_signatures(signatures, Config.BATCH_SIZE)
+        resolved = self.tracker.owner_resolver.accounts
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # 每轮并行获取 max_workers 批，按时间顺序解析后再判断是否可以停止
+            for start in range(0, len(batches), self.max_workers):
+                rounds = batches[start:start + self.max_workers]
+                for txns in executor.map(lambda batch: self._fetch_batch(batch, mint), rounds):
+                    for txn in txns:
+                        self._add_transaction(result, txn, mint, resolved)
+                # 交易数不足时还无法识别池子，不提前停止，避免把池子算作买家
+                found = result.first_block_buyers()
+                if self.first_buyers and result.scanned >= POOL_MIN_TRANSACTIONS and found >= self.first_buyers:
+                    logger.info(f"第一个 slot 已找到 {found} 个买家，停止扫描")
+                    break
+
+        logger.info(f"代币 {mint} 扫描完成: {result.scanned} 笔交易, {len(result.receivers)} 个接收方")
+        return result
+
+    def _add_transaction(self, result: TokenScanResult, txn: Dict, mint: str, resolved: Dict):
+        if (txn.get('meta') or {}).get('err') is not None:
+            return
+        deltas = token_balance_deltas(txn, {mint}, resolved).get(mint) or []
+        totals = {
+            owner: delta for owner, delta in owner_deltas(deltas).items()
+            if delta and not self.tracker.is_protocol_address(owner)
+        }
+        result.add(txn, totals, deltas[0]['decimals'] if deltas else None)
@@ -1,319 +1,729 @@
-import requests
-import json
-import pandas as pd
-from typing import List, Dict, Optional
+import queue
+import threading
+from typing import Callable, Iterator, List, Dict, NamedTuple, Optional, Set, Tuple
 from utils import is_valid_solana_address, setup_logging
 from config import Config
-from functools import lru_cache
-from concurrent.futures import ThreadPoolExecutor
+from tx_store import SignatureRecord, TransactionStore
+from transfer_db import TransferDB
+from output import to_dataframe
+from balance_diff import NATIVE_SOL, SOL_DECIMALS, owner_deltas, sol_balance_deltas, token_balance_deltas
+from instructions import spl_transfers, system_transfers, token_account_addresses, unknown_token_accounts
+from owner_resolver import OwnerResolver
+from metrics import get_default_metrics
+from address_registry import AddressRegistry, get_default_registry
+from rpc_client import RpcClient, build_headers, build_proxies, get_default_client
 
 logger = setup_logging()
 
+# getSignaturesForAddress 单页最多返回 1000 条
+SIGNATURE_PAGE_LIMIT = 1000
+# 签名分页的结束原因：到达 until 或历史起点、早于时间窗口起点、达到条数上限
+PAGE_REACHED = 'reached'
+PAGE_WINDOW = 'window'
+PAGE_LIMIT = 'limit'
+# lean 模式下从交易中丢弃的 meta 字段
+TRIMMED_META_FIELDS = ('logMessages', 'rewards')
+
+# 流水线结束标记
+_PIPELINE_DONE = object()
+
+class SignatureWindow(NamedTuple):
+    """签名过滤条件：时间窗口 [start_time, end_time]（Unix 秒）以及是否跳过执行失败的交易
+
+    只使用 getSignaturesForAddress 返回的 blockTime / err，在获取交易之前完成过滤；
+    没有 blockTime 的签名保留。
+    """
+    start_time: Optional[int] = None
+    end_time: Optional[int] = None
+    skip_failed: bool = False
+
+    def matches(self, record: SignatureRecord) -> bool:
+        if self.skip_failed and record.failed:
+            return False
+        if record.block_time is None:
+            return True
+        if self.start_time and record.block_time < self.start_time:
+            return False
+        if self.end_time and record.block_time > self.end_time:
+            return False
+        return True
+
+    def passed(self, record: SignatureRecord) -> bool:
+        """签名早于窗口起点；分页从新到旧，之后的签名只会更早"""
+        return bool(self.start_time) and record.block_time is not None and record.block_time < self.start_time
+
+
+class SignaturePager:
+    """沿 before 游标分页获取签名的状态，同步和异步追踪器共用
+
+    只决定下一页的请求参数以及何时停止，不发送请求：调用方在 status 为 None 时反复用 next_page() 的参数
+    获取一页签名并交给 add()。页数不满表示已到达 until 或历史起点（PAGE_REACHED）；
+    一页的最后一条早于时间窗口起点时为 PAGE_WINDOW，累计达到 max_count 时为 PAGE_LIMIT。
+    keep 为 False 时只计数不保留签名记录，由调用方逐页处理。
+    """
+
+    def __init__(self, before: Optional[str] = None, until: Optional[str] = None,
+                 max_count: Optional[int] = None, window: Optional[SignatureWindow] = None, keep: bool = True):
+        self.before = before
+        self.until = until
+        self.max_count = max_count or Config.MAX_TRANSACTIONS
+        self.window = window
+        self.keep = keep
+        self.items: List[SignatureRecord] = []
+        self.count = 0
+        self.status: Optional[str] = PAGE_LIMIT if self.max_count <= 0 else None
+        self._limit = 0
+
+    def next_page(self) -> Dict:
+        """下一页的 before / until / limit 参数"""
+        self._limit = min(SIGNATURE_PAGE_LIMIT, self.max_count - self.count)
+        return {'before': self.before, 'until': self.until, 'limit': self._limit}
+
+    def add(self, page: List[SignatureRecord]):
+        """加入取到的一页签名，并判断是否继续分页"""
+        if self.keep:
+            self.items.extend(page)
+        self.count += len(page)
+        logger.debug(f"获取到 {len(page)} 条签名，累计 {self.count} 条")
+        if len(page) < self._limit:
+            self.status = PAGE_REACHED
+        elif self.window is not None and self.window.passed(page[-1]):
+            logger.info("签名已早于时间窗口起点，停止分页")
+            self.status = PAGE_WINDOW
+        else:
+            self.before = page[-1].signature
+            if self.count >= self.max_count:
+                self.status = PAGE_LIMIT
+
+
+class _PipelineClosed(BaseException):
+    """调用方提前结束迭代时用于中止后台获取线程
+
+    继承 BaseException，避免被获取流程中的 except Exception 吞掉。
+    """
+
 class WalletTracker:
-    def __init__(self):
-        self.rpc_url = Config.QUICKNODE_RPC_URL
-        self.headers = {
-            "Content-Type": "application/json"
-        }
-        if Config.QUICKNODE_API_KEY:
-            self.headers["Authorization"] = f"Bearer {Config.QUICKNODE_API_KEY}"
+    def __init__(self, store: Optional[TransactionStore] = None, client: Optional[RpcClient] = None,
+                 registry: Optional[AddressRegistry] = None, transfer_db: Optional[TransferDB] = None):
+        # 默认使用进程内共享的 RPC 客户端，所有调用方共用连接池和限速预算
+        self.client = client or get_default_client()
+        self.rpc_url = self.client.rpc_url
+        self.headers = build_headers()
         self._signature_cache = {}
-        self._transaction_cache = {}
+        # 已确认的交易写入本地存储，跨运行复用
+        self.store = store if store is not None else (TransactionStore() if Config.TX_STORE_PATH else None)
+        # 解析出的转账记录累积到本地转账数据库，供跨钱包查询
+        self.transfer_db = transfer_db if transfer_db is not None else (
+            TransferDB() if Config.TRANSFER_DB_PATH else None)
+        # 重试后仍未能获取的签名
+        self.failed_signatures: Set[str] = set()
+        # 需要过滤的协议地址等标签索引，进程内共享
+        self.registry = registry or get_default_registry()
+        # 代币账户 -> owner 的解析结果，持久化在本地存储中
+        self.owner_resolver = OwnerResolver(self.store)
+        # RPC、缓存和各阶段耗时的统计，进程内共享
+        self.metrics = get_default_metrics()
+        # 查询使用的确认级别，None 表示节点默认（finalized）；实时监控使用 confirmed
+        self.commitment: Optional[str] = None
+
+    def _get_proxies(self) -> Optional[Dict[str, str]]:
+        """返回代理配置，未启用代理时返回 None"""
+        return build_proxies()
 
     def _make_rpc_request(self, method: str, params: List) -> Dict:
         """发送 RPC 请求到 Solana 节点"""
-        payload = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": method,
-            "params": params
-        }
-        
-        logger.info(f"发送 RPC 请求: {method}")
-        logger.debug(f"请求参数: {json.dumps(params, indent=2)}")
-        
-        proxies = None
-        if Config.USE_PROXY:
-            proxies = {
-                "http": Config.HTTP_PROXY,
-                "https": Config.HTTPS_PROXY
-            }
-        
         try:
-            response = requests.post(
-                self.rpc_url, 
-                headers=self.headers, 
-                json=payload,
-                proxies=proxies,
-                timeout=30
-            )
-            response.raise_for_status()
-            result = response.json()
-            logger.debug(f"RPC 响应: {json.dumps(result, indent=2)}")
-            return result
+            return self.client.call(method, params)
         except Exception as e:
             logger.error(f"RPC 请求失败: {str(e)}")
             raise
 
-    def _get_transaction_signatures(self, wallet_address: str) -> List[str]:
-        """获取地址的交易签名列表"""
-        params = [
-            wallet_address,
-            {
-                "limit": 100  # 调试阶段只获取最近100条
-            }
-        ]
-        
+    def signature_page_params(self, address: str, before: Optional[str] = None,
+                               until: Optional[str] = None, limit: int = SIGNATURE_PAGE_LIMIT) -> List:
+        """构造 getSignaturesForAddress 请求参数"""
+        options = {"limit": limit}
+        if before:
+            options["before"] = before
+        if until:
+            options["until"] = until
+        if self.commitment:
+            options["commitment"] = self.commitment
+        return [address, options]
+
+    def signature_page_result(self, result: Dict) -> List[SignatureRecord]:
+        """从 getSignaturesForAddress 的响应中取出签名记录"""
+        if 'error' in result:
+            raise RuntimeError(f"getSignaturesForAddress 返回错误: {result['error']}")
+        return [SignatureRecord.from_rpc(item) for item in result.get('result') or []]
+
+    def fetch_signature_page(self, address: str, before: Optional[str] = None,
+                              until: Optional[str] = None, limit: int = SIGNATURE_PAGE_LIMIT) -> List[SignatureRecord]:
+        """获取一页签名记录（从新到旧）"""
+        with self.metrics.stage('signatures'):
+            result = self._make_rpc_request("getSignaturesForAddress",
+                                            self.signature_page_params(address, before, until, limit))
+        return self.signature_page_result(result)
+
+    def paginate_signatures(self, address: str, before: Optional[str] = None, until: Optional[str] = None,
+                             max_count: Optional[int] = None,
+                             on_page: Optional[Callable[[List[str]], None]] = None,
+                             window: Optional[SignatureWindow] = None) -> Tuple[List[SignatureRecord], str]:
+        """沿 before 游标向更早的交易分页，返回签名记录以及结束原因（PAGE_REACHED / PAGE_WINDOW / PAGE_LIMIT）
+
+        每取到一页就把窗口内的签名通过 on_page 交给调用方，调用方可以立即开始处理这一页；
+        一页的最后一条早于窗口起点时停止分页。
+        """
+        pager = SignaturePager(before, until, max_count, window)
+        for page in self.iter_signature_pages(address, pager):
+            if on_page and page:
+                on_page(self.filter_signatures(page, window))
+        return pager.items, pager.status
+
+    def iter_signature_pages(self, address: str, pager: SignaturePager) -> Iterator[List[SignatureRecord]]:
+        """按 pager 的参数逐页获取签名（从新到旧），结束后 pager.status 为结束原因"""
+        while pager.status is None:
+            page = self.fetch_signature_page(address, **pager.next_page())
+            pager.add(page)
+            yield page
+
+    def _get_transaction_signatures(self, wallet_address: str,
+                                    on_page: Optional[Callable[[List[str]], None]] = None,
+                                    window: Optional[SignatureWindow] = None) -> List[str]:
+        """获取地址的交易签名列表（从新到旧，最多 MAX_TRANSACTIONS 条），只返回窗口内的签名
+
+        启用本地存储时只获取上次高水位之后的新签名，并在未扫到历史起点时继续向前补齐。
+        """
+        max_count = Config.MAX_TRANSACTIONS
+        if self.store is None:
+            try:
+                items, _ = self.paginate_signatures(wallet_address, max_count=max_count, on_page=on_page,
+                                                     window=window)
+                return self.filter_signatures(items, window)
+            except Exception as e:
+                logger.error(f"获取交易签名失败: {str(e)}")
+                return []
+                
         try:
-            result = self._make_rpc_request("getSignaturesForAddress", params)
-            signatures = []
-            if 'result' in result:
-                for item in result['result']:
-                    sig = item.get('signature')
-                    signatures.append(sig)
-                    logger.info(f"获取到签名: {sig}")
-            return signatures
+            self._update_newer_signatures(wallet_address, max_count, on_page, window)
+            self._backfill_older_signatures(wallet_address, max_count, on_page, window)
         except Exception as e:
             logger.error(f"获取交易签名失败: {str(e)}")
-            return []
+            
+        return self.stored_signatures(wallet_address, max_count, window)
 
-    def _batch_signatures(self, signatures: List[str], batch_size: int = 50) -> List[List[str]]:
+    def _update_newer_signatures(self, wallet_address: str, max_count: int,
+                                 on_page: Optional[Callable[[List[str]], None]] = None,
+                                 window: Optional[SignatureWindow] = None):
+        """获取高水位之后的新签名"""
+        until = self.newest_stored_signature(wallet_address)
+        if not until:
+            return
+        newer, status = self.paginate_signatures(
+            wallet_address, until=until, max_count=max_count, on_page=on_page, window=window
+        )
+        self.save_newer_signatures(wallet_address, newer, status)
+
+    def _backfill_older_signatures(self, wallet_address: str, max_count: int,
+                                   on_page: Optional[Callable[[List[str]], None]] = None,
+                                   window: Optional[SignatureWindow] = None):
+        """首次扫描或历史未扫完时，沿最旧签名继续向前分页"""
+        plan = self.backfill_plan(wallet_address, max_count)
+        if plan is None:
+            return
+        before, remaining, has_newest = plan
+        older, status = self.paginate_signatures(
+            wallet_address, before=before, max_count=remaining, on_page=on_page, window=window
+        )
+        self.save_older_signatures(wallet_address, older, status, has_newest)
+
+    # 以下签名游标的读取和更新不发送请求，异步追踪器同样使用
+
+    def newest_stored_signature(self, wallet_address: str) -> Optional[str]:
+        """钱包的高水位签名，没有记录时返回 None"""
+        cursor = self.store.get_wallet_cursor(wallet_address)
+        return cursor['newest'] if cursor else None
+
+    def save_newer_signatures(self, wallet_address: str, newer: List[SignatureRecord], status: str):
+        """保存高水位之后的新签名，与旧记录连续时推进高水位"""
+        if not newer:
+            return
+        if status == PAGE_REACHED:
+            self.store.save_wallet_signatures(wallet_address, newer, newest=newer[0].signature)
+            logger.info(f"钱包 {wallet_address} 新增 {len(newer)} 条签名")
+        elif status == PAGE_WINDOW:
+            # 时间窗口使分页在到达高水位之前停止，中间还有未获取的签名：只保存取到的签名，游标保持不变，
+            # 下次不带窗口的运行仍从原来的高水位补齐
+            self.store.save_wallet_signatures(wallet_address, newer)
+        else:
+            # 新签名已超过上限，与旧记录之间存在空洞，重新建立扫描窗口
+            self.store.reset_wallet(wallet_address)
+            self.store.save_wallet_signatures(
+                wallet_address, newer,
+                newest=newer[0].signature, oldest=newer[-1].signature, complete=False
+            )
+
+    def backfill_plan(self, wallet_address: str, max_count: int) -> Optional[Tuple[Optional[str], int, bool]]:
+        """需要向前补齐时返回 (before, 最多获取的条数, 是否已有高水位)，历史已扫完或已达上限时返回 None"""
+        cursor = self.store.get_wallet_cursor(wallet_address)
+        has_newest = bool(cursor and cursor['newest'])
+        if has_newest and cursor['complete']:
+            return None
+        remaining = max_count - self.store.count_wallet_signatures(wallet_address)
+        if remaining <= 0:
+            return None
+        return (cursor['oldest'] if cursor else None), remaining, has_newest
+
+    def save_older_signatures(self, wallet_address: str, older: List[SignatureRecord], status: str,
+                               has_newest: bool):
+        """保存向前补齐的签名，更新最旧签名和是否已扫到历史起点
+
+        补齐从最旧签名连续向前，因时间窗口提前停止时同样可以推进最旧签名，只是历史仍未扫完。
+        """
+        self.store.save_wallet_signatures(
+            wallet_address, older,
+            newest=None if has_newest else (older[0].signature if older else None),
+            oldest=older[-1].signature if older else None,
+            complete=status == PAGE_REACHED
+        )
+
+    def stored_signatures(self, wallet_address: str, max_count: int,
+                           window: Optional[SignatureWindow] = None) -> List[str]:
+        """本地存储中钱包的签名（从新到旧），只返回窗口内的部分"""
+        return self.filter_signatures(self.store.get_wallet_signatures(wallet_address, max_count), window)
+
+    def batch_signatures(self, signatures: List[str], batch_size: int = 50) -> List[List[str]]:
         """将签名列表分批"""
         return [signatures[i:i + batch_size] for i in range(0, len(signatures), batch_size)]
 
-    def _get_parsed_transactions(self, signatures: List[str]) -> List[Dict]:
-        """获取交易的详细信息"""
-        transactions = []
-        for signature in signatures:
+    def build_transaction_params(self, signature: str) -> List:
+        """构造 getTransaction 请求参数"""
+        options = {
+            "encoding": "json" if Config.TX_FETCH_PROFILE == "lean" else "jsonParsed",
+            "maxSupportedTransactionVersion": 0
+        }
+        if self.commitment:
+            options["commitment"] = self.commitment
+        return [signature, options]
+
+    def match_batch_responses(self, signatures: List[str], responses) -> List[Optional[Dict]]:
+        """按 id 将批量响应对应回签名，失败或空数据的位置为 None"""
+        results: List[Optional[Dict]] = [None] * len(signatures)
+        # 节点对整个批量请求报错时返回的是单个对象而不是数组
+        if not isinstance(responses, list):
+            logger.warning(f"批量请求返回异常数据: {responses}")
+            return results
+            
+        for response in responses:
+            index = response.get('id') if isinstance(response, dict) else None
+            if isinstance(index, int) and 0 <= index < len(signatures) and response.get('result'):
+                results[index] = response['result']
+        return results
+
+    def _trim_transactions(self, transactions: Dict[str, Dict]) -> Dict[str, Dict]:
+        """lean 模式下丢弃解析用不到的字段（日志占响应体积的很大一部分），减少内存和本地存储占用"""
+        if Config.TX_FETCH_PROFILE != "lean":
+            return transactions
+        trimmed = {}
+        for signature, txn in transactions.items():
+            meta = txn.get('meta')
+            if meta:
+                txn = {**txn, 'meta': {key: value for key, value in meta.items() if key not in TRIMMED_META_FIELDS}}
+            trimmed[signature] = txn
+        return trimmed
+
+    def load_stored_transactions(self, signatures: List[str]) -> Dict[str, Dict]:
+        """从本地存储读取交易"""
+        if self.store is None:
+            return {}
+        try:
+            transactions = self.store.get_many(signatures)
+        except Exception as e:
+            logger.error(f"读取本地交易存储失败: {str(e)}")
+            return {}
+        self.metrics.record_cache('transactions', len(transactions), len(signatures) - len(transactions))
+        return transactions
+
+    def _save_transactions(self, transactions: Dict[str, Dict]):
+        """将新获取的交易写入本地存储
+
+        本地存储假定交易不会再变化，commitment 低于 finalized 时获取到的交易可能被回滚，不写入
+        """
+        if self.store is None or not transactions or self.commitment not in (None, 'finalized'):
+            return
+        try:
+            self.store.put_many(transactions)
+        except Exception as e:
+            logger.error(f"写入本地交易存储失败: {str(e)}")
+
+    def save_transfers(self, transfers: List[Dict]):
+        """将解析出的转账记录写入本地转账数据库，同一签名的记录覆盖旧值"""
+        if self.transfer_db is None or not transfers:
+            return
+        try:
+            with self.metrics.stage('transfer_db'):
+                self.transfer_db.upsert_many(transfers)
+        except Exception as e:
+            logger.error(f"写入转账数据库失败: {str(e)}")
+
+    def _fetch_transactions(self, signatures: List[str]) -> Dict[str, Dict]:
+        """从节点获取交易，整批签名合并为一个 JSON-RPC 批量请求"""
+        if not signatures:
+            return {}
+            
+        params_list = [self.build_transaction_params(signature) for signature in signatures]
+        
+        results: List[Optional[Dict]] = [None] * len(signatures)
+        try:
+            responses = self._batch_rpc_requests("getTransaction", params_list)
+            results = self.match_batch_responses(signatures, responses)
+        except Exception as e:
+            logger.error(f"批量获取交易详情失败: {str(e)}")
+        
+        # 只对失败或返回空数据的签名单独重试
+        for index, signature in enumerate(signatures):
+            if results[index] is not None:
+                continue
             try:
-                params = [
-                    signature,
-                    {
-                        "encoding": "jsonParsed",
-                        "maxSupportedTransactionVersion": 0
-                    }
-                ]
-                
-                result = self._make_rpc_request("getTransaction", params)
-                if result and 'result' in result and result['result']:
-                    transactions.append(result['result'])
-                    logger.debug(f"成功获取交易 {signature} 的详情")
-                else:
-                    logger.warning(f"交易 {signature} 返回空数据")
-                    
+                results[index] = self.single_transaction_result(
+                    signature, self._make_rpc_request("getTransaction", params_list[index]))
             except Exception as e:
                 logger.error(f"获取交易 {signature} 详情失败: {str(e)}")
-                continue
                 
-        return transactions
+        return self.collect_fetched(signatures, results)
+
+    def single_transaction_result(self, signature: str, result: Optional[Dict]) -> Optional[Dict]:
+        """取出单独重试的 getTransaction 响应中的交易，空数据返回 None"""
+        if result and result.get('result'):
+            logger.debug(f"重试获取交易 {signature} 成功")
+            return result['result']
+        logger.warning(f"交易 {signature} 返回空数据")
+        return None
 
-    def _parse_token_transfers(self, txn: Dict, wallet_address: str, token_address: str) -> Optional[Dict]:
+    def collect_fetched(self, signatures: List[str], results: List[Optional[Dict]]) -> Dict[str, Dict]:
+        """汇总一批签名的获取结果，重试后仍未取到的签名记录到 failed_signatures"""
+        failed = [signature for signature, txn in zip(signatures, results) if txn is None]
+        if failed:
+            self.failed_signatures.update(failed)
+            logger.warning(f"{len(failed)} 笔交易在重试后仍未获取到，已记录到 failed_signatures")
+            
+        return {
+            signature: txn
+            for signature, txn in zip(signatures, results)
+            if txn is not None
+        }
+
+    def get_parsed_transactions(self, signatures: List[str]) -> List[Dict]:
+        """获取交易的详细信息，优先读取本地存储，只向节点请求缺失的部分"""
+        if not signatures:
+            return []
+            
+        with self.metrics.stage('fetch'):
+            transactions = self.load_stored_transactions(signatures)
+            missing = [signature for signature in signatures if signature not in transactions]
+            if missing:
+                self.add_fetched(transactions, self._fetch_transactions(missing))
+            
+        return [transactions[signature] for signature in signatures if signature in transactions]
+
+    def add_fetched(self, transactions: Dict[str, Dict], fetched: Dict[str, Dict]):
+        """精简新获取的交易，写入本地存储并合并到 transactions"""
+        fetched = self._trim_transactions(fetched)
+        self._save_transactions(fetched)
+        transactions.update(fetched)
+
+    def unresolved_token_accounts(self, txns: List[Dict], token_addresses: Set[str]) -> Set[str]:
+        """一批交易中无法从余额记录得到 owner 的代币账户"""
+        candidates: Set[str] = set()
+        for txn in txns:
+            if txn:
+                candidates.update(unknown_token_accounts(txn, token_addresses))
+        return candidates
+
+    def resolve_token_accounts(self, txns: List[Dict], token_addresses: Set[str]):
+        """收集一批交易中无法从余额记录得到 owner 的代币账户，批量查询后缓存"""
+        candidates = self.unresolved_token_accounts(txns, token_addresses)
+        if not candidates:
+            return
+        try:
+            with self.metrics.stage('owners'):
+                self.owner_resolver.resolve(candidates, self._batch_rpc_requests)
+        except Exception as e:
+            logger.error(f"查询代币账户 owner 失败: {str(e)}")
+
+    def extract_transfers(self, txns: List[Dict], wallet_address: str, token_addresses: Set[str]) -> List[Dict]:
+        """解析一批交易中所有目标代币的转账记录，按交易顺序返回"""
+        transfers = []
+        for txn in txns:
+            if not txn:
+                continue
+            for records in self._parse_multi_token_transfers(txn, wallet_address, token_addresses).values():
+                for transfer in records:
+                    logger.debug(f"找到转账记录: {transfer}")
+                    transfers.append(transfer)
+        return transfers
+
+    def _parse_token_transfers(self, txn: Dict, wallet_address: str, token_address: str) -> List[Dict]:
         """解析代币转账信息，只返回主钱包作为发送方的转账"""
+        return self._parse_multi_token_transfers(txn, wallet_address, {token_address}).get(token_address, [])
+
+    def _parse_multi_token_transfers(self, txn: Dict, wallet_address: str,
+                                     token_addresses: Set[str]) -> Dict[str, List[Dict]]:
+        """一次遍历交易的代币余额，解析多个代币中主钱包作为发送方的转账，按代币返回"""
         if not txn or 'meta' not in txn:
             logger.debug("交易数据为空或没有meta数据")
-            return None
+            return {}
+        if (txn['meta'] or {}).get('err') is not None:
+            # 执行失败的交易只扣除手续费，指令中的转账没有生效
+            return {}
         
         try:
-            pre_balances = {
-                b['owner']: float(b['uiTokenAmount']['uiAmountString'])
-                for b in txn['meta'].get('preTokenBalances', [])
-                if b.get('mint') == token_address
-            }
-            
-            post_balances = {
-                b['owner']: float(b['uiTokenAmount']['uiAmountString'])
-                for b in txn['meta'].get('postTokenBalances', [])
-                if b.get('mint') == token_address
-            }
-            
-            # 如果目标钱包不在余额变化中，直接返回
-            if wallet_address not in pre_balances:
-                return None
+            with self.metrics.stage('parse'):
+                transfers = {}
+                for token_address, deltas in token_balance_deltas(txn, token_addresses, self.owner_resolver.accounts).items():
+                    records = self._build_transfers(txn, wallet_address, token_address, deltas)
+                    if records:
+                        transfers[token_address] = records
+                if NATIVE_SOL in token_addresses:
+                    records = self._build_sol_transfers(txn, wallet_address)
+                    if records:
+                        transfers[NATIVE_SOL] = records
+                return transfers
                 
-            # 计算目标钱包的余额变化
-            pre_amount = pre_balances.get(wallet_address, 0)
-            post_amount = post_balances.get(wallet_address, 0)
+        except Exception as e:
+            logger.error(f"解析代币转账失败: {str(e)}")
+            return {}
+
+    def _build_transfers(self, txn: Dict, wallet_address: str, token_address: str, deltas: List[Dict]) -> List[Dict]:
+        """根据单个代币各账户的余额变化，为每个接收方构造一条转出记录"""
+        totals = owner_deltas(deltas)
+        
+        # 只关注主钱包净转出的情况
+        if totals.get(wallet_address, 0) >= 0:
+            return []
             
-            # 只关注余额减少的情况（转出）
-            if pre_amount <= post_amount:
-                return None
-                
-            # 找到接收方地址
-            recipient = self._find_recipient(pre_balances, post_balances)
-            if not recipient or self._is_protocol_address(recipient):
-                return None
-                
-            return {
+        # 有多个发送方时，余额变化无法区分谁转给了谁，改用转账指令（含内层指令）确定接收方
+        if sum(1 for delta in totals.values() if delta < 0) > 1:
+            paired: Dict[str, int] = {}
+            for transfer in spl_transfers(txn, {token_address}, self.owner_resolver.accounts):
+                if transfer['source_owner'] == wallet_address and transfer['destination_owner']:
+                    recipient = transfer['destination_owner']
+                    paired[recipient] = paired.get(recipient, 0) + transfer['amount']
+            if paired:
+                totals = paired
+            
+        decimals = deltas[0]['decimals']
+        transfers = []
+        for recipient, received in totals.items():
+            if received <= 0 or recipient == wallet_address or self.is_protocol_address(recipient):
+                continue
+            transfers.append({
                 'timestamp': txn.get('blockTime'),
                 'from_address': wallet_address,
                 'to_address': recipient,
                 'token': token_address,
-                'amount': abs(post_amount - pre_amount)
-            }
-                
-        except Exception as e:
-            logger.error(f"解析代币转账失败: {str(e)}")
-            return None
+                'amount': received / 10 ** decimals,
+                'amount_raw': received,
+                'decimals': decimals,
+                'signature': txn['transaction']['signatures'][0]
+            })
+        return transfers
 
-    def _find_recipient(self, pre_balances: Dict[str, float], post_balances: Dict[str, float]) -> Optional[str]:
-        """找到转账接收方"""
-        for address, post_amount in post_balances.items():
-            pre_amount = pre_balances.get(address, 0)
-            if post_amount > pre_amount:
-                return address
-        return None
+    def _build_sol_transfers(self, txn: Dict, wallet_address: str) -> List[Dict]:
+        """构造主钱包转出 SOL 的记录
 
-    def _find_sender(self, pre_balances: Dict[str, float], post_balances: Dict[str, float]) -> Optional[str]:
-        """找到转账发送方"""
-        for address, pre_amount in pre_balances.items():
-            post_amount = post_balances.get(address, 0)
-            if post_amount < pre_amount:
-                return address
-        return None
+        优先使用 System Program 转账指令，能准确对应发送方和接收方；
+        没有相关指令时（例如由其他程序转出），按 lamports 余额变化找出接收方。
+        转入代币账户的 SOL 是包装 SOL（wSOL）或租金，不是转给其他人，不计入。
+        """
+        totals: Dict[str, int] = {}
+        instructions = [t for t in system_transfers(txn) if t['source'] == wallet_address]
+        if instructions:
+            token_accounts = token_account_addresses(txn)
+            for transfer in instructions:
+                destination = transfer['destination']
+                if destination in token_accounts or destination in self.owner_resolver.accounts:
+                    continue
+                totals[destination] = totals.get(destination, 0) + transfer['lamports']
+        else:
+            deltas = sol_balance_deltas(txn)
+            if deltas.get(wallet_address, 0) >= 0:
+                return []
+            totals = {address: delta for address, delta in deltas.items() if delta > 0}
+            
+        transfers = []
+        for recipient, lamports in totals.items():
+            if lamports <= 0 or recipient == wallet_address or self.is_protocol_address(recipient):
+                continue
+            transfers.append({
+                'timestamp': txn.get('blockTime'),
+                'from_address': wallet_address,
+                'to_address': recipient,
+                'token': NATIVE_SOL,
+                'amount': lamports / 10 ** SOL_DECIMALS,
+                'amount_raw': lamports,
+                'decimals': SOL_DECIMALS,
+                'signature': txn['transaction']['signatures'][0]
+            })
+        return transfers
 
-    def _parse_transaction(self, txn: Dict, wallet_address: str, token_address: str) -> Optional[Dict]:
-        """解析交易信息，提取转账详情"""
+    def _parse_transaction(self, txn: Dict, wallet_address: str, token_address: str) -> List[Dict]:
+        """按转账指令（含内层指令）解析主钱包转出的代币，每条指令一条记录"""
         if not txn or 'meta' not in txn:
-            return None
+            return []
         
         try:
-            # 检查是否包含代币转账
-            instructions = txn['transaction']['message']['instructions']
-            for ix in instructions:
-                if ix.get('program') != 'spl-token':
-                    continue
-                    
-                # 检查是否是转账操作
-                if ix['parsed']['type'] not in ['transfer', 'transferChecked']:
-                    continue
-                    
-                info = ix['parsed']['info']
-                    
-                # 检查是否是目标代币
-                if info.get('mint') != token_address:
+            transfers = []
+            for transfer in spl_transfers(txn, {token_address}, self.owner_resolver.accounts):
+                if transfer['source_owner'] != wallet_address:
                     continue
                     
                 # 过滤协议地址
-                if self._is_protocol_address(info.get('source')) or self._is_protocol_address(info.get('destination')):
+                recipient = transfer['destination_owner'] or transfer['destination']
+                if self.is_protocol_address(recipient):
                     continue
                     
                 # 构造转账记录
-                return {
+                transfers.append({
                     'timestamp': txn.get('blockTime'),
-                    'from_address': info.get('source'),
-                    'to_address': info.get('destination'),
+                    'from_address': wallet_address,
+                    'to_address': recipient,
                     'token': token_address,
-                    'amount': float(info.get('tokenAmount', {}).get('uiAmountString', 0))
-                }
+                    'amount': transfer['amount'] / 10 ** transfer['decimals'],
+                    'amount_raw': transfer['amount'],
+                    'decimals': transfer['decimals'],
+                    'signature': txn['transaction']['signatures'][0]
+                })
+            return transfers
                     
         except Exception as e:
             logger.error(f"解析交易失败: {str(e)}")
-            return None
-        
-        return None
+            return []
 
-    def _is_protocol_address(self, address: str) -> bool:
-        """检查是否是协议地址"""
-        PROTOCOL_ADDRESSES = {
-            # Raydium 相关地址
-            'RaydiumProtocolv2': '675kPX9MHTjS2zt1qfr1NYHuzeLXfQM9H24wFSUt1Mp8',
-            'RaydiumLiquidityPool': '58oQChx4yWmvKdwLLZzBi4ChoCc2fqCUWBkwMihLYQo2',
-            
-            # Pump 相关地址
-            'PumpBondingCurve': 'PumpbondingCurveAuthority11111111111111111',
-            'PumpFeeAccount': 'PumpFeeAccount111111111111111111111111111',
-            
-            # JitoTip 相关地址
-            'JitoTipAccount': 'JitoTipAccount11111111111111111111111111111'
-        }
-        
-        return address in PROTOCOL_ADDRESSES.values()
+    def is_protocol_address(self, address: str) -> bool:
+        """检查是否是需要过滤的协议地址"""
+        return self.registry.is_filtered(address)
 
     def _batch_rpc_requests(self, method: str, params_list: List[List]) -> List[Dict]:
         """批量发送 RPC 请求"""
-        payload = [
-            {
-                "jsonrpc": "2.0",
-                "id": i,
-                "method": method,
-                "params": params
-            }
-            for i, params in enumerate(params_list)
-        ]
-        
         try:
-            response = requests.post(
-                self.rpc_url,
-                headers=self.headers,
-                json=payload,
-                timeout=30
-            )
-            response.raise_for_status()
-            return response.json()
+            return self.client.batch(method, params_list)
         except Exception as e:
             logger.error(f"批量 RPC 请求失败: {str(e)}")
             raise
 
-    @lru_cache(maxsize=1000)
-    def _get_cached_transaction(self, signature: str) -> Dict:
-        """缓存交易数据"""
-        if signature not in self._transaction_cache:
-            result = self._make_rpc_request("getTransaction", [signature, {"encoding": "jsonParsed"}])
-            self._transaction_cache[signature] = result.get('result')
-        return self._transaction_cache[signature]
-
-    def _filter_signatures(self, signatures: List[str], start_time: Optional[int] = None) -> List[str]:
-        """按时间过滤签名"""
-        if not start_time:
-            return signatures
-        
-        filtered = []
-        for sig_batch in self._batch_signatures(signatures):
-            txns = self._get_parsed_transactions(sig_batch)
-            filtered.extend([
-                txn['transaction']['signatures'][0]
-                for txn in txns
-                if txn.get('blockTime', 0) >= start_time
-            ])
-        return filtered
-
-    def get_token_transfers(self, wallet_address: str, token_address: str) -> pd.DataFrame:
+    def _get_cached_transaction(self, signature: str) -> Optional[Dict]:
+        """获取单笔交易，优先读取本地存储"""
+        txns = self.get_parsed_transactions([signature])
+        return txns[0] if txns else None
+
+    def filter_signatures(self, records: List[SignatureRecord], window: Optional[SignatureWindow] = None) -> List[str]:
+        """按签名记录中的 blockTime / err 过滤，不需要获取交易"""
+        if window is None:
+            return [record.signature for record in records]
+        return [record.signature for record in records if window.matches(record)]
+
+    def get_token_transfers(self, wallet_address: str, token_address: str,
+                            on_transfer: Optional[Callable[[Dict], None]] = None,
+                            start_time: Optional[int] = None, end_time: Optional[int] = None,
+                            skip_failed: bool = False) -> List[Dict]:
         """获取指定钱包和代币的转账记录"""
-        try:
-            # 获取交易签名
-            signatures = self._get_transaction_signatures(wallet_address)
-            if not signatures:
-                logger.info(f"未找到钱包 {wallet_address} 的交易记录")
-                return pd.DataFrame()
-            
-            transfers = []
-            
-            # 批量处理交易
-            for sig_batch in self._batch_signatures(signatures):
+        return self.get_token_transfers_multi(
+            wallet_address, [token_address], on_transfer, start_time, end_time, skip_failed
+        )[token_address]
+
+    def get_token_transfers_df(self, wallet_address: str, token_address: str):
+        """获取指定钱包和代币的转账记录，以 pandas DataFrame 返回"""
+        return to_dataframe(self.get_token_transfers(wallet_address, token_address))
+
+    def get_token_transfers_multi(self, wallet_address: str, token_addresses: List[str],
+                                  on_transfer: Optional[Callable[[Dict], None]] = None,
+                                  start_time: Optional[int] = None, end_time: Optional[int] = None,
+                                  skip_failed: bool = False) -> Dict[str, List[Dict]]:
+        """一次遍历钱包的交易历史，获取多个代币的转账记录，按代币返回
+
+        on_transfer 会在每条记录解析出来时立即被调用，可用于流式写出。
+        start_time / end_time（Unix 秒）和 skip_failed 在获取交易之前按签名记录过滤。
+        """
+        transfers: Dict[str, List[Dict]] = {token: [] for token in token_addresses}
+        for transfer in self.iter_token_transfers_multi(wallet_address, token_addresses,
+                                                        start_time, end_time, skip_failed):
+            transfers[transfer['token']].append(transfer)
+            if on_transfer:
+                on_transfer(transfer)
+        return transfers
+
+    def iter_token_transfers(self, wallet_address: str, token_address: str,
+                             start_time: Optional[int] = None, end_time: Optional[int] = None,
+                             skip_failed: bool = False) -> Iterator[Dict]:
+        """逐条产出指定钱包和代币的转账记录"""
+        return self.iter_token_transfers_multi(wallet_address, [token_address], start_time, end_time, skip_failed)
+
+    def iter_token_transfers_multi(self, wallet_address: str, token_addresses: List[str],
+                                   start_time: Optional[int] = None, end_time: Optional[int] = None,
+                                   skip_failed: bool = False) -> Iterator[Dict]:
+        """逐条产出多个代币的转账记录，交易获取与解析流水线并行
+
+        后台线程分页获取签名并按批获取交易，放入容量为 PIPELINE_QUEUE_SIZE 的队列；
+        调用方一边解析一边产出记录。队列满时后台线程等待，内存占用不随历史长度增长。
+        """
+        tokens = set(token_addresses)
+        window = SignatureWindow(start_time, end_time, skip_failed)
+        batches: queue.Queue = queue.Queue(maxsize=Config.PIPELINE_QUEUE_SIZE)
+        closed = threading.Event()
+        
+        def put(item):
+            # 队列满时等待，调用方提前结束迭代时停止后台线程
+            while True:
+                if closed.is_set():
+                    raise _PipelineClosed()
                 try:
-                    txns = self._get_parsed_transactions(sig_batch)
-                    
-                    for txn in txns:
-                        if not txn:
-                            continue
-                            
-                        transfer = self._parse_token_transfers(txn, wallet_address, token_address)
-                        if transfer:
-                            transfers.append(transfer)
-                            logger.info(f"找到转账记录: {transfer}")
-                            
-                except Exception as e:
-                    logger.error(f"处理交易批次失败: {str(e)}")
+                    batches.put(item, timeout=0.1)
+                    return
+                except queue.Full:
                     continue
-                
-            if transfers:
-                df = pd.DataFrame(transfers)
-                # 只保留有效的转账记录
-                df = df.dropna(subset=['from_address', 'to_address'], how='all')
-                return df
-                
-            return pd.DataFrame()
+                    
+        def produce():
+            scheduled = set()
             
-        except Exception as e:
-            logger.error(f"获取转账记录失败: {str(e)}")
-            return pd.DataFrame() 
\ No newline at end of file
+            def fetch(signatures: List[str]):
+                pending = [signature for signature in signatures if signature not in scheduled]
+                scheduled.update(pending)
+                for sig_batch in self.batch_signatures(pending, Config.BATCH_SIZE):
+                    try:
+                        txns = self.get_parsed_transactions(sig_batch)
+                        self.resolve_token_accounts(txns, tokens)
+                        put(txns)
+                    except _PipelineClosed:
+                        raise
+                    except Exception as e:
+                        logger.error(f"处理交易批次失败: {str(e)}")
+                        
+            try:
+                # 新取到的签名页立即开始获取交易，其余已保存的签名在分页结束后补上
+                signatures = self._get_transaction_signatures(wallet_address, on_page=fetch, window=window)
+                if not signatures:
+                    logger.info(f"未找到钱包 {wallet_address} 的交易记录")
+                fetch(signatures)
+            except _PipelineClosed:
+                return
+            except Exception as e:
+                logger.error(f"获取转账记录失败: {str(e)}")
+            try:
+                put(_PIPELINE_DONE)
+            except _PipelineClosed:
+                return
+                
+        producer = threading.Thread(target=produce, name=f"fetch-{wallet_address[:8]}", daemon=True)
+        producer.start()
+        try:
+            while True:
+                txns = batches.get()
+                if txns is _PIPELINE_DONE:
+                    break
+                    
+                found = self.extract_transfers(txns, wallet_address, tokens)
+                # 先写入转账数据库再产出，调用方中途停止迭代时已产出的记录不会丢失
+                self.save_transfers(found)
+                yield from found
+        finally:
+            closed.set()
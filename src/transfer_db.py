@@ -0,0 +1,318 @@
+import argparse
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from utils import setup_logging
+from config import Config
+
+logger = setup_logging()
+
+# 每次 upsert 的最大记录数
+UPSERT_CHUNK = 5000
+# IN (...) 查询每段最多的参数个数
+QUERY_CHUNK = 500
+
+class TransferDB:
+    """基于 SQLite 的本地转账数据库，跨运行累积所有钱包的转账记录
+
+    地址保存在 addresses 表中，转账表只保存整数编号，行和索引都比直接保存 44 字符的地址小得多。
+    每条转账以 (signature, token, from, to) 唯一标识（同一笔交易可能有多个接收方或多个代币），
+    重复扫描同一钱包时覆盖旧记录而不是重复插入。按发送方、接收方、代币和时间分别建立索引，
+    对手方、共同接收方和时间范围查询只读取索引命中的行。
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or Config.TRANSFER_DB_PATH
+        if not self.path:
+            raise ValueError("未配置 TRANSFER_DB_PATH")
+        if self.path != ':memory:' and os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        # 多进程扫描时各进程写同一个文件，写锁冲突时等待而不是立即报错
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS addresses (
+                id INTEGER PRIMARY KEY,
+                address TEXT NOT NULL UNIQUE
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS transfers (
+                id INTEGER PRIMARY KEY,
+                signature TEXT NOT NULL,
+                from_id INTEGER NOT NULL,
+                to_id INTEGER NOT NULL,
+                token_id INTEGER NOT NULL,
+                timestamp INTEGER,
+                amount REAL NOT NULL,
+                -- 原始整数金额可能超出 SQLite 的 64 位有符号整数，以文本保存
+                amount_raw TEXT,
+                decimals INTEGER,
+                UNIQUE (signature, token_id, from_id, to_id)
+            )
+            """
+        )
+        # 按地址的索引同时包含对手方和代币，对手方和共同接收方的聚合查询不需要回表
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_transfers_from ON transfers(from_id, timestamp, to_id, token_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_transfers_to ON transfers(to_id, timestamp, from_id, token_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_transfers_token ON transfers(token_id, timestamp)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_transfers_time ON transfers(timestamp)")
+        self._conn.commit()
+        # 地址 -> 编号，写入时避免逐条查询 addresses 表
+        self._ids: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM transfers").fetchone()[0]
+
+    def _address_ids(self, addresses: Iterable[str]) -> Dict[str, int]:
+        """返回地址的编号，新地址先写入 addresses 表；调用方需持有锁"""
+        missing = [address for address in set(addresses) if address not in self._ids]
+        if missing:
+            self._conn.executemany("INSERT OR IGNORE INTO addresses (address) VALUES (?)", [(a,) for a in missing])
+            for i in range(0, len(missing), QUERY_CHUNK):
+                chunk = missing[i:i + QUERY_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                for address_id, address in self._conn.execute(
+                    f"SELECT id, address FROM addresses WHERE address IN ({placeholders})", chunk
+                ):
+                    self._ids[address] = address_id
+        return self._ids
+
+    def _lookup_ids(self, addresses: Sequence[str]) -> List[int]:
+        """查询已存在地址的编号，不存在的地址忽略；调用方需持有锁"""
+        ids = []
+        for i in range(0, len(addresses), QUERY_CHUNK):
+            chunk = list(addresses[i:i + QUERY_CHUNK])
+            placeholders = ",".join("?" * len(chunk))
+            ids.extend(row[0] for row in self._conn.execute(
+                f"SELECT id FROM addresses WHERE address IN ({placeholders})", chunk
+            ))
+        return ids
+
+    def upsert_many(self, records: List[Dict]):
+        """批量写入转账记录，(signature, token, from, to) 相同的记录覆盖旧值；没有签名的记录跳过"""
+        records = [record for record in records if record.get('signature')]
+        if not records:
+            return
+        with self._lock:
+            for i in range(0, len(records), UPSERT_CHUNK):
+                chunk = records[i:i + UPSERT_CHUNK]
+                ids = self._address_ids(
+                    address for record in chunk
+                    for address in (record['from_address'], record['to_address'], record['token'])
+                )
+                self._conn.executemany(
+                    """
+                    INSERT INTO transfers (signature, from_id, to_id, token_id, timestamp, amount, amount_raw, decimals)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (signature, token_id, from_id, to_id) DO UPDATE SET
+                        timestamp = excluded.timestamp,
+                        amount = excluded.amount,
+                        amount_raw = excluded.amount_raw,
+                        decimals = excluded.decimals
+                    """,
+                    [
+                        (
+                            record['signature'], ids[record['from_address']], ids[record['to_address']],
+                            ids[record['token']], record.get('timestamp'), record['amount'],
+                            None if record.get('amount_raw') is None else str(record['amount_raw']),
+                            record.get('decimals'),
+                        )
+                        for record in chunk
+                    ]
+                )
+            self._conn.commit()
+        logger.debug(f"转账数据库写入 {len(records)} 条记录")
+
+    def _time_filter(self, start_time: Optional[int], end_time: Optional[int]) -> Tuple[str, List]:
+        clauses, params = [], []
+        if start_time is not None:
+            clauses.append("t.timestamp >= ?")
+            params.append(start_time)
+        if end_time is not None:
+            clauses.append("t.timestamp <= ?")
+            params.append(end_time)
+        return "".join(f" AND {clause}" for clause in clauses), params
+
+    def counterparties(self, address: str, direction: str = 'out', token: Optional[str] = None,
+                       start_time: Optional[int] = None, end_time: Optional[int] = None,
+                       limit: int = 100) -> List[Dict]:
+        """地址的对手方，direction 为 out（转给谁）或 in（谁转给它），按转账次数从多到少排列
+
+        返回 [{'address', 'token', 'transfers', 'amount', 'first_time', 'last_time'}]，
+        不同代币分别统计。
+        """
+        if direction not in ('out', 'in'):
+            raise ValueError(f"不支持的方向: {direction}")
+        own, other = ('from_id', 'to_id') if direction == 'out' else ('to_id', 'from_id')
+        with self._lock:
+            address_ids = self._lookup_ids([address])
+            if not address_ids:
+                return []
+            sql = f"t.{own} = ?"
+            params: List = [address_ids[0]]
+            if token is not None:
+                token_ids = self._lookup_ids([token])
+                if not token_ids:
+                    return []
+                sql += " AND t.token_id = ?"
+                params.append(token_ids[0])
+            time_sql, time_params = self._time_filter(start_time, end_time)
+            rows = self._conn.execute(
+                f"""
+                SELECT a.address, k.address, g.count, g.amount, g.first_time, g.last_time
+                FROM (
+                    SELECT t.{other} AS other_id, t.token_id, COUNT(*) AS count, SUM(t.amount) AS amount,
+                           MIN(t.timestamp) AS first_time, MAX(t.timestamp) AS last_time
+                    FROM transfers t
+                    WHERE {sql}{time_sql}
+                    GROUP BY t.{other}, t.token_id
+                    ORDER BY count DESC, amount DESC
+                    LIMIT ?
+                ) g
+                JOIN addresses a ON a.id = g.other_id
+                JOIN addresses k ON k.id = g.token_id
+                ORDER BY g.count DESC, g.amount DESC
+                """,
+                params + time_params + [limit]
+            ).fetchall()
+        return [
+            {'address': counterparty, 'token': token_address, 'transfers': count, 'amount': amount,
+             'first_time': first_time, 'last_time': last_time}
+            for counterparty, token_address, count, amount, first_time, last_time in rows
+        ]
+
+    def common_recipients(self, senders: List[str], min_senders: int = 2, token: Optional[str] = None,
+                          start_time: Optional[int] = None, end_time: Optional[int] = None,
+                          limit: int = 100) -> List[Dict]:
+        """从给定发送方中至少 min_senders 个收到过转账的地址，例如同时接收多个开发者钱包资金的地址
+
+        返回 [{'address', 'senders', 'transfers', 'first_time', 'last_time'}]，按发送方数量从多到少排列，
+        senders 为实际转给它的发送方数量。
+        """
+        with self._lock:
+            sender_ids = self._lookup_ids(list(dict.fromkeys(senders)))
+            if len(sender_ids) < min_senders:
+                return []
+            sql = f"t.from_id IN ({','.join('?' * len(sender_ids))})"
+            params: List = list(sender_ids)
+            if token is not None:
+                token_ids = self._lookup_ids([token])
+                if not token_ids:
+                    return []
+                sql += " AND t.token_id = ?"
+                params.append(token_ids[0])
+            time_sql, time_params = self._time_filter(start_time, end_time)
+            rows = self._conn.execute(
+                f"""
+                SELECT a.address, g.senders, g.count, g.first_time, g.last_time
+                FROM (
+                    SELECT t.to_id, COUNT(DISTINCT t.from_id) AS senders, COUNT(*) AS count,
+                           MIN(t.timestamp) AS first_time, MAX(t.timestamp) AS last_time
+                    FROM transfers t
+                    WHERE {sql}{time_sql}
+                    GROUP BY t.to_id
+                    HAVING senders >= ?
+                ) g
+                JOIN addresses a ON a.id = g.to_id
+                ORDER BY g.senders DESC, g.count DESC
+                LIMIT ?
+                """,
+                params + time_params + [min_senders, limit]
+            ).fetchall()
+        return [
+            {'address': recipient, 'senders': sender_count, 'transfers': count,
+             'first_time': first_time, 'last_time': last_time}
+            for recipient, sender_count, count, first_time, last_time in rows
+        ]
+
+    def transfers(self, address: Optional[str] = None, token: Optional[str] = None,
+                  start_time: Optional[int] = None, end_time: Optional[int] = None,
+                  limit: Optional[int] = 1000) -> List[Dict]:
+        """按时间顺序返回时间范围内的转账记录，可按地址（发送或接收）和代币过滤"""
+        with self._lock:
+            clauses, params = [], []
+            if address is not None:
+                address_ids = self._lookup_ids([address])
+                if not address_ids:
+                    return []
+                clauses.append("(t.from_id = ? OR t.to_id = ?)")
+                params += [address_ids[0], address_ids[0]]
+            if token is not None:
+                token_ids = self._lookup_ids([token])
+                if not token_ids:
+                    return []
+                clauses.append("t.token_id = ?")
+                params.append(token_ids[0])
+            time_sql, time_params = self._time_filter(start_time, end_time)
+            where = " AND ".join(clauses) or "1"
+            rows = self._conn.execute(
+                f"""
+                SELECT t.timestamp, f.address, r.address, k.address, t.amount, t.amount_raw, t.decimals, t.signature
+                FROM transfers t
+                JOIN addresses f ON f.id = t.from_id
+                JOIN addresses r ON r.id = t.to_id
+                JOIN addresses k ON k.id = t.token_id
+                WHERE {where}{time_sql}
+                ORDER BY t.timestamp
+                {'LIMIT ?' if limit else ''}
+                """,
+                params + time_params + ([limit] if limit else [])
+            ).fetchall()
+        return [
+            {
+                'timestamp': timestamp, 'from_address': sender, 'to_address': recipient, 'token': token_address,
+                'amount': amount, 'amount_raw': None if amount_raw is None else int(amount_raw),
+                'decimals': decimals, 'signature': signature,
+            }
+            for timestamp, sender, recipient, token_address, amount, amount_raw, decimals, signature in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询本地转账数据库")
+    parser.add_argument("--db", default=None, help="数据库路径，默认读取 TRANSFER_DB_PATH")
+    parser.add_argument("--token", default=None, help="只统计指定代币")
+    parser.add_argument("--start-time", type=int, default=None, help="起始时间（Unix 秒）")
+    parser.add_argument("--end-time", type=int, default=None, help="结束时间（Unix 秒）")
+    parser.add_argument("--limit", type=int, default=100)
+    commands = parser.add_subparsers(dest="command", required=True)
+    counterparties = commands.add_parser("counterparties", help="地址的对手方")
+    counterparties.add_argument("address")
+    counterparties.add_argument("--direction", choices=["out", "in"], default="out")
+    common = commands.add_parser("common-recipients", help="同时收到多个发送方转账的地址")
+    common.add_argument("senders", nargs="+")
+    common.add_argument("--min-senders", type=int, default=2)
+    history = commands.add_parser("transfers", help="时间范围内的转账记录")
+    history.add_argument("--address", default=None)
+    args = parser.parse_args()
+    if not args.db and not Config.TRANSFER_DB_PATH:
+        parser.error("未配置 TRANSFER_DB_PATH，请用 --db 指定数据库路径")
+
+    db = TransferDB(args.db)
+    filters = {'token': args.token, 'start_time': args.start_time, 'end_time': args.end_time, 'limit': args.limit}
+    if args.command == "counterparties":
+        rows = db.counterparties(args.address, args.direction, **filters)
+    elif args.command == "common-recipients":
+        rows = db.common_recipients(args.senders, args.min_senders, **filters)
+    else:
+        rows = db.transfers(args.address, **filters)
+    if rows:
+        print("\t".join(rows[0].keys()))
+    for row in rows:
+        print("\t".join("" if value is None else str(value) for value in row.values()))
+    db.close()
+
+if __name__ == "__main__":
+    main()
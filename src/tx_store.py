@@ -0,0 +1,378 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from utils import json_dumps, json_loads, setup_logging
+from config import Config
+
+logger = setup_logging()
+
+# 读取时记录的访问时间先累积在内存中，达到条数或间隔后再批量写入
+ACCESS_FLUSH_SIZE = 1000
+ACCESS_FLUSH_INTERVAL = 5.0
+
+class SignatureRecord(NamedTuple):
+    """getSignaturesForAddress 返回的签名元数据，只保留时间窗口过滤需要的字段"""
+    signature: str
+    slot: Optional[int]
+    block_time: Optional[int]
+    failed: bool
+
+    @classmethod
+    def from_rpc(cls, item: Dict) -> "SignatureRecord":
+        return cls(item['signature'], item.get('slot'), item.get('blockTime'), item.get('err') is not None)
+
+
+class TransactionStore:
+    """基于 SQLite 的本地交易存储
+
+    已确认的 Solana 交易不会再变化，按签名保存后可以跨运行复用。
+    交易数据以 zlib 压缩的 JSON 保存，总大小超过上限时按最近访问时间淘汰。
+    总大小由触发器维护在 store_size 表中，多个进程共用同一个文件时看到的是同一个值；
+    访问时间按批写入，读取不会每次都提交写事务。
+    """
+
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.path = path or Config.TX_STORE_PATH
+        if not self.path:
+            raise ValueError("未配置 TX_STORE_PATH")
+        if self.path != ':memory:' and os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.max_bytes = max_bytes if max_bytes is not None else Config.TX_STORE_MAX_MB * 1024 * 1024
+        self._lock = threading.Lock()
+        # 多进程扫描时各进程读写同一个文件，写锁冲突时等待而不是立即报错
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS transactions (
+                signature TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_accessed ON transactions(accessed_at)")
+        # 交易数据的总大小，写入和删除时由触发器更新，容量检查不需要扫描整张表
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS store_size (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                total_bytes INTEGER NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_transactions_insert AFTER INSERT ON transactions
+            BEGIN
+                UPDATE store_size SET total_bytes = total_bytes + NEW.size WHERE id = 0;
+            END
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_transactions_delete AFTER DELETE ON transactions
+            BEGIN
+                UPDATE store_size SET total_bytes = total_bytes - OLD.size WHERE id = 0;
+            END
+            """
+        )
+        # 旧版本创建的文件没有 store_size，按现有数据初始化
+        self._conn.execute(
+            "INSERT OR IGNORE INTO store_size (id, total_bytes) "
+            "SELECT 0, COALESCE(SUM(size), 0) FROM transactions"
+        )
+        # 每个钱包已获取的签名及分页游标，用于增量续扫
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS wallet_signatures (
+                wallet TEXT NOT NULL,
+                signature TEXT NOT NULL,
+                slot INTEGER,
+                block_time INTEGER,
+                err INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (wallet, signature)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_wallet_signatures_slot ON wallet_signatures(wallet, slot)")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS wallet_cursors (
+                wallet TEXT PRIMARY KEY,
+                newest_signature TEXT,
+                oldest_signature TEXT,
+                complete INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        # 代币账户 -> mint / owner，账户的 owner 通常不会变化，可以长期缓存
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS token_accounts (
+                account TEXT PRIMARY KEY,
+                mint TEXT NOT NULL,
+                owner TEXT NOT NULL,
+                decimals INTEGER NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+        # 签名 -> 尚未写入的访问时间
+        self._pending_access: Dict[str, float] = {}
+        self._last_access_flush = time.monotonic()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+    def __contains__(self, signature: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM transactions WHERE signature = ?", (signature,)).fetchone()
+        return row is not None
+
+    @property
+    def total_bytes(self) -> int:
+        """已保存交易数据的压缩后总大小，包括其他进程写入的部分"""
+        with self._lock:
+            return self._read_total_bytes()
+
+    def _read_total_bytes(self) -> int:
+        """从数据库读取当前总大小（调用方需持有锁）"""
+        return self._conn.execute("SELECT total_bytes FROM store_size WHERE id = 0").fetchone()[0]
+
+    def get(self, signature: str) -> Optional[Dict]:
+        """读取单笔交易，不存在时返回 None"""
+        return self.get_many([signature]).get(signature)
+
+    def get_many(self, signatures: Iterable[str]) -> Dict[str, Dict]:
+        """批量读取交易，只返回已保存的部分"""
+        signatures = list(dict.fromkeys(signatures))
+        found = {}
+        if not signatures:
+            return found
+
+        with self._lock:
+            # SQLite 单条语句的参数个数有限，分段查询
+            for i in range(0, len(signatures), 500):
+                chunk = signatures[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT signature, data FROM transactions WHERE signature IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                for signature, data in rows:
+                    found[signature] = json_loads(zlib.decompress(data))
+
+            if found:
+                now = time.time()
+                for signature in found:
+                    self._pending_access[signature] = now
+                if (len(self._pending_access) >= ACCESS_FLUSH_SIZE
+                        or time.monotonic() - self._last_access_flush >= ACCESS_FLUSH_INTERVAL):
+                    self._flush_access()
+
+        logger.debug(f"本地存储命中 {len(found)}/{len(signatures)} 笔交易")
+        return found
+
+    def _flush_access(self):
+        """把累积的访问时间写入数据库（调用方需持有锁）
+
+        访问时间只用于淘汰排序，写入失败（例如其他进程长时间持有写锁）时保留到下次再写，不影响读取。
+        """
+        self._last_access_flush = time.monotonic()
+        if not self._pending_access:
+            return
+        try:
+            self._conn.executemany(
+                "UPDATE transactions SET accessed_at = ? WHERE signature = ?",
+                [(accessed_at, signature) for signature, accessed_at in self._pending_access.items()]
+            )
+            self._conn.commit()
+            self._pending_access = {}
+        except sqlite3.OperationalError as e:
+            self._conn.rollback()
+            logger.warning(f"更新交易访问时间失败，稍后重试: {str(e)}")
+
+    def put(self, signature: str, txn: Dict):
+        """保存单笔交易"""
+        self.put_many({signature: txn})
+
+    def put_many(self, transactions: Dict[str, Dict]):
+        """批量保存交易，超过容量上限时淘汰最久未访问的记录"""
+        if not transactions:
+            return
+
+        now = time.time()
+        rows = []
+        for signature, txn in transactions.items():
+            if not txn:
+                continue
+            data = zlib.compress(json_dumps(txn))
+            rows.append((signature, data, len(data), now))
+
+        with self._lock:
+            # 交易内容不会变化，已存在的签名直接跳过
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO transactions (signature, data, size, accessed_at) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+            # 总大小从数据库读取，包含其他进程写入的交易
+            if self.max_bytes and self._read_total_bytes() > self.max_bytes:
+                # 淘汰到上限的 90%，避免之后每次写入都触发淘汰
+                self._evict(int(self.max_bytes * 0.9))
+
+    def _evict(self, target_bytes: int):
+        """按最近访问时间淘汰记录，直到总大小不超过目标值（调用方需持有锁）
+
+        先写入累积的访问时间，再在写事务中重新读取总大小，多个进程同时触发时只有第一个会真正淘汰。
+        """
+        self._flush_access()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            freed, evicted = self._evict_locked(target_bytes)
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+        if evicted:
+            logger.info(f"本地交易存储超过容量上限，已淘汰 {evicted} 笔交易（{freed} 字节）")
+
+    def _evict_locked(self, target_bytes: int) -> Tuple[int, int]:
+        """在已开始的写事务中淘汰记录，返回释放的字节数和淘汰的交易数"""
+        excess = self._read_total_bytes() - target_bytes
+        if excess <= 0:
+            return 0, 0
+
+        evicted: List[str] = []
+        freed = 0
+        for signature, size in self._conn.execute(
+            "SELECT signature, size FROM transactions ORDER BY accessed_at ASC"
+        ):
+            evicted.append(signature)
+            freed += size
+            if freed >= excess:
+                break
+
+        self._conn.executemany("DELETE FROM transactions WHERE signature = ?", [(s,) for s in evicted])
+        for signature in evicted:
+            self._pending_access.pop(signature, None)
+        return freed, len(evicted)
+
+    def get_wallet_cursor(self, wallet: str) -> Optional[Dict]:
+        """读取钱包的签名游标：最新签名（高水位）、最旧签名以及是否已扫到历史起点"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT newest_signature, oldest_signature, complete FROM wallet_cursors WHERE wallet = ?",
+                (wallet,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'newest': row[0], 'oldest': row[1], 'complete': bool(row[2])}
+
+    def save_wallet_signatures(self, wallet: str, items: List[SignatureRecord], newest: Optional[str] = None,
+                               oldest: Optional[str] = None, complete: Optional[bool] = None):
+        """保存签名记录，并更新钱包游标中传入的字段"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO wallet_signatures (wallet, signature, slot, block_time, err) VALUES (?, ?, ?, ?, ?)",
+                [(wallet, item.signature, item.slot, item.block_time, int(item.failed)) for item in items]
+            )
+            self._conn.execute(
+                "INSERT OR IGNORE INTO wallet_cursors (wallet, updated_at) VALUES (?, ?)",
+                (wallet, now)
+            )
+            self._conn.execute(
+                """
+                UPDATE wallet_cursors SET
+                    newest_signature = COALESCE(?, newest_signature),
+                    oldest_signature = COALESCE(?, oldest_signature),
+                    complete = COALESCE(?, complete),
+                    updated_at = ?
+                WHERE wallet = ?
+                """,
+                (newest, oldest, None if complete is None else int(complete), now, wallet)
+            )
+            self._conn.commit()
+
+    def get_wallet_signatures(self, wallet: str, limit: Optional[int] = None) -> List[SignatureRecord]:
+        """按从新到旧的顺序返回钱包已保存的签名记录"""
+        query = ("SELECT signature, slot, block_time, err FROM wallet_signatures "
+                 "WHERE wallet = ? ORDER BY slot DESC, rowid ASC")
+        params: List = [wallet]
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return [
+                SignatureRecord(signature, slot, block_time, bool(err))
+                for signature, slot, block_time, err in self._conn.execute(query, params)
+            ]
+
+    def count_wallet_signatures(self, wallet: str) -> int:
+        """返回钱包已保存的签名数量"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM wallet_signatures WHERE wallet = ?", (wallet,)
+            ).fetchone()[0]
+
+    def reset_wallet(self, wallet: str):
+        """清除钱包的签名记录和游标"""
+        with self._lock:
+            self._conn.execute("DELETE FROM wallet_signatures WHERE wallet = ?", (wallet,))
+            self._conn.execute("DELETE FROM wallet_cursors WHERE wallet = ?", (wallet,))
+            self._conn.commit()
+
+    def get_token_accounts(self, accounts: Iterable[str]) -> Dict[str, Tuple[str, str, int]]:
+        """批量读取代币账户的 (mint, owner, decimals)，只返回已保存的部分"""
+        accounts = list(dict.fromkeys(accounts))
+        found = {}
+        with self._lock:
+            for i in range(0, len(accounts), 500):
+                chunk = accounts[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT account, mint, owner, decimals FROM token_accounts WHERE account IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                for account, mint, owner, decimals in rows:
+                    found[account] = (mint, owner, decimals)
+        return found
+
+    def save_token_accounts(self, accounts: Dict[str, Tuple[str, str, int]]):
+        """保存代币账户的 (mint, owner, decimals)"""
+        if not accounts:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO token_accounts (account, mint, owner, decimals) VALUES (?, ?, ?, ?)",
+                [(account, mint, owner, decimals) for account, (mint, owner, decimals) in accounts.items()]
+            )
+            self._conn.commit()
+
+    def compact(self, max_bytes: Optional[int] = None):
+        """淘汰超出容量的记录并回收数据库文件空间"""
+        target = max_bytes if max_bytes is not None else self.max_bytes
+        with self._lock:
+            if target:
+                self._evict(target)
+            else:
+                self._flush_access()
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.execute("VACUUM")
+            total_bytes = self._read_total_bytes()
+        logger.info(f"本地交易存储压缩完成，当前大小 {total_bytes} 字节")
+
+    def close(self):
+        """写入累积的访问时间并关闭数据库连接"""
+        with self._lock:
+            self._flush_access()
+            self._conn.close()
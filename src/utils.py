@@ -1,6 +1,14 @@
+import json
 import logging
+from typing import Any, Union
 from config import Config
 
+# 安装了 orjson 时用它编解码 JSON，解码速度快数倍
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 def setup_logging():
     """配置日志"""
     logging.basicConfig(
@@ -20,5 +28,18 @@ def is_valid_solana_address(address: str) -> bool:
     return len(address) == 44 or len(address) == 43
 
 def filter_address(address: str) -> bool:
-    """检查地址是否需要被过滤"""
-    return address in Config.FILTER_ADDRESSES 
\ No newline at end of file
+    """检查地址是否需要被过滤（内置协议地址、FILTER_ADDRESSES 和地址标签文件）"""
+    from address_registry import get_default_registry
+    return get_default_registry().is_filtered(address)
+
+def json_loads(data: Union[str, bytes]) -> Any:
+    """解析 JSON，优先使用 orjson"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def json_dumps(obj: Any) -> bytes:
+    """紧凑编码为 UTF-8 JSON，优先使用 orjson"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
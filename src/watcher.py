@@ -0,0 +1,233 @@
+import asyncio
+import random
+import re
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Set, Tuple
+import aiohttp
+from utils import json_loads, setup_logging
+from config import Config
+from async_tracker import AsyncWalletTracker
+
+logger = setup_logging()
+
+# 记住最近处理过的签名数量，用于通知和补齐之间去重
+SEEN_SIGNATURES_LIMIT = 10000
+# WebSocket 心跳间隔（秒），节点通常会断开长时间没有数据的连接
+WS_HEARTBEAT = 30
+# 没取到的交易（confirmed 时节点可能还查不到）的重试间隔（秒）和最多重试次数
+RETRY_INTERVAL = 2
+RETRY_MAX_ATTEMPTS = 30
+
+def default_ws_url() -> str:
+    """未配置 SOLANA_WS_URL 时，把 RPC 地址的 http/https 换成 ws/wss"""
+    return Config.SOLANA_WS_URL or re.sub(r'^http', 'ws', Config.QUICKNODE_RPC_URL)
+
+
+class WalletWatcher:
+    """通过 WebSocket logsSubscribe 实时监控钱包
+
+    每个钱包一个订阅（mentions 只支持单个地址），收到日志通知后只获取这一笔交易并解析转账。
+    连接断开后按带抖动的指数退避重连，重新订阅后用 getSignaturesForAddress 的 until
+    参数从上次处理到的签名开始补齐断线期间漏掉的交易。
+    游标只在交易获取成功后推进；暂时没取到的签名放进重试队列，定时以及每次补齐后重新获取，
+    不会因为游标已经越过它而丢失。
+    """
+
+    def __init__(self, tracker: AsyncWalletTracker, ws_url: Optional[str] = None,
+                 commitment: Optional[str] = None, reconnect_max: Optional[float] = None):
+        self.tracker = tracker
+        self.ws_url = ws_url or default_ws_url()
+        self.commitment = commitment or Config.WATCH_COMMITMENT
+        self.reconnect_max = Config.WATCH_RECONNECT_MAX if reconnect_max is None else reconnect_max
+        self.tracker.commitment = self.commitment
+        # 钱包 -> 已处理到的最新签名 (slot, signature)
+        self._last_seen: Dict[str, Tuple[int, str]] = {}
+        # 钱包 -> 待重试的签名 -> 已失败次数
+        self._retry: Dict[str, Dict[str, int]] = {}
+        # 已经确定起点的钱包（包括还没有任何交易的钱包）
+        self._initialized: Set[str] = set()
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+        self._tokens: Set[str] = set()
+        self._on_transfer: Optional[Callable[[Dict], None]] = None
+
+    async def watch(self, wallets: List[str], token_addresses: List[str], on_transfer: Callable[[Dict], None]):
+        """持续监控钱包，每解析出一条转账就调用 on_transfer，直到任务被取消"""
+        self._tokens = set(token_addresses)
+        self._on_transfer = on_transfer
+        await self.tracker.open()
+        for wallet in wallets:
+            await self._init_cursor(wallet)
+        self._spawn(self._retry_loop())
+
+        attempt = 0
+        try:
+            while True:
+                try:
+                    await self._run_connection(wallets)
+                    attempt = 0
+                except (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError) as e:
+                    logger.warning(f"WebSocket 连接失败: {str(e)}")
+                delay = random.uniform(0.5, 1) * min(self.reconnect_max, 2 ** attempt)
+                attempt += 1
+                logger.info(f"{delay:.1f} 秒后重新连接 {self.ws_url}")
+                await asyncio.sleep(delay)
+        finally:
+            for task in list(self._tasks):
+                task.cancel()
+
+    async def _init_cursor(self, wallet: str) -> bool:
+        """以钱包当前最新的签名作为起点，启动前的历史不在监控范围内，返回是否成功"""
+        try:
+            page = await self.tracker.fetch_signature_page(wallet, limit=1)
+        except Exception as e:
+            logger.error(f"获取钱包 {wallet} 最新签名失败: {str(e)}")
+            return False
+        if page:
+            self._advance(wallet, page[0].slot, page[0].signature)
+        self._initialized.add(wallet)
+        return True
+
+    async def _run_connection(self, wallets: List[str]):
+        """建立一次连接并订阅所有钱包，连接关闭时返回"""
+        async with self.tracker.transport.ws_connect(self.ws_url, heartbeat=WS_HEARTBEAT) as ws:
+            logger.info(f"已连接 {self.ws_url}，订阅 {len(wallets)} 个钱包")
+            # 请求 id -> 钱包，订阅确认后换成订阅 id -> 钱包
+            pending: Dict[int, str] = {}
+            subscriptions: Dict[int, str] = {}
+            for request_id, wallet in enumerate(wallets):
+                pending[request_id] = wallet
+                await ws.send_json({
+                    "jsonrpc": "2.0",
+                    "id": request_id,
+                    "method": "logsSubscribe",
+                    "params": [{"mentions": [wallet]}, {"commitment": self.commitment}]
+                })
+
+            async for msg in ws:
+                if msg.type == aiohttp.WSMsgType.ERROR:
+                    logger.warning(f"WebSocket 错误: {ws.exception()}")
+                    break
+                if msg.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSING, aiohttp.WSMsgType.CLOSED):
+                    break
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    # 二进制等其他帧与订阅无关，忽略
+                    continue
+                message = json_loads(msg.data)
+                if message.get('method') == 'logsNotification':
+                    self._handle_notification(message['params'], subscriptions)
+                elif message.get('id') in pending:
+                    wallet = pending.pop(message['id'])
+                    if 'result' not in message:
+                        logger.error(f"订阅钱包 {wallet} 失败: {message.get('error')}")
+                        continue
+                    subscriptions[message['result']] = wallet
+                    # 订阅生效后补齐断线期间（或启动与订阅之间）漏掉的交易
+                    self._spawn(self._backfill(wallet))
+        logger.warning("WebSocket 连接已关闭")
+
+    def _handle_notification(self, params: Dict, subscriptions: Dict[int, str]):
+        wallet = subscriptions.get(params.get('subscription'))
+        result = params.get('result') or {}
+        value = result.get('value') or {}
+        signature = value.get('signature')
+        if wallet is None or not signature or value.get('err') is not None:
+            return
+        slot = (result.get('context') or {}).get('slot', 0)
+        logger.debug(f"钱包 {wallet} 新交易 {signature}（slot {slot}）")
+        self._spawn(self._process(wallet, [signature]))
+
+    async def _backfill(self, wallet: str):
+        """沿 until 获取上次处理到的签名之后的全部签名"""
+        if wallet not in self._initialized:
+            # 启动时没能确定起点，不能用 until=None 补齐（会把全部历史当作新交易），
+            # 订阅已经生效，此时再确定起点不会漏掉之后的交易
+            if await self._init_cursor(wallet):
+                logger.info(f"钱包 {wallet} 已确定监控起点")
+            else:
+                logger.warning(f"钱包 {wallet} 的监控起点仍未确定，跳过补齐，重连后重试")
+            await self._retry_pending([wallet])
+            return
+        last = self._last_seen.get(wallet)
+        try:
+            items, _ = await self.tracker.paginate_signatures(wallet, until=last[1] if last else None)
+        except Exception as e:
+            logger.error(f"补齐钱包 {wallet} 的签名失败: {str(e)}")
+            return
+        signatures = [item.signature for item in reversed(items) if not item.failed]
+        if signatures:
+            logger.info(f"钱包 {wallet} 补齐 {len(signatures)} 笔交易")
+            await self._process(wallet, signatures)
+        if items:
+            # 没取到的签名已经进入重试队列，游标可以越过它们
+            self._advance(wallet, items[0].slot, items[0].signature)
+        await self._retry_pending([wallet])
+
+    async def _retry_loop(self):
+        """定时重新获取重试队列中的交易"""
+        while True:
+            await asyncio.sleep(RETRY_INTERVAL)
+            await self._retry_pending(list(self._retry))
+
+    async def _retry_pending(self, wallets: List[str]):
+        for wallet in wallets:
+            signatures = list(self._retry.get(wallet, {}))
+            if signatures:
+                logger.debug(f"钱包 {wallet} 重试 {len(signatures)} 笔交易")
+                await self._process(wallet, signatures)
+
+    def _schedule_retry(self, wallet: str, signatures: List[str]):
+        """没取到的交易从去重集合中移除并放入重试队列，超过重试次数后放弃"""
+        pending = self._retry.setdefault(wallet, {})
+        for signature in signatures:
+            self._seen.pop(signature, None)
+            attempts = pending.get(signature, 0) + 1
+            if attempts > RETRY_MAX_ATTEMPTS:
+                del pending[signature]
+                logger.warning(f"钱包 {wallet} 的交易 {signature} 重试 {RETRY_MAX_ATTEMPTS} 次仍未获取到，放弃")
+            else:
+                pending[signature] = attempts
+        if not pending:
+            del self._retry[wallet]
+
+    def _advance(self, wallet: str, slot: int, signature: str):
+        """只向更新的 slot 推进游标，补齐和实时通知乱序完成时不会回退"""
+        last = self._last_seen.get(wallet)
+        if last is None or slot >= last[0]:
+            self._last_seen[wallet] = (slot, signature)
+
+    async def _process(self, wallet: str, signatures: List[str]):
+        """获取并解析新交易，已经处理过的签名跳过"""
+        signatures = [signature for signature in signatures if signature not in self._seen]
+        if not signatures:
+            return
+        for signature in signatures:
+            self._seen[signature] = None
+        while len(self._seen) > SEEN_SIGNATURES_LIMIT:
+            self._seen.popitem(last=False)
+
+        for sig_batch in self.tracker.core.batch_signatures(signatures, Config.BATCH_SIZE):
+            fetched: Set[str] = set()
+            try:
+                txns = await self.tracker.get_parsed_transactions(sig_batch)
+                await self.tracker.resolve_token_accounts(txns, self._tokens)
+                found = self.tracker.core.extract_transfers(txns, wallet, self._tokens)
+                await self.tracker.save_transfers(found)
+                for transfer in found:
+                    self._on_transfer(transfer)
+                for txn in txns:
+                    signature = txn['transaction']['signatures'][0]
+                    fetched.add(signature)
+                    self._advance(wallet, txn.get('slot', 0), signature)
+            except Exception as e:
+                logger.error(f"处理钱包 {wallet} 的新交易时发生错误: {str(e)}")
+            pending = self._retry.get(wallet)
+            if pending:
+                for signature in fetched:
+                    pending.pop(signature, None)
+            self._schedule_retry(wallet, [signature for signature in sig_batch if signature not in fetched])
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
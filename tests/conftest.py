@@ -0,0 +1,10 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+# 源码是 src 下的扁平模块，与直接运行 python src/main.py 时的导入方式一致
+sys.path.insert(0, SRC)
+
+# 录制的钱包交易，回放后端用它模拟 RPC 节点
+FIXTURE = os.path.join(SRC, "debug_transactions_6EDJ7Juy.json")
@@ -0,0 +1,28 @@
+from address_registry import AddressRegistry, BUILTIN_LABELS
+
+CEX = "5tzFkiKscXHK5ZXCGbXZxdw7gTjjD1mBwuoFbhUvuAi9"
+POOL = "8sLbNZoA1cfnvMJLPfp98ZLAnFSYCFApfJKMbiXNLwxj"
+CONFIGURED = "ConfiguredFilterAddress1111111111111111111"
+
+
+def test_filter_categories_only_narrow_label_files(tmp_path):
+    path = tmp_path / "labels.csv"
+    builtin = next(iter(BUILTIN_LABELS))
+    # 标签文件给内置地址换了类别，也不能让它逃过过滤
+    path.write_text(f"address,category,name\n{CEX},cex,Binance\n{POOL},dex,Pool\n{builtin},other,Renamed\n")
+    registry = AddressRegistry(label_files=[str(path)], filter_addresses=[CONFIGURED],
+                               filter_categories={"cex"}, reload_interval=0)
+
+    assert registry.is_filtered(CEX)
+    assert not registry.is_filtered(POOL)
+    assert registry.category(POOL) == "dex"
+    assert all(registry.is_filtered(address) for address in BUILTIN_LABELS)
+    assert registry.is_filtered(CONFIGURED)
+
+
+def test_without_filter_categories_all_labels_are_filtered(tmp_path):
+    path = tmp_path / "labels.csv"
+    path.write_text(f"{CEX},cex\n{POOL},dex\n")
+    registry = AddressRegistry(label_files=[str(path)], filter_addresses=[], filter_categories=set(),
+                               reload_interval=0)
+    assert registry.is_filtered(CEX) and registry.is_filtered(POOL)
@@ -0,0 +1,68 @@
+import asyncio
+import pytest
+from replay import AsyncReplayTransport, ReplayBackend, ReplaySession
+from rpc_client import Endpoint, RateLimiter, RpcClient
+from async_tracker import AsyncRpcClient
+
+CALLS = 8
+PARAMS = [["11111111111111111111111111111111"], {"encoding": "jsonParsed"}]
+
+
+class CountingSession(ReplaySession):
+    """在请求发出时计数（回放后端在模拟延迟之后才计数，被取消或仍在进行的副本统计不到）"""
+
+    sent = 0
+
+    def post(self, url, json=None, timeout=None, **kwargs):
+        self.sent += 1
+        return super().post(url, json=json, timeout=timeout, **kwargs)
+
+
+class CountingTransport(AsyncReplayTransport):
+    sent = 0
+
+    async def post(self, url, payload):
+        self.sent += 1
+        return await super().post(url, payload)
+
+
+def make_client(backend: ReplayBackend, requests_per_second: float) -> RpcClient:
+    endpoints = [
+        Endpoint(f"replay://{name}", limiter=RateLimiter(requests_per_second=requests_per_second, credits_per_second=0))
+        for name in ("a", "b")
+    ]
+    return RpcClient(endpoints=endpoints, session=CountingSession(backend), hedge_delay=0.1)
+
+
+def run_sync(backend: ReplayBackend, requests_per_second: float) -> int:
+    client = make_client(backend, requests_per_second)
+    for _ in range(CALLS):
+        client.call("getMultipleAccounts", PARAMS)
+    return client.session.sent
+
+
+def run_async(backend: ReplayBackend, requests_per_second: float) -> int:
+    transport = CountingTransport(backend)
+
+    async def run():
+        rpc = AsyncRpcClient(make_client(backend, requests_per_second), transport=transport)
+        try:
+            for _ in range(CALLS):
+                await rpc.call("getMultipleAccounts", PARAMS)
+        finally:
+            await rpc.close()
+    asyncio.run(run())
+    return transport.sent
+
+
+@pytest.mark.parametrize("run", [run_sync, run_async])
+def test_no_hedge_while_waiting_on_rate_limit(run):
+    # 两个节点各 2 次/秒，后面的请求要在限速器上排队，排队超过 hedge_delay 也不应发送副本
+    backend = ReplayBackend(paths=[], latency=0, jitter=0, error_rate=0)
+    assert run(backend, requests_per_second=2) == CALLS
+
+
+@pytest.mark.parametrize("run", [run_sync, run_async])
+def test_slow_response_is_hedged(run):
+    backend = ReplayBackend(paths=[], latency=0.3, jitter=0, error_rate=0)
+    assert run(backend, requests_per_second=0) == CALLS * 2
@@ -0,0 +1,113 @@
+import copy
+import pytest
+from conftest import FIXTURE
+from replay import ReplayBackend, to_json_encoding
+from balance_diff import account_keys, owner_deltas, token_balance_deltas
+from instructions import spl_transfers, system_transfers
+from tracker import WalletTracker
+from tx_store import TransactionStore
+from addresses import WALLET_ADDRESSES
+
+WALLET = WALLET_ADDRESSES[0]
+# 钱包在 Raydium 上用 wSOL 换 rp4X：wSOL 临时账户在交易内创建、转入 SOL、交换后关闭，
+# 两笔代币转账都在 Raydium 指令的内层指令中，发送方分别是钱包和池子
+SWAP = "7mS25FCX4JUQckcz4me4RTHtDB5SUN3iBFuwqqHoZjdiffWP6mXGo3cZuns1of55BGNiU1vY38tffiYE7FhKVzQ"
+WSOL_ACCOUNT = "5KrHKHLwhwnhdnTX43AHe4S57Jjy7MAcHPJqjDg6LCd7"
+POOL_AUTHORITY = "5Q544fKrFoe6tsEbD7S8EmxGTJYAKtTVhAW5Q5pge4j1"
+WSOL_MINT = "So11111111111111111111111111111111111111112"
+BOUGHT_MINT = "rp4XuZ4DcmPKXetKPbuy3eXcdaQXqSQSSEC4C6tpump"
+
+ENCODINGS = pytest.mark.parametrize("encode", [copy.deepcopy, to_json_encoding], ids=["jsonParsed", "json"])
+
+
+@pytest.fixture(scope="module")
+def backend():
+    return ReplayBackend(paths=[FIXTURE])
+
+
+def with_lookup_table(txn, first_loaded: int):
+    """把序号 first_loaded 之后的账户改为由地址查找表加载（模拟 v0 交易），账户序号保持不变"""
+    txn = copy.deepcopy(txn)
+    message = txn['transaction']['message']
+    keys = account_keys(txn)
+    loaded = keys[first_loaded:]
+    txn['meta']['loadedAddresses'] = {'writable': loaded[:-1], 'readonly': loaded[-1:]}
+    txn['version'] = 0
+    if isinstance(message['accountKeys'][0], dict):
+        # jsonParsed 的 accountKeys 仍包含全部账户，查找表加载的标记为 lookupTable
+        for key in message['accountKeys'][first_loaded:]:
+            key['source'] = 'lookupTable'
+    else:
+        message['accountKeys'] = keys[:first_loaded]
+    return txn
+
+
+@ENCODINGS
+def test_indices_resolve_through_loaded_addresses(backend, encode):
+    original = encode(backend.transactions[SWAP])
+    balance_indices = [b['accountIndex'] for b in original['meta']['postTokenBalances']]
+    first_loaded = min(index for index in balance_indices if index > 0)
+    txn = with_lookup_table(original, first_loaded)
+    # json 编码的 accountKeys 只有静态账户，其余账户只能通过 loadedAddresses 换算
+    converted = to_json_encoding(with_lookup_table(backend.transactions[SWAP], first_loaded))
+    static_keys = converted['transaction']['message']['accountKeys']
+    assert len(static_keys) == first_loaded
+
+    assert account_keys(txn) == account_keys(original)
+    mints = {BOUGHT_MINT, WSOL_MINT}
+    assert token_balance_deltas(txn, mints) == token_balance_deltas(original, mints)
+    assert spl_transfers(txn) == spl_transfers(original)
+    assert system_transfers(txn) == system_transfers(original)
+    assert spl_transfers(txn)
+
+
+@ENCODINGS
+def test_transfers_inside_inner_instructions(backend, encode):
+    txn = encode(backend.transactions[SWAP])
+    # 去掉内层指令后外层没有任何代币转账
+    outer_only = copy.deepcopy(txn)
+    outer_only['meta']['innerInstructions'] = []
+    assert spl_transfers(outer_only) == []
+
+    transfers = spl_transfers(txn)
+    assert [(t['mint'], t['amount']) for t in transfers] == [(WSOL_MINT, 50000000), (BOUGHT_MINT, 4232895669)]
+
+
+@ENCODINGS
+def test_multiple_senders_in_one_transaction(backend, encode):
+    txn = encode(backend.transactions[SWAP])
+    assert {t['source_owner'] for t in spl_transfers(txn)} == {WALLET, POOL_AUTHORITY}
+
+    # 余额变化按 owner 合并：池子转出、钱包收到同样数量
+    deltas = token_balance_deltas(txn, {BOUGHT_MINT})[BOUGHT_MINT]
+    assert owner_deltas(deltas) == {POOL_AUTHORITY: -4232895669, WALLET: 4232895669}
+
+    # 只记录钱包作为发送方的转账
+    tracker = WalletTracker(store=TransactionStore(":memory:"))
+    assert tracker._parse_multi_token_transfers(txn, WALLET, {BOUGHT_MINT}) == {}
+
+
+@ENCODINGS
+def test_source_owner_falls_back_to_authority(backend, encode):
+    txn = encode(backend.transactions[SWAP])
+    (wsol,) = [t for t in spl_transfers(txn) if t['mint'] == WSOL_MINT]
+    # 临时 wSOL 账户在交易内创建又关闭，没有余额记录，以签名授权的钱包作为发送方
+    assert wsol['source'] == WSOL_ACCOUNT
+    assert wsol['source_owner'] == wsol['authority'] == WALLET
+    assert wsol['destination_owner'] == POOL_AUTHORITY
+
+
+@ENCODINGS
+def test_failed_transactions_are_skipped(backend, encode):
+    tracker = WalletTracker(store=TransactionStore(":memory:"))
+    parsed = [encode(txn) for txn in backend.transactions.values()]
+    succeeded = next(txn for txn in parsed if tracker._parse_multi_token_transfers(txn, WALLET, {'SOL'}))
+
+    # 同一笔交易执行失败时，指令中的转账没有生效
+    failed = copy.deepcopy(succeeded)
+    failed['meta']['err'] = {'InstructionError': [0, 'Custom']}
+    assert tracker._parse_multi_token_transfers(failed, WALLET, {'SOL'}) == {}
+
+    recorded_failures = [txn for txn in parsed if txn['meta']['err'] is not None]
+    assert recorded_failures
+    assert all(not tracker.extract_transfers([txn], WALLET, {'SOL'}) for txn in recorded_failures)
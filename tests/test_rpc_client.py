@@ -0,0 +1,184 @@
+import multiprocessing
+import time
+from typing import Dict
+import pytest
+from config import Config
+from replay import ReplayBackend, ReplayResponse, ReplaySession
+from rpc_client import (Endpoint, RateLimiter, RetryableRpcError, RetryPlan, RpcClient, TokenBucket,
+                        backoff_delay, check_response, parse_retry_after)
+
+PARAMS = [["11111111111111111111111111111111"], {"encoding": "jsonParsed"}]
+
+
+def unlimited() -> RateLimiter:
+    return RateLimiter(requests_per_second=0, credits_per_second=0)
+
+
+class RoutingSession:
+    """按节点地址把请求交给各自的回放会话，用来让某个节点持续返回注入的 429/503"""
+
+    def __init__(self, sessions: Dict[str, ReplaySession]):
+        self.sessions = sessions
+        self.headers: Dict[str, str] = {}
+        self.proxies: Dict[str, str] = {}
+
+    def post(self, url, json=None, timeout=None, **kwargs):
+        return self.sessions[url].post(url, json=json, timeout=timeout, **kwargs)
+
+
+class ThrottledSession(ReplaySession):
+    """前 times 次请求返回带 Retry-After 的 429，之后正常应答"""
+
+    def __init__(self, backend: ReplayBackend, retry_after: str, times: int = 1):
+        super().__init__(backend)
+        self.retry_after = retry_after
+        self.times = times
+        self.sent_at = []
+
+    def post(self, url, json=None, timeout=None, **kwargs):
+        self.sent_at.append(time.monotonic())
+        if len(self.sent_at) <= self.times:
+            return ReplayResponse(429, {'Retry-After': self.retry_after}, None)
+        return super().post(url, json=json, timeout=timeout, **kwargs)
+
+
+def backend(error_rate: float = 0) -> ReplayBackend:
+    return ReplayBackend(paths=[], latency=0, jitter=0, error_rate=error_rate, seed=1)
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    # 去掉随机退避，等待时间只由 Retry-After 决定
+    monkeypatch.setattr(Config, "RPC_BACKOFF_BASE", 0)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-1") == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    http_date = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 60))
+    assert 55 <= parse_retry_after(http_date) <= 60
+
+
+def test_backoff_delay_honors_retry_after(monkeypatch):
+    monkeypatch.setattr(Config, "RPC_BACKOFF_BASE", 1)
+    monkeypatch.setattr(Config, "RPC_BACKOFF_MAX", 4)
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt) <= 4
+        # Retry-After 是下限，即使超过 RPC_BACKOFF_MAX
+        assert backoff_delay(attempt, retry_after=10) == 10
+
+    with pytest.raises(RetryableRpcError) as error:
+        check_response(429, {'Retry-After': '7'}, None)
+    assert error.value.retry_after == 7
+
+
+def test_retry_plan_waits_for_retry_after(no_backoff):
+    client = RpcClient(endpoints=[Endpoint("replay://a", limiter=unlimited())], session=ReplaySession(backend()),
+                       max_retries=2, hedge_delay=0)
+    plan = RetryPlan(client)
+    endpoint = plan.endpoint()
+    assert plan.failed(endpoint, RetryableRpcError("HTTP 429", retry_after=1.5)) == 1.5
+    assert plan.failed(endpoint, RetryableRpcError("HTTP 503")) == 0
+    with pytest.raises(RetryableRpcError):
+        plan.failed(endpoint, RetryableRpcError("HTTP 429"))
+
+
+def test_client_sleeps_for_retry_after(no_backoff):
+    session = ThrottledSession(backend(), retry_after="0.3")
+    client = RpcClient(endpoints=[Endpoint("replay://a", limiter=unlimited())], session=session, hedge_delay=0)
+    assert client.call("getMultipleAccounts", PARAMS)['result'] is not None
+    first, second = session.sent_at
+    assert second - first >= 0.3
+
+
+def test_retries_are_capped(no_backoff):
+    failing = backend(error_rate=1)
+    client = RpcClient(endpoints=[Endpoint("replay://a", limiter=unlimited())], session=ReplaySession(failing),
+                       max_retries=3, hedge_delay=0)
+    with pytest.raises(RetryableRpcError):
+        client.call("getMultipleAccounts", PARAMS)
+    # 第一次请求加上 max_retries 次重试
+    assert failing.http_requests == 4
+    assert failing.injected_errors == 4
+
+
+def test_failover_to_second_endpoint(no_backoff):
+    failing, healthy = backend(error_rate=1), backend()
+    # 出错的节点权重极高，每次调用都先选中它
+    endpoints = [Endpoint("replay://a", weight=1e6, limiter=unlimited()), Endpoint("replay://b", limiter=unlimited())]
+    session = RoutingSession({"replay://a": ReplaySession(failing), "replay://b": ReplaySession(healthy)})
+    client = RpcClient(endpoints=endpoints, session=session, max_retries=1, hedge_delay=0)
+    for _ in range(3):
+        assert client.call("getMultipleAccounts", PARAMS)['result'] is not None
+    # 每次调用都在一次重试内换到正常节点，不经过退避
+    assert failing.injected_errors == 3
+    assert healthy.http_requests == 3
+    assert endpoints[0].errors == 3
+    assert endpoints[1].errors == 0
+
+
+def test_unhealthy_endpoint_cools_down(monkeypatch, no_backoff):
+    monkeypatch.setattr(Config, "RPC_HEALTH_WINDOW", 10)
+    monkeypatch.setattr(Config, "RPC_UNHEALTHY_ERROR_RATE", 0.5)
+    monkeypatch.setattr(Config, "RPC_UNHEALTHY_COOLDOWN", 30)
+    failing, healthy = backend(error_rate=1), backend()
+    endpoints = [Endpoint(url, limiter=unlimited()) for url in ("replay://a", "replay://b")]
+    session = RoutingSession({"replay://a": ReplaySession(failing), "replay://b": ReplaySession(healthy)})
+    client = RpcClient(endpoints=endpoints, session=session, max_retries=1, hedge_delay=0)
+
+    bad = endpoints[0]
+    for _ in range(4):
+        bad.record(False)
+    # 窗口内至少 5 次结果才判断错误率
+    assert bad.is_healthy()
+    bad.record(False)
+    assert not bad.is_healthy()
+    assert bad.cooldown_until - time.monotonic() == pytest.approx(30, abs=1)
+    assert bad.is_healthy(now=bad.cooldown_until)
+
+    # 冷却期间不再向该节点发送请求
+    for _ in range(10):
+        client.call("getMultipleAccounts", PARAMS)
+    assert failing.http_requests == 0
+    assert healthy.http_requests == 10
+
+    # 冷却结束后重新参与选择
+    bad.cooldown_until = 0
+    assert any(client.select_endpoint().url == "replay://a" for _ in range(50))
+
+
+def _reserve_in_child(state, tokens):
+    TokenBucket(10, capacity=4, state=state).reserve(tokens)
+
+
+def test_shared_bucket_accounting():
+    bucket = TokenBucket(10, capacity=4)
+    state = bucket.share()
+    # 同一份共享状态上的其他桶和原来的桶扣的是同一个预算
+    other = TokenBucket(10, capacity=4, state=state)
+    assert bucket.reserve(2) == 0
+    assert other.reserve(2) == 0
+    assert bucket.available() < 1
+
+    child = multiprocessing.Process(target=_reserve_in_child, args=(state, 4))
+    child.start()
+    child.join(10)
+    assert child.exitcode == 0
+    # 子进程的预留也计入父进程的预算：只有本进程的 4 个令牌时等待约 0.1 秒，加上子进程欠下的 4 个约 0.5 秒
+    assert bucket.reserve(1) > 0.3
+
+
+def test_shared_limiter_charges_batch_calls():
+    limiter = RateLimiter(requests_per_second=10, credits_per_second=100, method_credits={"getTransaction": 10})
+    requests_state, credits_state = limiter.share()
+    other = RateLimiter(requests_per_second=10, credits_per_second=100, method_credits={"getTransaction": 10},
+                        shared_state=(requests_state, credits_state))
+    batch = [{"method": "getTransaction"}] * 5
+    assert limiter.cost(batch) == (5, 50)
+    assert limiter.reserve(batch) == 0
+    assert other.reserve(batch) == 0
+    # 两个限速器一共预留了 10 次请求和 100 积分，额度已经用完
+    assert not limiter.ready()
+    assert not other.ready()
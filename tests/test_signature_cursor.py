@@ -0,0 +1,119 @@
+import asyncio
+import pytest
+from conftest import FIXTURE
+from config import Config
+import tracker as tracker_module
+from tracker import PAGE_LIMIT, PAGE_REACHED, PAGE_WINDOW, SignaturePager, SignatureWindow, WalletTracker
+from async_tracker import AsyncWalletTracker
+from replay import AsyncReplayTransport, ReplayBackend, ReplaySession
+from rpc_client import Endpoint, RateLimiter, RpcClient
+from tx_store import SignatureRecord, TransactionStore
+from transfer_db import TransferDB
+from addresses import WALLET_ADDRESSES
+
+WALLET = WALLET_ADDRESSES[0]
+# 第一次运行时隐藏最新的这些签名，模拟之后产生的新交易
+NEW_SIGNATURES = 40
+
+
+def record(index: int, block_time: int) -> SignatureRecord:
+    return SignatureRecord(f"sig{index}", 1000 - index, block_time, False)
+
+
+def test_pager_reports_why_it_stopped():
+    pager = SignaturePager(max_count=100)
+    pager.next_page()
+    pager.add([record(i, 100 - i) for i in range(3)])
+    assert pager.status == PAGE_REACHED
+
+    pager = SignaturePager(max_count=2)
+    assert pager.next_page()['limit'] == 2
+    pager.add([record(i, 100 - i) for i in range(2)])
+    assert pager.status == PAGE_LIMIT
+
+
+def test_pager_stops_at_window_start(monkeypatch):
+    monkeypatch.setattr(tracker_module, "SIGNATURE_PAGE_LIMIT", 2)
+    pager = SignaturePager(max_count=100, window=SignatureWindow(start_time=97))
+    pager.next_page()
+    pager.add([record(0, 100), record(1, 99)])
+    assert pager.status is None
+    assert pager.next_page()['before'] == "sig1"
+    pager.add([record(2, 98), record(3, 96)])
+    assert pager.status == PAGE_WINDOW
+
+
+class SyncRunner:
+    def __init__(self, backend: ReplayBackend, store: TransactionStore):
+        endpoint = Endpoint("replay://", limiter=RateLimiter(requests_per_second=0, credits_per_second=0))
+        client = RpcClient(endpoints=[endpoint], session=ReplaySession(backend), hedge_delay=0)
+        self.tracker = WalletTracker(store=store, client=client, transfer_db=TransferDB(":memory:"))
+
+    def signatures(self, window=None):
+        return self.tracker._get_transaction_signatures(WALLET, window=window)
+
+
+class AsyncRunner:
+    def __init__(self, backend: ReplayBackend, store: TransactionStore):
+        endpoint = Endpoint("replay://", limiter=RateLimiter(requests_per_second=0, credits_per_second=0))
+        client = RpcClient(endpoints=[endpoint], session=ReplaySession(backend), hedge_delay=0)
+        self.tracker = AsyncWalletTracker(store=store, client=client, transfer_db=TransferDB(":memory:"),
+                                          transport=AsyncReplayTransport(backend))
+
+    def signatures(self, window=None):
+        async def run():
+            async with self.tracker:
+                return await self.tracker._get_transaction_signatures(WALLET, window=window)
+        return asyncio.run(run())
+
+
+@pytest.mark.parametrize("runner", [SyncRunner, AsyncRunner])
+def test_windowed_run_keeps_complete_history(runner, monkeypatch):
+    backend = ReplayBackend(paths=[FIXTURE])
+    records = backend.address_signatures[WALLET]
+    store = TransactionStore(":memory:")
+    scanner = runner(backend, store)
+
+    # 完整扫描一次较早的历史
+    backend.address_signatures[WALLET] = records[NEW_SIGNATURES:]
+    assert len(scanner.signatures()) == len(records) - NEW_SIGNATURES
+    cursor = store.get_wallet_cursor(WALLET)
+    assert cursor == {'newest': records[NEW_SIGNATURES]['signature'],
+                      'oldest': records[-1]['signature'], 'complete': True}
+
+    # 出现新交易后带时间窗口运行，小页使分页在到达高水位之前因窗口停止
+    backend.address_signatures[WALLET] = records
+    monkeypatch.setattr(tracker_module, "SIGNATURE_PAGE_LIMIT", 10)
+    start_time = records[15]['blockTime']
+    signatures = scanner.signatures(SignatureWindow(start_time=start_time))
+    assert signatures == [r['signature'] for r in records if r['blockTime'] >= start_time]
+    assert store.get_wallet_cursor(WALLET) == cursor
+    assert store.count_wallet_signatures(WALLET) == len(records) - NEW_SIGNATURES + 20
+
+    # 之后不带窗口的运行从原来的高水位补齐，不需要重新获取整个历史
+    backend.reset_stats()
+    assert len(scanner.signatures()) == len(records)
+    assert store.get_wallet_cursor(WALLET) == {'newest': records[0]['signature'],
+                                               'oldest': records[-1]['signature'], 'complete': True}
+    assert backend.calls['getSignaturesForAddress'] == NEW_SIGNATURES // 10 + 1
+
+
+def test_local_databases_are_opt_in(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Config, "TX_STORE_PATH", "")
+    monkeypatch.setattr(Config, "TRANSFER_DB_PATH", "")
+    endpoint = Endpoint("replay://", limiter=RateLimiter(requests_per_second=0, credits_per_second=0))
+    client = RpcClient(endpoints=[endpoint], session=ReplaySession(ReplayBackend(paths=[])), hedge_delay=0)
+    # 未配置路径时不启用交易存储和转账数据库，也不在当前目录下生成数据库文件
+    tracker = WalletTracker(client=client)
+    assert tracker.store is None
+    assert tracker.transfer_db is None
+    for database in (TransactionStore, TransferDB):
+        with pytest.raises(ValueError):
+            database()
+    assert list(tmp_path.iterdir()) == []
+
+    # 配置的路径所在目录不存在时自动创建
+    for database, name in ((TransactionStore, "transactions.db"), (TransferDB, "transfers.db")):
+        database(str(tmp_path / "data" / name)).close()
+        assert (tmp_path / "data" / name).exists()
@@ -0,0 +1,31 @@
+import pytest
+from conftest import FIXTURE
+from replay import ReplayBackend, to_json_encoding
+from tracker import WalletTracker
+from tx_store import TransactionStore
+from instructions import token_account_addresses
+from addresses import WALLET_ADDRESSES
+
+WALLET = WALLET_ADDRESSES[0]
+# 钱包自己的 wSOL 关联代币账户：交易内创建 -> 转入 SOL -> syncNative -> 关闭退回钱包
+WSOL_ACCOUNT = "5KrHKHLwhwnhdnTX43AHe4S57Jjy7MAcHPJqjDg6LCd7"
+
+
+@pytest.fixture(scope="module")
+def transactions():
+    return list(ReplayBackend(paths=[FIXTURE]).transactions.values())
+
+
+@pytest.mark.parametrize("encode", [lambda txn: txn, to_json_encoding], ids=["jsonParsed", "json"])
+def test_wrapping_sol_is_not_a_transfer(transactions, encode):
+    tracker = WalletTracker(store=TransactionStore(":memory:"))
+    wrapped = [txn for txn in transactions if WSOL_ACCOUNT in token_account_addresses(encode(txn))]
+    assert wrapped
+
+    recipients = [
+        transfer['to_address']
+        for txn in transactions
+        for transfer in tracker._build_sol_transfers(encode(txn), WALLET)
+    ]
+    assert recipients
+    assert WSOL_ACCOUNT not in recipients
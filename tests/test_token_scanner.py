@@ -0,0 +1,49 @@
+import pytest
+from conftest import FIXTURE
+import tracker as tracker_module
+from tracker import WalletTracker
+from token_scanner import TokenScanner
+from replay import ReplayBackend, ReplaySession
+from rpc_client import Endpoint, RateLimiter, RpcClient
+from tx_store import TransactionStore
+from transfer_db import TransferDB
+from addresses import WALLET_ADDRESSES
+
+# 录制数据中只有钱包地址有足够的签名，分页逻辑与地址类型无关
+ADDRESS = WALLET_ADDRESSES[0]
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setattr(tracker_module, "SIGNATURE_PAGE_LIMIT", 10)
+    return ReplayBackend(paths=[FIXTURE], latency=0, jitter=0, error_rate=0)
+
+
+def make_scanner(backend: ReplayBackend, max_signatures: int) -> TokenScanner:
+    endpoint = Endpoint("replay://", limiter=RateLimiter(requests_per_second=0, credits_per_second=0))
+    client = RpcClient(endpoints=[endpoint], session=ReplaySession(backend), hedge_delay=0)
+    tracker = WalletTracker(store=TransactionStore(":memory:"), client=client, transfer_db=TransferDB(":memory:"))
+    return TokenScanner(tracker, max_signatures=max_signatures, max_transactions=5, first_buyers=0, max_workers=2)
+
+
+def oldest_successful(records):
+    return [record for record in records if record.get('err') is None][-1]
+
+
+def test_scan_starts_from_the_first_transaction(backend):
+    records = backend.address_signatures[ADDRESS]
+    result = make_scanner(backend, max_signatures=1000).scan(ADDRESS)
+    assert not result.truncated
+    assert result.signatures == len(records)
+    assert result.scanned == 5
+    assert result.first_slot == oldest_successful(records)['slot']
+
+
+def test_scan_reports_truncated_history(backend):
+    records = backend.address_signatures[ADDRESS]
+    result = make_scanner(backend, max_signatures=30).scan(ADDRESS)
+    assert result.truncated
+    assert result.signatures == 30
+    assert result.scanned == 5
+    # 从已获取的签名中最早的成功交易开始
+    assert result.first_slot == oldest_successful(records[:30])['slot']
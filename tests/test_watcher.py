@@ -0,0 +1,244 @@
+import asyncio
+from collections import Counter
+from typing import Dict, List
+from aiohttp import WSMsgType, web
+from conftest import FIXTURE
+import watcher as watcher_module
+from watcher import WalletWatcher
+from async_tracker import AiohttpTransport, AsyncWalletTracker
+from replay import AsyncReplayTransport, ReplayBackend, ReplaySession
+from rpc_client import Endpoint, RateLimiter, RpcClient
+from tx_store import TransactionStore
+from transfer_db import TransferDB
+from addresses import WALLET_ADDRESSES
+
+WALLET = WALLET_ADDRESSES[0]
+# 按从新到旧的顺序，这些位置的签名有 SOL 转账；前 HIDDEN 条在监控启动时还不存在
+NOTIFIED, MISSED = 4, 1
+HIDDEN = 5
+
+
+class MockNode:
+    """本地模拟的 Solana 节点：HTTP JSON-RPC 由回放数据应答，WebSocket 支持 logsSubscribe
+
+    hold 让某笔交易在前几次 getTransaction 中返回 null（confirmed 时节点尚未同步），
+    fail 让某个方法的前几次调用返回 JSON-RPC 错误，drop 断开当前所有 WebSocket 连接。
+    """
+
+    def __init__(self, backend: ReplayBackend):
+        self.backend = backend
+        self.held: Counter = Counter()
+        self.failing: Counter = Counter()
+        self.connections = 0
+        # 地址 -> 订阅 id
+        self.subscriptions: Dict[str, int] = {}
+        self.subscribed = asyncio.Event()
+        self._sockets: List[web.WebSocketResponse] = []
+        self._runner = None
+        self.port = 0
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/', self._rpc)
+        app.router.add_get('/ws', self._ws)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    def hold(self, signature: str, times: int = 1):
+        self.held[signature] += times
+
+    def fail(self, method: str, times: int = 1):
+        self.failing[method] += times
+
+    async def send_bytes(self, data: bytes):
+        for ws in self._sockets:
+            await ws.send_bytes(data)
+
+    async def drop(self):
+        self.subscribed.clear()
+        for ws in list(self._sockets):
+            await ws.close()
+
+    async def notify(self, address: str, signature: str, slot: int):
+        subscription = self.subscriptions[address]
+        for ws in self._sockets:
+            await ws.send_json({
+                "jsonrpc": "2.0",
+                "method": "logsNotification",
+                "params": {
+                    "subscription": subscription,
+                    "result": {"context": {"slot": slot}, "value": {"signature": signature, "err": None, "logs": []}},
+                },
+            })
+
+    def _call(self, call: Dict) -> Dict:
+        if self.failing[call.get('method')] > 0:
+            self.failing[call['method']] -= 1
+            return {"jsonrpc": "2.0", "id": call.get('id'), "error": {"code": -32000, "message": "node is behind"}}
+        if call.get('method') == 'getTransaction' and self.held[call['params'][0]] > 0:
+            self.held[call['params'][0]] -= 1
+            return {"jsonrpc": "2.0", "id": call.get('id'), "result": None}
+        return self.backend.handle(call)[2]
+
+    async def _rpc(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        if isinstance(payload, list):
+            return web.json_response([self._call(call) for call in payload])
+        return web.json_response(self._call(payload))
+
+    async def _ws(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.connections += 1
+        self._sockets.append(ws)
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    break
+                message = msg.json()
+                if message.get('method') == 'logsSubscribe':
+                    address = message['params'][0]['mentions'][0]
+                    self.subscriptions[address] = len(self.subscriptions) + 100
+                    await ws.send_json({"jsonrpc": "2.0", "id": message['id'],
+                                        "result": self.subscriptions[address]})
+                    self.subscribed.set()
+        finally:
+            self._sockets.remove(ws)
+        return ws
+
+
+async def wait_for(condition, timeout: float = 5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "等待超时"
+        await asyncio.sleep(0.01)
+
+
+def make_watcher(node: MockNode, store: TransactionStore) -> WalletWatcher:
+    endpoint = Endpoint(f"http://127.0.0.1:{node.port}/",
+                        limiter=RateLimiter(requests_per_second=0, credits_per_second=0))
+    tracker = AsyncWalletTracker(store=store, transfer_db=TransferDB(":memory:"),
+                                 client=RpcClient(endpoints=[endpoint], hedge_delay=0),
+                                 transport=AiohttpTransport(proxies={}))
+    return WalletWatcher(tracker, ws_url=f"ws://127.0.0.1:{node.port}/ws",
+                         commitment="confirmed", reconnect_max=0.05)
+
+
+def test_watcher_reconnects_backfills_and_retries(monkeypatch):
+    monkeypatch.setattr(watcher_module, "RETRY_INTERVAL", 0.05)
+    backend = ReplayBackend(paths=[FIXTURE], latency=0, jitter=0, error_rate=0)
+    records = backend.address_signatures[WALLET]
+    backend.address_signatures[WALLET] = records[HIDDEN:]
+
+    def reveal(index: int):
+        backend.address_signatures[WALLET] = records[index:]
+
+    async def run():
+        node = MockNode(backend)
+        await node.start()
+        store = TransactionStore(":memory:")
+        watcher = make_watcher(node, store)
+        tracker = watcher.tracker
+        transfers: List[Dict] = []
+        task = asyncio.ensure_future(watcher.watch([WALLET], ['SOL'], transfers.append))
+        try:
+            await asyncio.wait_for(node.subscribed.wait(), 5)
+            assert watcher._last_seen[WALLET][1] == records[HIDDEN]['signature']
+
+            # 实时通知的交易在批量请求和单独重试中节点都还查不到，游标不能越过它，由重试队列补上
+            notified = records[NOTIFIED]
+            reveal(NOTIFIED)
+            node.hold(notified['signature'], times=2)
+            await node.notify(WALLET, notified['signature'], notified['slot'])
+            await wait_for(lambda: any(t['signature'] == notified['signature'] for t in transfers))
+            assert node.held[notified['signature']] == 0
+            assert not watcher._retry
+
+            # 断线期间产生的交易在重连后通过 until 补齐
+            missed = records[MISSED]
+            await node.drop()
+            reveal(0)
+            await wait_for(lambda: node.connections >= 2 and node.subscribed.is_set())
+            await wait_for(lambda: any(t['signature'] == missed['signature'] for t in transfers))
+            await wait_for(lambda: watcher._last_seen[WALLET][1] == records[0]['signature'])
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await tracker.close()
+            await node.stop()
+
+        signatures = [t['signature'] for t in transfers]
+        assert sorted(signatures) == sorted({notified['signature'], missed['signature']})
+        # confirmed 的交易不写入假定已最终确认的本地存储
+        assert len(store) == 0
+
+    asyncio.run(run())
+
+
+def test_watcher_without_cursor_does_not_replay_history():
+    backend = ReplayBackend(paths=[FIXTURE], latency=0, jitter=0, error_rate=0)
+    records = backend.address_signatures[WALLET]
+
+    async def run():
+        node = MockNode(backend)
+        await node.start()
+        watcher = make_watcher(node, TransactionStore(":memory:"))
+        # 启动时获取起点失败，订阅生效后再确定起点，而不是用 until=None 把全部历史当作新交易补齐
+        node.fail("getSignaturesForAddress")
+        transfers: List[Dict] = []
+        task = asyncio.ensure_future(watcher.watch([WALLET], ['SOL'], transfers.append))
+        try:
+            await asyncio.wait_for(node.subscribed.wait(), 5)
+            await wait_for(lambda: WALLET in watcher._initialized)
+            assert watcher._last_seen[WALLET][1] == records[0]['signature']
+
+            # 二进制帧被忽略，不会断开连接
+            await node.send_bytes(b"\x00")
+            transfer = records[NOTIFIED]
+            await node.notify(WALLET, transfer['signature'], transfer['slot'])
+            await wait_for(lambda: transfers)
+            assert node.connections == 1
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await watcher.tracker.close()
+            await node.stop()
+
+        assert [t['signature'] for t in transfers] == [records[NOTIFIED]['signature']]
+
+    asyncio.run(run())
+
+
+def test_watcher_runs_on_replay():
+    # 回放的订阅流按时间顺序推送录制的全部签名，输出应与一次性解析全部历史相同
+    backend = ReplayBackend(paths=[FIXTURE], latency=0, jitter=0, error_rate=0)
+    endpoint = Endpoint("replay://", limiter=RateLimiter(requests_per_second=0, credits_per_second=0))
+    client = RpcClient(endpoints=[endpoint], session=ReplaySession(backend), hedge_delay=0)
+    tracker = AsyncWalletTracker(store=TransactionStore(":memory:"), transfer_db=TransferDB(":memory:"),
+                                 client=client, transport=AsyncReplayTransport(backend))
+    expected = sorted(
+        transfer['signature']
+        for record in backend.address_signatures[WALLET] if record.get('err') is None
+        for transfer in tracker.core.extract_transfers([backend.transactions[record['signature']]], WALLET, {'SOL'})
+    )
+    assert expected
+
+    async def run():
+        transfers: List[Dict] = []
+        watcher = WalletWatcher(tracker, ws_url="replay://", commitment="confirmed")
+        task = asyncio.ensure_future(watcher.watch([WALLET], ['SOL'], transfers.append))
+        try:
+            await wait_for(lambda: len(transfers) >= len(expected))
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await tracker.close()
+        return transfers
+
+    assert sorted(t['signature'] for t in asyncio.run(run())) == expected